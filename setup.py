@@ -13,15 +13,16 @@ setup(
     long_description_content_type="text/markdown",
     author="Gianmarco Marcello",
     author_email='g.marcello@antima.it',
-    python_requires=">=3.6",
-    install_requires=["pybluez"],
+    python_requires=">=3.7",
+    extras_require={"bluetooth": ["pybluez"], "numpy": ["numpy"]},
     license="GPLv2.0",
     data_files=[("", ["LICENSE"])],
     packages=find_packages(),
     entry_points={
         "console_scripts": [
             "shimmer-printer=shimmer_listener.console_scripts:printer_app",
-            "shimmer-btslave=shimmer_listener.console_scripts:btmastertest_app"
+            "shimmer-btslave=shimmer_listener.console_scripts:btmastertest_app",
+            "shimmer-bench=shimmer_listener.console_scripts:bench_app"
         ]
     }
 )
@@ -44,6 +44,11 @@ A series of callbacks can be used and set as properties to intercept certain eve
     Called when a message is received from a mote identified by **mac**. The message is
     returned as a dict with the keys previously obtained from the *presentation protocol*.
 
+- **on_batch(mac: str, batch: List[Dict[str, Any]]) -> None**
+
+    Called with a list of messages received from a mote identified by **mac**. By default every batch
+    contains all of the messages of a single frame, see **bt_listen** to group them by count or time.
+
 - **on_disconnect(mac: str, lost: bool) -> None**
 
     Called when a mote identified by **mac** disconnects. If **lost** is true, the disconnect
@@ -51,16 +56,59 @@ A series of callbacks can be used and set as properties to intercept certain eve
 
 """
 
-from ._streams import BtStream, BtSlaveInputStream, BtMasterInputStream, Frameinfo
-from ._slave import _slave_init, _slave_listen, _slave_close
-from ._master import _master_listen, _master_close
-
-from typing import Optional, Callable, Any, Dict, List, Union
+from ._streams import BtStream, BtSlaveInputStream, BtMasterInputStream, Frameinfo, MessageFormat, _deadline, \
+    _remaining
+from ._decoding import record_type
+from ._dispatch import Dispatcher, OverflowPolicy, EventKind
+from ._slave import _def_backlog, _slave_init, _slave_listen, _slave_close, _slave_supervisor
+from ._master import _master_init, _master_listen, _master_close, _master_supervisor
+from ._reactor import Reactor
+from ._registry import DeviceRegistry
+from ._supervisor import Supervisor
+from ._metrics import Metrics, StreamMetrics, Histogram, MetricsExporter, prometheus_text
+from ._recording import Recorder, Replayer, RecordKind, LogRecord, read_log
+from ._tracing import Tracer, LatencyTracer, monotonic_ns
+from ._framing import MasterFrameCheck, check_master_frame, master_frame, crc16
+from ._storage import ColumnStore, ColumnFile
+from ._aggregate import Aggregator, WindowResult, KeyStats
+from ._shm import SharedRing, SharedRings, SharedRingReader, ring_name
+from ._transport import Transport, TransportError, SocketTransport, RfcommTransport, TcpTransport, UnixTransport, \
+    PipeTransport
+
+from typing import Optional, Callable, Any, Dict, List, TYPE_CHECKING
+import importlib
+import logging
 import enum
 
+if TYPE_CHECKING:
+    from ._process import ProcessPool
+
 
 __all__ = ["bt_init", "bt_listen", "bt_close", "Frameinfo", "BtMode", "BtStream",
-           "BtMasterInputStream", "BtSlaveInputStream"]
+           "BtMasterInputStream", "BtSlaveInputStream", "MessageFormat", "record_type", "Dispatcher",
+           "OverflowPolicy", "ProcessPool", "dispatch_stats", "AsyncBtStream", "AsyncBtListener",
+           "Reactor", "DeviceRegistry", "Supervisor", "reconnect_stats",
+           "Transport", "TransportError", "SocketTransport", "RfcommTransport", "TcpTransport", "UnixTransport",
+           "PipeTransport", "Recorder", "Replayer", "RecordKind", "LogRecord", "read_log",
+           "Metrics", "StreamMetrics", "Histogram", "MetricsExporter", "prometheus_text", "stats",
+           "Tracer", "LatencyTracer", "monotonic_ns", "MasterFrameCheck", "check_master_frame", "master_frame", "crc16",
+           "Forwarder", "Encoding", "decode_binary", "ColumnStore", "ColumnFile",
+           "Aggregator", "WindowResult", "KeyStats", "SharedRing", "SharedRings", "SharedRingReader", "ring_name"]
+
+
+# Exported names whose modules are only imported when first used, since they import asyncio,
+# multiprocessing or the networking modules, which most processes never need
+_lazy = {"ProcessPool": "._process", "AsyncBtStream": "._aio", "AsyncBtListener": "._aio",
+         "Forwarder": "._forward", "Encoding": "._forward", "decode_binary": "._forward"}
+
+
+def __getattr__(name: str) -> Any:
+    module = _lazy.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
 
 
 class BtMode(enum.Enum):
@@ -81,20 +129,32 @@ class BtMode(enum.Enum):
 
 listen: List[Callable] = [_master_listen, _slave_listen]
 close: List[Callable] = [_master_close, _slave_close]
+supervisor: List[Callable] = [_master_supervisor, _slave_supervisor]
 _op_mode: Optional[BtMode] = None
 _running: bool = False
+_dispatcher: Optional[Dispatcher] = None
+_reactor: Optional[Reactor] = None
+_recorder: Optional[Recorder] = None
+_metrics: Optional[Metrics] = None
+_exporter: Optional[MetricsExporter] = None
+_rings: Optional[SharedRings] = None
+_pool: Optional["ProcessPool"] = None
 
 
-def bt_init(mode: BtMode) -> None:
+def bt_init(mode: BtMode, backlog: Optional[int] = None) -> None:
     """
     Initializes the bluetooth server socket interface.
     Call this at the beginning of your program.
+
+    In slave mode, **backlog** is the number of mote connections that can wait to be accepted, defaults to 8.
     """
     global _op_mode, _running
     if _running:
         raise ValueError("Trying to initialize an already started interface")
     if mode == BtMode.SLAVE:
-        _slave_init()
+        _slave_init(backlog if backlog is not None else _def_backlog)
+    else:
+        _master_init()
     _op_mode = mode
     _running = True
 
@@ -102,7 +162,8 @@ def bt_init(mode: BtMode) -> None:
 def bt_listen(connect_handle: Optional[Callable[[str, Frameinfo], None]] = None,
               message_handle: Optional[Callable[[str, Dict[str, Any]], None]] = None,
               disconnect_handle: Optional[Callable[[str, bool], None]] = None,
-              **kwargs: Union[str, float]) -> None:
+              batch_handle: Optional[Callable[[str, List[Dict[str, Any]]], None]] = None,
+              **kwargs: Any) -> None:
     """
     Starts the listen loop, attaching the passed handlers as event callbacks to each
     stream that is started. Various options can be passed as keyword arguments
@@ -114,21 +175,197 @@ def bt_listen(connect_handle: Optional[Callable[[str, Frameinfo], None]] = None,
     - **lookup_duration**: defaults to 5 seconds
 
     - **scan_interval**: default to 5 seconds
+
+    - **registry**: a DeviceRegistry, or the path of the JSON file where it is persisted, storing the known
+        shimmer devices, which are connected without waiting for the scan; defaults to an in-memory registry
+
+    If the application is in slave mode, the accepted motes are served by a pool of threads, so that a busy
+    stream never delays the accept of the others:
+
+    - **max_connections**: maximum number of motes connected at the same time, the connections beyond it are
+        refused; defaults to 64
+
+    - **presentation**: if True, the motes describe their frames through the presentation protocol, as in
+        master mode, instead of sending the fixed frames of the BluetoothMasterTest app; defaults to False
+
+    Messages can also be received in batches through **batch_handle**, grouping them with:
+
+    - **batch_size**: maximum number of messages per batch, defaults to every message of a single frame
+
+    - **batch_latency**: maximum time in seconds that a message can wait in a partial batch, defaults to None
+
+    The format of the messages passed to the handlers can be chosen with:
+
+    - **message_format**: a MessageFormat value, defaults to MessageFormat.DICT; MessageFormat.RECORD
+        delivers compact named tuples instead of dicts, MessageFormat.COLUMNS delivers numpy arrays,
+        one per key, and requires numpy to be installed
+
+    The samples decoded from each mote can be reduced, before any message is built, with:
+
+    - **decimation**: decode only one chunk every N, defaults to 1
+
+    - **deadband**: a dict of thresholds, delivering a chunk only if any of these keys changed by at least its
+        threshold since the last chunk delivered, defaults to None
+
+    - **projection**: the keys of the Frameinfo to decode, skipping the others, defaults to None (every key)
+
+    Frames are checked before being decoded, dropping the invalid ones and looking for the next valid frame:
+
+    - **frame_check**: a function returning True if the frame it is passed is valid, or None to disable the check;
+        defaults to None. In slave mode, pass check_master_frame to check the boundaries and the CRC of the frames
+        of the BluetoothMasterTest app (see MasterFrameCheck for the frame layout that it assumes)
+
+    Passing **workers**, the handlers run on a pool of worker threads instead of the threads receiving
+    the data, through a bounded queue for each mote that preserves the order of its events:
+
+    - **workers**: number of worker threads, defaults to None (handlers run in the receiving threads)
+
+    - **queue_size**: maximum number of messages queued for each mote, defaults to 1024
+
+    - **overflow**: the OverflowPolicy applied when a queue is full, defaults to OverflowPolicy.BLOCK
+
+    Passing **processes**, the number of worker processes, the handlers run in a ProcessPool instead, so that
+    they don't compete for the GIL with the receive loops; each mote is served by the same process, in order,
+    and its messages are sent in batches. The handlers must be picklable, e.g. module level functions;
+    **queue_size** and **overflow** apply to the queue of each process, OverflowPolicy.COALESCE excluded.
+
+    Passing **reactor=True**, every stream is served by a single thread multiplexing all of the mote
+    sockets, instead of having a thread blocking on each one of them.
+
+    Passing **reconnect=True**, or a dict of Supervisor options, the streams that stop receiving data
+    are recycled and, in master mode, the lost motes are reconnected as soon as possible, retrying with
+    an exponential backoff (see Supervisor).
+
+    Passing **record**, the path of a log file, every byte received from the motes is appended to it,
+    so that the session can be reproduced later through a Replayer.
+
+    Passing **metrics=True**, the received bytes, the decoded frames, the decode errors and the time spent in the
+    handlers are counted for each mote and returned by **stats**; they are also served in the Prometheus text
+    format at http://127.0.0.1:**metrics_port**/metrics if **metrics_port** is passed.
+
+    Passing **timestamps=True**, every message carries a "timestamp": the monotonic_ns() time at which it was
+    received, interpolated for the samples that arrive together. Passing a **tracer**, e.g. a LatencyTracer,
+    it is notified when the data of each mote is received, decoded, dispatched to the handlers and when these return.
+
+    Passing **shared_memory=True**, or a dict of SharedRings options, the frames received from each mote are
+    published, together with their Frameinfo, to a shared memory ring named after its mac (see ring_name), which
+    other processes can read through a SharedRingReader. Requires Python 3.8 or later.
     """
-    global _op_mode
+    global _op_mode, _dispatcher, _reactor, _recorder, _metrics, _exporter, _rings, _pool
     if _op_mode is None or not _running:
         raise ValueError("Listen operation on non initialized interface")
-    listen[_op_mode.index](connect_handle, message_handle, disconnect_handle, **kwargs)
-
-
-def bt_close() -> None:
+    workers = kwargs.pop("workers", None)
+    queue_size = kwargs.pop("queue_size", 1024)
+    overflow = kwargs.pop("overflow", OverflowPolicy.BLOCK)
+    processes = kwargs.pop("processes", None)
+    if processes is not None:
+        if _pool is None:
+            from ._process import ProcessPool
+            _pool = ProcessPool(processes, queue_size, overflow)
+        connect_handle = _pool.remote(connect_handle, EventKind.EVENT)
+        message_handle = _pool.remote(message_handle, EventKind.MESSAGE)
+        disconnect_handle = _pool.remote(disconnect_handle, EventKind.EVENT)
+        batch_handle = _pool.remote(batch_handle, EventKind.BATCH)
+    if workers is not None and _dispatcher is None:
+        _dispatcher = Dispatcher(workers, queue_size, overflow)
+    if kwargs.pop("reactor", False) and _reactor is None:
+        _reactor = Reactor()
+    record = kwargs.pop("record", None)
+    if record is not None and _recorder is None:
+        _recorder = Recorder(record)
+    metrics_port = kwargs.pop("metrics_port", None)
+    if (kwargs.pop("metrics", False) or metrics_port is not None) and _metrics is None:
+        _metrics = Metrics()
+        _metrics.add_source(dispatch_stats)
+        _metrics.add_source(reconnect_stats)
+    if metrics_port is not None and _exporter is None:
+        _exporter = MetricsExporter(_metrics, metrics_port)
+    rings = kwargs.pop("shared_memory", None)
+    if rings and _rings is None:
+        _rings = SharedRings(**rings) if isinstance(rings, dict) else SharedRings()
+    listen[_op_mode.index](connect_handle, message_handle, disconnect_handle, batch_handle,
+                           dispatcher=_dispatcher, reactor=_reactor, recorder=_recorder, metrics=_metrics,
+                           rings=_rings, **kwargs)
+
+
+def bt_close(timeout: Optional[float] = None) -> List[str]:
     """
-    Gracefully stops any open connection.
+    Gracefully stops any open connection, without waiting for the silent motes to send more data.
+
+    Waits up to **timeout** seconds overall (forever if None) for the threads serving the motes to exit, and returns
+    the ones that are still running: the mac of each stream, or the name of the component (reactor, dispatcher,
+    process pool), an empty list if every thread exited in time.
     """
-    global _op_mode, _running
+    global _op_mode, _running, _dispatcher, _reactor, _recorder, _metrics, _exporter, _rings, _pool
     if _op_mode is None:
         raise ValueError("Trying to close a non initialized interface")
-    close[_op_mode.index]()
+    deadline = _deadline(timeout)
+    alive = close[_op_mode.index](timeout)
+    if _reactor is not None:
+        if not _reactor.close(_remaining(deadline)):
+            alive.append("reactor")
+        _reactor = None
+    if _dispatcher is not None:
+        if not _dispatcher.close(_remaining(deadline)):
+            alive.append("dispatcher")
+        _dispatcher = None
+    if _pool is not None:
+        if not _pool.close(_remaining(deadline)):
+            alive.append("process pool")
+        _pool = None
+    if _recorder is not None:
+        _recorder.close()
+        _recorder = None
+    if _exporter is not None:
+        _exporter.close()
+        _exporter = None
+    _metrics = None
+    if _rings is not None:
+        _rings.close()
+        _rings = None
 
     _op_mode = None
     _running = False
+    if alive:
+        logging.warning(f"threads still running after bt_close: {', '.join(alive)}")
+    return alive
+
+
+def dispatch_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Returns the queue statistics of each mote (current and maximum depth, delivered, dropped and coalesced
+    messages) when the handlers run on a pool of worker threads or processes, an empty dict otherwise.
+    """
+    if _dispatcher is not None:
+        return _dispatcher.stats()
+    if _pool is not None:
+        return _pool.stats()
+    return {}
+
+
+def reconnect_stats() -> Dict[str, Dict[str, float]]:
+    """
+    Returns the reconnection statistics of each mote (reconnections, failed attempts, recycled stalls, current
+    backoff attempt and the last, maximum and total gap in seconds) when **reconnect** is enabled, an empty
+    dict otherwise.
+    """
+    if _op_mode is None:
+        return {}
+    stream_supervisor = supervisor[_op_mode.index]()
+    if stream_supervisor is None:
+        return {}
+    return stream_supervisor.stats()
+
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Returns the statistics of each mote: the metrics counted when **metrics** is enabled (see BtStream.stats),
+    merged with the dispatch_stats and the reconnect_stats.
+    """
+    if _metrics is not None:
+        return _metrics.stats()
+    result: Dict[str, Dict[str, Any]] = {}
+    for source in (dispatch_stats, reconnect_stats):
+        for mac, mote_stats in source().items():
+            result.setdefault(mac, {}).update(mote_stats)
+    return result
@@ -0,0 +1,319 @@
+"""
+Windowed aggregation of the received samples.
+
+An Aggregator summarizes the samples of each mote over windows of a number of samples or of a duration,
+calling its handler with the count, mean, variance, RMS, minimum and maximum of every key once per window,
+instead of once per sample. Tumbling windows keep running sums, so each sample costs O(1), and blocks of numpy
+columns (MessageFormat.COLUMNS) are reduced with a few numpy calls per window. Sliding windows (**slide**
+smaller than the window) additionally keep the samples of the window, to remove them as they expire, and
+monotonic queues of the candidate minima and maxima, so that each sample still costs amortized O(1).
+
+Samples are placed in time by their "timestamp" (see the **timestamps** option of bt_listen), or by the
+time they reach the Aggregator if they don't have one.
+"""
+
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple, TYPE_CHECKING
+from collections import namedtuple, deque
+from threading import Lock
+import numbers
+import math
+
+from ._decoding import Frameinfo, _numpy
+from ._tracing import monotonic_ns
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+KeyStats = namedtuple("KeyStats", ["mean", "var", "rms", "min", "max"])
+"""
+Statistics of a key over a window: mean, population variance, root mean square, minimum and maximum.
+"""
+
+WindowResult = namedtuple("WindowResult", ["start", "end", "count", "stats"])
+"""
+Result of a window: monotonic_ns() timestamps of its first and last sample, number of samples and
+the KeyStats of each key.
+"""
+
+
+class _Sums:
+    # Running sums of the values of each key
+
+    def __init__(self, keys: int):
+        self.count = 0
+        self.sums = [0.0] * keys
+        self.squares = [0.0] * keys
+        self.mins = [math.inf] * keys
+        self.maxs = [-math.inf] * keys
+
+    def stats(self, keys: Sequence[str], mins: Sequence[float], maxs: Sequence[float]) -> Dict[str, KeyStats]:
+        count = self.count
+        result = {}
+        for idx, key in enumerate(keys):
+            mean = self.sums[idx] / count
+            mean_square = self.squares[idx] / count
+            result[key] = KeyStats(mean, max(0.0, mean_square - mean * mean), math.sqrt(mean_square),
+                                   mins[idx], maxs[idx])
+        return result
+
+
+class _Tumbling:
+    # Consecutive, non overlapping windows
+
+    def __init__(self, keys: List[str], size: Optional[int], duration: Optional[int]):
+        self.keys = keys
+        self.size = size
+        self.duration = duration
+        self.end: Optional[int] = None
+        self._reset()
+
+    def _reset(self) -> None:
+        self.sums = _Sums(len(self.keys))
+        self.first: Optional[int] = None
+        self.last: Optional[int] = None
+
+    def _emit(self, results: List[WindowResult]) -> None:
+        sums = self.sums
+        if sums.count:
+            results.append(WindowResult(self.first, self.last, sums.count,
+                                        sums.stats(self.keys, sums.mins, sums.maxs)))
+        self._reset()
+
+    def _advance(self, timestamp: int, results: List[WindowResult]) -> None:
+        # Closes the time window if the sample at timestamp falls after it
+        if self.end is None:
+            self.end = timestamp + self.duration
+        elif timestamp >= self.end:
+            self._emit(results)
+            self.end += (timestamp - self.end) // self.duration * self.duration + self.duration
+
+    def add(self, timestamp: int, values: Sequence[float], results: List[WindowResult]) -> None:
+        if self.duration is not None:
+            self._advance(timestamp, results)
+        sums = self.sums
+        for idx, value in enumerate(values):
+            sums.sums[idx] += value
+            sums.squares[idx] += value * value
+            if value < sums.mins[idx]:
+                sums.mins[idx] = value
+            if value > sums.maxs[idx]:
+                sums.maxs[idx] = value
+        sums.count += 1
+        if self.first is None:
+            self.first = timestamp
+        self.last = timestamp
+        if self.size is not None and sums.count == self.size:
+            self._emit(results)
+
+    def add_columns(self, timestamps: "np.ndarray", columns: List["np.ndarray"], results: List[WindowResult]) -> None:
+        # Reduces each segment of the columns falling in the same window with numpy
+        np = _numpy()
+        start, total = 0, len(timestamps)
+        while start < total:
+            if self.duration is not None:
+                self._advance(int(timestamps[start]), results)
+                stop = int(np.searchsorted(timestamps, self.end, side="left"))
+                stop = max(stop, start + 1)
+            else:
+                stop = min(total, start + self.size - self.sums.count)
+            sums = self.sums
+            for idx, column in enumerate(columns):
+                segment = column[start:stop].astype(np.float64)
+                sums.sums[idx] += float(segment.sum())
+                sums.squares[idx] += float(np.dot(segment, segment))
+                sums.mins[idx] = min(sums.mins[idx], float(segment.min()))
+                sums.maxs[idx] = max(sums.maxs[idx], float(segment.max()))
+            sums.count += stop - start
+            if self.first is None:
+                self.first = int(timestamps[start])
+            self.last = int(timestamps[stop - 1])
+            if self.size is not None and sums.count == self.size:
+                self._emit(results)
+            start = stop
+
+
+class _Sliding:
+    # Overlapping windows, emitted every slide samples or nanoseconds
+
+    def __init__(self, keys: List[str], size: Optional[int], duration: Optional[int], slide: int):
+        self.keys = keys
+        self.size = size
+        self.duration = duration
+        self.slide = slide
+        self.sums = _Sums(len(keys))
+        self.samples: Deque[Tuple[int, int, Sequence[float]]] = deque()
+        self.mins: List[Deque[Tuple[int, float]]] = [deque() for _ in keys]
+        self.maxs: List[Deque[Tuple[int, float]]] = [deque() for _ in keys]
+        self.seen = 0
+        self.next_emit: Optional[int] = None
+
+    def _evict(self) -> None:
+        seq, _, values = self.samples.popleft()
+        sums = self.sums
+        sums.count -= 1
+        for idx, value in enumerate(values):
+            sums.sums[idx] -= value
+            sums.squares[idx] -= value * value
+            if self.mins[idx][0][0] == seq:
+                self.mins[idx].popleft()
+            if self.maxs[idx][0][0] == seq:
+                self.maxs[idx].popleft()
+
+    def _emit(self, results: List[WindowResult]) -> None:
+        if not self.samples:
+            return
+        results.append(WindowResult(self.samples[0][1], self.samples[-1][1], self.sums.count,
+                                    self.sums.stats(self.keys, [queue[0][1] for queue in self.mins],
+                                                    [queue[0][1] for queue in self.maxs])))
+
+    def add(self, timestamp: int, values: Sequence[float], results: List[WindowResult]) -> None:
+        if self.duration is not None:
+            # The windows ending before this sample are emitted first
+            if self.next_emit is None:
+                self.next_emit = timestamp + self.duration
+            while timestamp >= self.next_emit:
+                while self.samples and self.samples[0][1] < self.next_emit - self.duration:
+                    self._evict()
+                self._emit(results)
+                self.next_emit += self.slide
+
+        seq = self.seen
+        self.seen += 1
+        self.samples.append((seq, timestamp, values))
+        sums = self.sums
+        sums.count += 1
+        for idx, value in enumerate(values):
+            sums.sums[idx] += value
+            sums.squares[idx] += value * value
+            mins, maxs = self.mins[idx], self.maxs[idx]
+            while mins and mins[-1][1] >= value:
+                mins.pop()
+            mins.append((seq, value))
+            while maxs and maxs[-1][1] <= value:
+                maxs.pop()
+            maxs.append((seq, value))
+
+        if self.size is not None:
+            if len(self.samples) > self.size:
+                self._evict()
+            if self.seen >= self.size and (self.seen - self.size) % self.slide == 0:
+                self._emit(results)
+
+    def add_columns(self, timestamps: "np.ndarray", columns: List["np.ndarray"], results: List[WindowResult]) -> None:
+        for timestamp, values in zip(timestamps.tolist(), zip(*(column.tolist() for column in columns))):
+            self.add(timestamp, values, results)
+
+
+def _numeric(value: Any) -> bool:
+    return isinstance(value, numbers.Real) and not isinstance(value, bool) or \
+        hasattr(value, "dtype") and value.dtype.kind in "iuf"
+
+
+class Aggregator:
+    """
+    Calls **on_window(mac, result)** with a WindowResult for every window of samples of each mote. Windows are
+    made of **size** samples or last **duration** seconds (exactly one of the two must be given) and start every
+    **slide** samples or seconds, by default as soon as the previous one ends (tumbling windows). Only the numeric
+    **keys** are aggregated, by default all of the numeric keys of the Frameinfo of the mote, or of its messages.
+
+    Pass **on_connect**, **on_message** or **on_batch** and **on_disconnect** as the handlers of the streams,
+    or call them from your own handlers. The partial window of a mote is discarded when it disconnects.
+    """
+
+    def __init__(self, on_window: Callable[[str, WindowResult], None], size: Optional[int] = None,
+                 duration: Optional[float] = None, slide: Optional[float] = None,
+                 keys: Optional[Sequence[str]] = None):
+        if (size is None) == (duration is None):
+            raise ValueError("exactly one of size and duration must be given")
+        if size is not None and size <= 0 or duration is not None and duration <= 0:
+            raise ValueError("the window size and duration must be positive")
+        if slide is not None and slide <= 0:
+            raise ValueError("slide must be positive")
+        if slide is not None and size is not None and (slide != int(slide) or slide < 1):
+            raise ValueError("the slide of a window of samples must be a whole number of samples")
+        self.on_window = on_window
+        self._size = size
+        self._duration = int(duration * 1e9) if duration is not None else None
+        if slide is None or size is not None and slide >= size or duration is not None and slide >= duration:
+            self._slide = None
+        else:
+            self._slide = int(slide) if size is not None else max(1, int(slide * 1e9))
+        self._keys = list(keys) if keys is not None else None
+        self._mutex = Lock()
+        self._infos: Dict[str, Frameinfo] = {}
+        self._windows: Dict[str, Any] = {}
+
+    def on_connect(self, mac: str, info: Frameinfo) -> None:
+        """
+        Connect handler taking the keys of the mote from its Frameinfo.
+        """
+        with self._mutex:
+            self._infos[mac] = info
+            self._windows.pop(mac, None)
+
+    def on_disconnect(self, mac: str, lost: bool) -> None:
+        """
+        Disconnect handler discarding the partial window of the mote.
+        """
+        with self._mutex:
+            self._windows.pop(mac, None)
+
+    def on_message(self, mac: str, message: Any) -> None:
+        """
+        Message handler adding the samples of **message** to the windows of the mote.
+        """
+        self.on_batch(mac, [message])
+
+    def on_batch(self, mac: str, batch: List[Any]) -> None:
+        """
+        Batch handler adding the samples of every message of **batch** to the windows of the mote.
+        """
+        if not batch:
+            return
+        window = self._windows.get(mac)
+        if window is None:
+            window = self._create(mac, batch[0])
+        results: List[WindowResult] = []
+        first = batch[0]
+        if isinstance(first, tuple):
+            indexes = [first._fields.index(key) for key in window.keys]
+            stamp = first._fields.index("timestamp") if "timestamp" in first._fields else None
+            now = monotonic_ns()
+            for message in batch:
+                window.add(message[stamp] if stamp is not None else now,
+                           [message[idx] for idx in indexes], results)
+        elif first and hasattr(next(iter(first.values())), "dtype"):
+            for message in batch:
+                count = len(next(iter(message.values())))
+                timestamps = message.get("timestamp")
+                if timestamps is None:
+                    np = _numpy()
+                    timestamps = np.full(count, monotonic_ns(), dtype=np.int64)
+                window.add_columns(timestamps, [message[key] for key in window.keys], results)
+        else:
+            now = monotonic_ns()
+            keys = window.keys
+            for message in batch:
+                window.add(message.get("timestamp", now), [message[key] for key in keys], results)
+        for result in results:
+            self.on_window(mac, result)
+
+    def _create(self, mac: str, message: Any) -> Any:
+        # Creates the windows of the mote, with the keys of its Frameinfo that have numeric values
+        if isinstance(message, tuple):
+            sample = dict(zip(message._fields, message))
+        else:
+            sample = {key: value[0] if hasattr(value, "dtype") and value.ndim else value
+                      for key, value in message.items()}
+        with self._mutex:
+            info = self._infos.get(mac)
+        candidates = self._keys or (info.keys if info is not None else list(sample))
+        keys = [key for key in candidates if key in sample and key != "timestamp" and _numeric(sample[key])]
+        if self._slide is None:
+            window = _Tumbling(keys, self._size, self._duration)
+        else:
+            window = _Sliding(keys, self._size, self._duration, self._slide)
+        with self._mutex:
+            self._windows[mac] = window
+        return window
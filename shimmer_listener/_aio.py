@@ -0,0 +1,376 @@
+"""
+asyncio front end of the library.
+
+The streams are read from the event loop through non-blocking sockets, without any thread per mote: the data is
+decoded by the same code used by the threaded streams and made available through async iterators.
+
+```python
+async with AsyncBtListener() as listener:
+    async for mac, frame in listener:
+        print(mac, frame)
+```
+
+Only the connection to a mote, which is blocking in pybluez, and the discovery of new devices run in the
+default executor of the loop.
+"""
+
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+from functools import partial
+import asyncio
+import logging
+import struct
+
+from ._buffer import FrameBuffer
+from ._decoding import Frameinfo, MessageFormat
+from ._streams import BtSlaveInputStream
+from ._transport import Transport, _bluetooth
+from ._master import _is_shimmer_device, _def_lookup_duration, _def_scan_interval
+
+# Marker closing an async iteration
+_end = object()
+
+# Keeps a reference to the tasks running coroutine callbacks until they are done
+_callback_tasks: Set["asyncio.Future"] = set()
+
+
+def _fire(callback: Optional[Callable], *args: Any) -> None:
+    # Invokes a callback, scheduling it as a task if it is a coroutine function
+    if callback is None:
+        return
+    result = callback(*args)
+    if asyncio.iscoroutine(result):
+        task = asyncio.ensure_future(result)
+        _callback_tasks.add(task)
+        task.add_done_callback(_callback_tasks.discard)
+
+
+class _AsyncQueue:
+    """
+    An unbounded asyncio queue that pauses the streams feeding it when it holds more than **limit** items,
+    and resumes them once it's half empty.
+    """
+
+    def __init__(self, limit: int):
+        self._queue: "asyncio.Queue[Any]" = asyncio.Queue()
+        self._limit = limit
+        self._paused: Set["AsyncBtStream"] = set()
+
+    def put(self, item: Any, stream: Optional["AsyncBtStream"] = None) -> None:
+        self._queue.put_nowait(item)
+        if stream is not None and self._queue.qsize() >= self._limit and stream not in self._paused:
+            self._paused.add(stream)
+            stream._pause()
+
+    async def get(self) -> Any:
+        item = await self._queue.get()
+        if self._paused and self._queue.qsize() <= self._limit // 2:
+            for stream in self._paused:
+                stream._resume()
+            self._paused.clear()
+        return item
+
+
+class AsyncBtStream:
+    """
+    asyncio counterpart of BtSlaveInputStream: connects to a slave mote with the given mac, reads its
+    presentation frame and makes the received messages available through async iteration:
+
+    ```python
+    stream = AsyncBtStream(mac)
+    await stream.connect()
+    async for frame in stream:
+        print(frame)
+    ```
+
+    The format of the messages depends on the **message_format** of the underlying **stream**. The
+    **on_connect(mac, info)** and **on_disconnect(mac, lost)** callbacks can be either plain functions or
+    coroutine functions, the latter being scheduled as tasks.
+    """
+
+    def __init__(self, mac: str, queue_size: int = 1024, transport: Optional[Transport] = None):
+        """
+        Initializes a new async stream, connecting through **transport** (an RFCOMM connection by default);
+        at most **queue_size** messages are buffered before pausing the reception until the consumer catches up.
+        """
+        if queue_size <= 0:
+            raise ValueError("queue_size must be a positive integer")
+        self._mac = mac
+        self._stream = BtSlaveInputStream(mac, transport)
+        self._stream.on_message = self._on_message
+        self._queue_size = queue_size
+        self._queue: Optional[_AsyncQueue] = None
+        self._owns_queue = True
+        self._buffer = FrameBuffer()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._connecting: Optional["asyncio.Future"] = None
+        self._reading = False
+        self._connected = False
+        self.on_connect: Optional[Callable[[str, Frameinfo], Any]] = None
+        self.on_disconnect: Optional[Callable[[str, bool], Any]] = None
+
+    @property
+    def mac(self) -> str:
+        return self._mac
+
+    @property
+    def stream(self) -> BtSlaveInputStream:
+        """
+        The stream decoding the received data, that can be used to set its message_format.
+        """
+        return self._stream
+
+    @property
+    def info(self) -> Optional[Frameinfo]:
+        """
+        The Frameinfo received through the presentation protocol, None before connecting.
+        """
+        return self._stream._info
+
+    @property
+    def open(self) -> bool:
+        """
+        Property that is True if the stream is currently connected.
+        """
+        return self._connected
+
+    def _on_message(self, mac: str, message: Any) -> None:
+        self._queue.put((mac, message), self)
+
+    async def _readable(self) -> None:
+        # Waits until the socket has data to read
+        waiter = self._loop.create_future()
+        fd = self._stream._transport.fileno()
+        self._loop.add_reader(fd, waiter.set_result, None)
+        try:
+            await waiter
+        finally:
+            self._loop.remove_reader(fd)
+
+    async def connect(self) -> None:
+        """
+        Connects to the mote and waits for its presentation frame. Raises TransportError if the connection
+        fails, or ConnectionError if the presentation frame is not valid.
+        """
+        self._loop = asyncio.get_running_loop()
+        if self._queue is None:
+            self._queue = _AsyncQueue(self._queue_size)
+        # Run as a task of its own, so that close can cancel it
+        self._connecting = asyncio.ensure_future(self._open())
+        try:
+            await self._connecting
+        finally:
+            self._connecting = None
+
+    async def _open(self) -> None:
+        transport = self._stream._transport
+        try:
+            await self._loop.run_in_executor(None, self._stream._connect)
+            transport.setblocking(False)
+
+            size = BtSlaveInputStream._pres_frame_size
+            while self._buffer.available < size:
+                await self._readable()
+                try:
+                    if self._buffer.fill(transport, size - self._buffer.available) == 0:
+                        raise ConnectionResetError("connection closed by the peer")
+                except (BlockingIOError, InterruptedError):
+                    pass
+            self._stream._init_frameinfo(self._buffer.read_exact(transport, size))
+        except (ValueError, struct.error):
+            self._stream._decode_error()
+            transport.close()
+            raise ConnectionError(f"BT MAC {self._mac}: error in decoding presentation frame!")
+        except BaseException:
+            transport.close()
+            raise
+
+        self._connected = True
+        _fire(self.on_connect, self._mac, self._stream._info)
+        self._resume()
+
+    def _pause(self) -> None:
+        if self._reading:
+            self._loop.remove_reader(self._stream._transport.fileno())
+            self._reading = False
+
+    def _resume(self) -> None:
+        if self._connected and not self._reading:
+            self._loop.add_reader(self._stream._transport.fileno(), self._on_readable)
+            self._reading = True
+
+    def _on_readable(self) -> None:
+        try:
+            if self._buffer.fill(self._stream._transport) == 0:
+                raise ConnectionResetError("connection closed by the peer")
+            self._stream._process(self._buffer)
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError:
+            self._finish(lost=True)
+
+    def _finish(self, lost: bool) -> None:
+        if not self._connected:
+            return
+        self._pause()
+        self._connected = False
+        self._stream._flush_batch()
+        self._stream._transport.close()
+        _fire(self.on_disconnect, self._mac, lost)
+        if self._owns_queue:
+            self._queue.put(_end)
+
+    async def close(self) -> None:
+        """
+        Closes the connection with the mote, or stops connecting to it; the messages already received can still
+        be iterated.
+        """
+        connecting = self._connecting
+        if connecting is not None:
+            connecting.cancel()
+            await asyncio.wait([connecting])
+        if self._connected:
+            self._finish(lost=False)
+            return
+        self._stream._transport.close()
+        if self._owns_queue and self._queue is not None:
+            self._queue.put(_end)
+
+    def __aiter__(self) -> "AsyncBtStream":
+        return self
+
+    async def __anext__(self) -> Any:
+        if self._queue is None:
+            raise StopAsyncIteration
+        item = await self._queue.get()
+        if item is _end:
+            # Lets any other consumer stop as well
+            self._queue.put(_end)
+            raise StopAsyncIteration
+        return item[1]
+
+
+class AsyncBtListener:
+    """
+    asyncio counterpart of bt_init/bt_listen/bt_close in master mode: keeps discovering shimmer devices,
+    connects to them and merges their messages into a single async iterator of (mac, frame) tuples.
+
+    The **on_connect(mac, info)** and **on_disconnect(mac, lost)** callbacks can be either plain functions
+    or coroutine functions, the latter being scheduled as tasks.
+    """
+
+    def __init__(self, lookup_duration: float = _def_lookup_duration, scan_interval: float = _def_scan_interval,
+                 queue_size: int = 1024, message_format: MessageFormat = MessageFormat.DICT):
+        """
+        Initializes a new listener, see bt_listen for the meaning of **lookup_duration** and
+        **scan_interval**. At most **queue_size** messages are buffered before pausing the reception
+        until the consumer catches up.
+        """
+        self._lookup_duration = lookup_duration
+        self._scan_interval = scan_interval
+        self._queue_size = queue_size
+        self._message_format = message_format
+        self._queue: Optional[_AsyncQueue] = None
+        self._streams: Dict[str, AsyncBtStream] = {}
+        self._discovery: Optional["asyncio.Future"] = None
+        self._connecting: Set["asyncio.Future"] = set()
+        self.on_connect: Optional[Callable[[str, Frameinfo], Any]] = None
+        self.on_disconnect: Optional[Callable[[str, bool], Any]] = None
+
+    @property
+    def streams(self) -> Dict[str, AsyncBtStream]:
+        """
+        The currently open streams, by mac address.
+        """
+        return dict(self._streams)
+
+    async def start(self) -> None:
+        """
+        Starts discovering and connecting to the shimmer devices, non blocking.
+        """
+        if self._discovery is not None:
+            return
+        self._queue = _AsyncQueue(self._queue_size)
+        self._discovery = asyncio.ensure_future(self._discover())
+
+    async def _discover(self) -> None:
+        loop = asyncio.get_running_loop()
+        bluetooth = _bluetooth()
+        while True:
+            try:
+                found_devices = await loop.run_in_executor(
+                    None, partial(bluetooth.discover_devices, duration=self._lookup_duration, lookup_names=True))
+            except bluetooth.btcommon.BluetoothError as err:
+                logging.error(err)
+                found_devices = []
+            for mac, name in found_devices:
+                logging.info(f"Found device with MAC {mac}, ID {name}")
+                if _is_shimmer_device(name) and mac not in self._streams:
+                    logging.info(f"Pairing with {mac}..")
+                    self.add(mac)
+            await asyncio.sleep(self._scan_interval)
+
+    def add(self, mac: str, transport: Optional[Transport] = None) -> AsyncBtStream:
+        """
+        Connects to the mote with the given mac, through **transport** (an RFCOMM connection by default), merging
+        its messages with the other ones.
+        """
+        stream = AsyncBtStream(mac, transport=transport)
+        stream.stream.message_format = self._message_format
+        stream._queue = self._queue
+        stream._owns_queue = False
+        stream.on_connect = self.on_connect
+        stream.on_disconnect = partial(self._on_disconnect, stream)
+        self._streams[mac] = stream
+        task = asyncio.ensure_future(self._connect(stream))
+        self._connecting.add(task)
+        task.add_done_callback(self._connecting.discard)
+        return stream
+
+    async def _connect(self, stream: AsyncBtStream) -> None:
+        try:
+            await stream.connect()
+        except OSError as err:
+            logging.error(f"BT MAC {stream.mac}: {err}")
+            self._streams.pop(stream.mac, None)
+
+    def _on_disconnect(self, stream: AsyncBtStream, mac: str, lost: bool) -> None:
+        if self._streams.get(mac) is stream:
+            del self._streams[mac]
+        _fire(self.on_disconnect, mac, lost)
+
+    async def close(self) -> None:
+        """
+        Stops the discovery and closes every open stream; the messages already received can still be iterated.
+        """
+        if self._discovery is None:
+            return
+        self._discovery.cancel()
+        self._discovery = None
+        # The streams still connecting are closed as well, instead of joining the listener later
+        connecting = list(self._connecting)
+        for task in connecting:
+            task.cancel()
+        if connecting:
+            await asyncio.wait(connecting)
+        for stream in list(self._streams.values()):
+            await stream.close()
+        self._queue.put(_end)
+
+    async def __aenter__(self) -> "AsyncBtListener":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.close()
+
+    def __aiter__(self) -> "AsyncBtListener":
+        return self
+
+    async def __anext__(self) -> Tuple[str, Any]:
+        if self._queue is None:
+            raise StopAsyncIteration
+        item = await self._queue.get()
+        if item is _end:
+            self._queue.put(_end)
+            raise StopAsyncIteration
+        return item
@@ -0,0 +1,145 @@
+"""
+Frame reassembly for the incoming Bt streams.
+
+Data is read in large chunks directly into a preallocated buffer through recv_into, whole frames are handed out
+as memoryview slices of that buffer and any partial frame is carried over to the following read, so that no byte
+received from the mote is ever thrown away.
+"""
+
+from typing import Any, Iterator, Optional
+
+
+class FrameBuffer:
+    """
+    A preallocated receive buffer that reassembles fixed-size frames from a byte stream.
+
+    The memoryview slices returned by **read_exact**, **frames** and **block** are only valid until the next call
+    to **fill**, which reuses the same memory for the following read.
+    """
+
+    _def_capacity = 4096
+
+    def __init__(self, capacity: int = _def_capacity):
+        """
+        Initializes an empty buffer that can hold up to **capacity** bytes.
+        """
+        if capacity <= 0:
+            raise ValueError("FrameBuffer capacity must be a positive integer")
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self._start = 0
+        self._end = 0
+
+    @property
+    def capacity(self) -> int:
+        """
+        Total number of bytes that the buffer can hold.
+        """
+        return len(self._buf)
+
+    @property
+    def available(self) -> int:
+        """
+        Number of received bytes that were not consumed yet.
+        """
+        return self._end - self._start
+
+    def clear(self) -> None:
+        """
+        Discards every byte currently held by the buffer.
+        """
+        self._start = 0
+        self._end = 0
+
+    def _compact(self) -> None:
+        # Moves the pending partial frame (if any) to the beginning of the buffer, so that the
+        # next read can use all of the remaining space
+        if self._start == 0:
+            return
+        pending = self._end - self._start
+        if pending:
+            self._view[0:pending] = self._view[self._start:self._end]
+        self._start = 0
+        self._end = pending
+
+    def fill(self, sock: Any, max_bytes: int = 0) -> int:
+        """
+        Performs a single read from **sock**, appending the received bytes to the ones already buffered.
+        At most **max_bytes** are read if specified, otherwise the read is as large as the free space allows.
+        Returns the number of bytes received, 0 meaning that the peer closed the connection.
+
+        Sockets exposing recv_into are read without any intermediate copy, the ones that only implement
+        recv (such as the pybluez BluetoothSocket) are copied into the buffer instead.
+        """
+        self._compact()
+        free = len(self._buf) - self._end
+        if free == 0:
+            raise BufferError("FrameBuffer is full, its capacity must be larger than the frame size")
+        if 0 < max_bytes < free:
+            free = max_bytes
+
+        recv_into = getattr(sock, "recv_into", None)
+        if recv_into is not None:
+            received = recv_into(self._view[self._end:self._end + free], free)
+        else:
+            data = sock.recv(free)
+            received = len(data)
+            self._view[self._end:self._end + received] = data
+        self._end += received
+        return received
+
+    def read_exact(self, sock: Any, size: int) -> memoryview:
+        """
+        Reads from **sock** until **size** bytes are available and returns them, never reading more than
+        needed. Raises ConnectionResetError if the peer closes the connection before that.
+        """
+        if size > len(self._buf):
+            raise ValueError(f"cannot read {size} B with a {len(self._buf)} B FrameBuffer")
+        while self.available < size:
+            if self.fill(sock, size - self.available) == 0:
+                raise ConnectionResetError("connection closed by the peer")
+        return self._take(size)
+
+    def _take(self, size: int) -> memoryview:
+        view = self._view[self._start:self._start + size]
+        self._start += size
+        return view
+
+    def skip(self, size: int) -> None:
+        """
+        Discards the first **size** buffered bytes.
+        """
+        self._start += min(size, self._end - self._start)
+
+    def find(self, value: int, offset: int = 0) -> int:
+        """
+        Returns the position of the first byte equal to **value** among the buffered ones, starting from
+        **offset**, or -1 if there is none.
+        """
+        position = self._buf.find(value, self._start + offset, self._end)
+        return position - self._start if position >= 0 else -1
+
+    def frames(self, framesize: int) -> Iterator[memoryview]:
+        """
+        Yields every complete frame of **framesize** bytes currently buffered, leaving any trailing partial
+        frame to be completed by the next fill.
+        """
+        while self._end - self._start >= framesize:
+            yield self._take(framesize)
+
+    def peek(self, framesize: int) -> memoryview:
+        """
+        Returns all of the complete frames of **framesize** bytes currently buffered, as **block** does,
+        without consuming them.
+        """
+        return self._view[self._start:self._end - self.available % framesize]
+
+    def block(self, framesize: int, max_frames: Optional[int] = None) -> memoryview:
+        """
+        Returns all of the complete frames of **framesize** bytes currently buffered, or the first **max_frames**
+        of them, as a single contiguous view, whose length is a multiple of **framesize** (possibly zero).
+        """
+        size = self.available - self.available % framesize
+        if max_frames is not None:
+            size = min(size, max_frames * framesize)
+        return self._take(size)
@@ -0,0 +1,292 @@
+"""
+Decoding of the data frames sent by the motes, based on the format described by their Frameinfo.
+
+Decoders are built once per distinct (format, keys) pair and cached, so that reconnecting motes, or motes
+running the same application, share the same precompiled struct.
+
+The columnar decoding mode requires numpy, which is an optional dependency (pip install shimmer-listener[numpy]).
+It is only imported when first needed, so that the processes that never use it don't pay for its import.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple, TYPE_CHECKING
+from collections import namedtuple
+from functools import lru_cache
+from threading import Lock
+from types import ModuleType
+import struct
+import enum
+import re
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+class Frameinfo(namedtuple("frameinfo", ["framesize", "lenchunks", "format", "keys"])):
+    """A description of the format used by the shimmer device to communicate. The data received through the
+    presentation protocol at startup is contained in an instance of this class."""
+    pass
+
+
+class MessageFormat(enum.Enum):
+    """
+    Enum used to choose how the data received by a stream is passed to the on_message/on_batch callbacks.
+
+    - **DICT**: one dict per chunk, with the keys of the Frameinfo.
+    - **COLUMNS**: one dict of numpy arrays per block of received frames, each array containing every value
+        of a key, in order of arrival. Requires numpy.
+    - **RECORD**: one record per chunk, a lightweight named tuple whose fields are the keys of the Frameinfo,
+        see **record_type**.
+    """
+
+    DICT = 0
+    COLUMNS = 1
+    RECORD = 2
+
+
+_record_types: Dict[Tuple[str, ...], type] = {}
+_record_types_mutex = Lock()
+
+
+def record_type(keys: Iterable[str]) -> type:
+    """
+    Returns the record class for the given keys, generating it only the first time that they are seen.
+    Records are named tuples, so they have no per-instance dict: their fields can be accessed by name
+    or by index and **_asdict()** converts them into a dict. Keys that are not valid identifiers are
+    renamed positionally (_0, _1, ...).
+    """
+    keys = tuple(keys)
+    cls = _record_types.get(keys)
+    if cls is None:
+        with _record_types_mutex:
+            cls = _record_types.get(keys)
+            if cls is None:
+                cls = namedtuple("Record", keys, rename=True)
+                # Generated classes can't be found by name, records are pickled as their keys and values
+                cls.__reduce__ = lambda record, keys=keys: (_make_record, (keys, tuple(record)))
+                _record_types[keys] = cls
+    return cls
+
+
+def _make_record(keys: Tuple[str, ...], values: tuple) -> tuple:
+    return tuple.__new__(record_type(keys), values)
+
+
+# Byte order characters of the struct module mapped to the numpy ones
+_np_byte_order = {"": "=", "@": "=", "=": "=", "<": "<", ">": ">", "!": ">"}
+_fmt_item = re.compile(r"(\d*)([xcbB?hHiIlLqQnNefdspP])")
+
+
+@lru_cache(maxsize=None)
+def _numpy() -> Optional[ModuleType]:
+    # Imports numpy on first use, returning None if it isn't installed
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _require_numpy(feature: str = "the columnar decoding mode") -> ModuleType:
+    np = _numpy()
+    if np is None:
+        raise ImportError(f"numpy is required for {feature}: "
+                          "pip install shimmer-listener[numpy]")
+    return np
+
+
+def _layout(info: Frameinfo) -> Tuple[str, List[Tuple[int, str]]]:
+    # Returns the byte order character of the chunk format and the offset and struct code of each value
+    fmt = "".join(info.format.split())
+    order = fmt[0] if fmt and fmt[0] in _np_byte_order else ""
+    fmt = fmt[len(order):]
+
+    layout = order
+    items = []
+    parsed = 0
+    for match in _fmt_item.finditer(fmt):
+        if match.start() != parsed:
+            break
+        parsed = match.end()
+        count = int(match.group(1)) if match.group(1) else 1
+        code = match.group(2)
+        if code == "x":
+            layout += match.group(0)
+            continue
+        if code in "sp":
+            # A string is a single value, whatever its length
+            items.append((struct.calcsize(layout), match.group(0)))
+            layout += match.group(0)
+            continue
+        for _ in range(count):
+            # "0<code>" aligns the offset as the struct module does, without adding any item
+            items.append((struct.calcsize(layout + "0" + code), code))
+            layout += code
+    if parsed != len(fmt):
+        raise ValueError(f"unsupported chunk format: {info.format}")
+    if len(items) != len(info.keys):
+        raise ValueError("the number of keys doesn't match the number of values in a chunk")
+    return order, items
+
+
+def _projected_format(info: Frameinfo, keys: Iterable[str]) -> str:
+    # Chunk format of info where the values of the keys not in keys are pad bytes, so that they are not unpacked
+    order, items = _layout(info)
+    wanted = set(keys)
+    fmt = order
+    for key, (offset, code) in zip(info.keys, items):
+        if key not in wanted:
+            continue
+        pad = offset - struct.calcsize(fmt)
+        if pad:
+            fmt += f"{pad}x"
+        fmt += code
+    pad = struct.calcsize(info.format) - struct.calcsize(fmt)
+    if pad:
+        fmt += f"{pad}x"
+    return fmt
+
+
+def numpy_dtype(info: Frameinfo, keys: Optional[Iterable[str]] = None) -> "np.dtype":
+    """
+    Builds the numpy structured dtype equivalent to a chunk of the given Frameinfo, having one field
+    for each one of its keys, or only for those in **keys**, with the same offsets and alignment used
+    by the struct module.
+    """
+    np = _require_numpy()
+    order, items = _layout(info)
+    wanted = set(info.keys if keys is None else keys)
+    names = []
+    formats = []
+    offsets = []
+    for key, (offset, code) in zip(info.keys, items):
+        if key not in wanted:
+            continue
+        kind = code[-1]
+        if kind == "p":
+            raise ValueError("pascal strings are not supported by the columnar decoding mode")
+        if kind == "s":
+            np_code = f"S{code[:-1] or 1}"
+        elif kind in "bhilqn":
+            np_code = f"{_np_byte_order[order]}i{struct.calcsize(order + kind)}"
+        elif kind in "BHILQNP":
+            np_code = f"{_np_byte_order[order]}u{struct.calcsize(order + kind)}"
+        elif kind in "efd":
+            np_code = f"{_np_byte_order[order]}f{struct.calcsize(order + kind)}"
+        elif kind == "c":
+            np_code = "S1"
+        else:
+            np_code = "?"
+        names.append(key)
+        formats.append(np_code)
+        offsets.append(offset)
+    return np.dtype({"names": names, "formats": formats, "offsets": offsets,
+                     "itemsize": struct.calcsize(info.format)})
+
+
+class FrameDecoder:
+    """
+    Decodes whole frames made of contiguous chunks, as described by a Frameinfo, in a single pass.
+    Use **get_decoder** to obtain a cached instance instead of building a new one.
+    """
+
+    def __init__(self, info: Frameinfo, keys: Optional[Iterable[str]] = None):
+        """
+        Compiles the chunk format of **info**. If **keys** is given, only the values of these keys are
+        decoded, in the order of the Frameinfo, while the others are skipped as pad bytes.
+        """
+        self._info = info
+        if keys is None:
+            self._struct = struct.Struct(info.format)
+            self._keys = tuple(info.keys)
+        else:
+            wanted = set(keys)
+            unknown = wanted.difference(info.keys)
+            if unknown:
+                raise ValueError(f"unknown keys: {', '.join(sorted(unknown))}")
+            self._struct = struct.Struct(_projected_format(info, wanted))
+            self._keys = tuple(key for key in info.keys if key in wanted)
+        self._record = record_type(self._keys)
+        self._dtype = None
+
+    @property
+    def keys(self) -> Tuple[str, ...]:
+        """
+        The keys of the values decoded from each chunk.
+        """
+        return self._keys
+
+    @property
+    def chunksize(self) -> int:
+        """
+        The size in bytes of a single chunk.
+        """
+        return self._struct.size
+
+    def decode(self, frame: Any) -> List[tuple]:
+        """
+        Unpacks every chunk contained in **frame**, whose size must be a multiple of the chunk size.
+        """
+        return list(self._struct.iter_unpack(frame))
+
+    def decode_every(self, frame: Any, start: int, step: int) -> List[tuple]:
+        """
+        Unpacks only one chunk every **step** chunks of **frame**, starting from the chunk at index **start**.
+        """
+        size = self._struct.size
+        unpack_from = self._struct.unpack_from
+        return [unpack_from(frame, offset) for offset in range(start * size, len(frame), step * size)]
+
+    def to_dicts(self, frame: Any) -> List[Dict[str, Any]]:
+        """
+        Unpacks every chunk contained in **frame** into a dict with the keys of the Frameinfo.
+        """
+        keys = self._keys
+        return [dict(zip(keys, chunk)) for chunk in self._struct.iter_unpack(frame)]
+
+    def to_records(self, frame: Any) -> List[tuple]:
+        """
+        Unpacks every chunk contained in **frame** into an instance of the record type of the Frameinfo keys.
+        """
+        record = self._record
+        new = tuple.__new__
+        return [new(record, chunk) for chunk in self._struct.iter_unpack(frame)]
+
+    def to_columns(self, block: Any) -> Dict[str, "np.ndarray"]:
+        """
+        Decodes every chunk contained in **block**, made of one or more frames, with a single numpy call,
+        returning a dict with an array of values for each key. The arrays don't reference **block**.
+        """
+        return self.to_columns_every(block, 0, 1)
+
+    def to_columns_every(self, block: Any, start: int, step: int) -> Dict[str, "np.ndarray"]:
+        """
+        Decodes one chunk every **step** chunks of **block**, starting from the chunk at index **start**, as
+        **to_columns** does. Only the selected values are copied out of **block**.
+        """
+        if self._dtype is None:
+            self._dtype = numpy_dtype(self._info, self._keys)
+        array = _numpy().frombuffer(block, dtype=self._dtype)
+        if step == 1 and start == 0 and len(self._keys) == len(self._info.keys):
+            array = array.copy()
+            return {key: array[key] for key in self._keys}
+        array = array[start::step]
+        return {key: array[key].copy() for key in self._keys}
+
+
+_decoders: Dict[Tuple[str, Tuple[str, ...], Optional[Tuple[str, ...]]], FrameDecoder] = {}
+_decoders_mutex = Lock()
+
+
+def get_decoder(info: Frameinfo, keys: Optional[Iterable[str]] = None) -> FrameDecoder:
+    """
+    Returns the decoder for the given Frameinfo, decoding only **keys** if given, building it only
+    the first time that its format is seen.
+    """
+    key = (info.format, tuple(info.keys), tuple(sorted(set(keys))) if keys is not None else None)
+    decoder = _decoders.get(key)
+    if decoder is None:
+        with _decoders_mutex:
+            decoder = _decoders.get(key)
+            if decoder is None:
+                decoder = _decoders[key] = FrameDecoder(info, keys)
+    return decoder
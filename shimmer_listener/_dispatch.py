@@ -0,0 +1,215 @@
+"""
+Decoupling of the receive loops from the user callbacks.
+
+A Dispatcher holds a bounded queue for each mote and a pool of worker threads running the callbacks. A queue
+is only ever served by one worker at a time, so the events of each mote are notified in order of arrival, while
+different motes are served concurrently. When a queue is full, incoming messages are handled according to the
+chosen OverflowPolicy; connect and disconnect events are never dropped.
+"""
+
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+from threading import Condition, Thread
+from collections import deque
+import logging
+import queue
+import enum
+import time
+
+
+class OverflowPolicy(enum.Enum):
+    """
+    Enum used to choose what happens to incoming messages when the queue of a mote is full.
+
+    - **BLOCK**: the receive loop waits until there is space in the queue.
+    - **DROP_OLDEST**: the oldest queued message is discarded to make space.
+    - **DROP_NEWEST**: the incoming message is discarded.
+    - **COALESCE**: the incoming message is merged with the newest queued one: batches are joined
+        together, while single messages replace the queued one, so that only the most recent is kept.
+    """
+
+    BLOCK = 0
+    DROP_OLDEST = 1
+    DROP_NEWEST = 2
+    COALESCE = 3
+
+
+class EventKind(enum.Enum):
+    """
+    The kind of the callback invocations that go through a Dispatcher.
+    """
+
+    EVENT = 0
+    MESSAGE = 1
+    BATCH = 2
+
+
+# A queued callback invocation
+_Item = Tuple[EventKind, Callable, tuple]
+
+
+class _MoteQueue:
+    def __init__(self):
+        self.items: Deque[_Item] = deque()
+        self.scheduled = False
+        self.messages = 0
+        self.max_depth = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"depth": len(self.items), "max_depth": self.max_depth, "delivered": self.delivered,
+                "dropped": self.dropped, "coalesced": self.coalesced}
+
+
+class Dispatcher:
+    """
+    Runs the stream callbacks on a pool of worker threads, through a bounded queue for each mote.
+    Assign an instance to the **dispatcher** property of one or more BtStreams, or pass the **workers**
+    option to bt_listen to have one created for every stream.
+    """
+
+    # Number of events that a worker processes from a queue before moving to another one
+    _drain_size = 64
+
+    def __init__(self, workers: int = 1, queue_size: int = 1024,
+                 overflow: OverflowPolicy = OverflowPolicy.BLOCK):
+        """
+        Starts **workers** threads serving the queues of the motes, each queue holding up to **queue_size**
+        messages before applying the **overflow** policy.
+        """
+        if workers <= 0:
+            raise ValueError("the number of workers must be a positive integer")
+        if queue_size <= 0:
+            raise ValueError("queue_size must be a positive integer")
+        self._queue_size = queue_size
+        self._overflow = overflow
+        self._queues: Dict[str, _MoteQueue] = {}
+        self._cond = Condition()
+        self._ready: "queue.Queue[Optional[_MoteQueue]]" = queue.Queue()
+        self._closed = False
+        self._workers = [Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    @property
+    def overflow(self) -> OverflowPolicy:
+        return self._overflow
+
+    @property
+    def queue_size(self) -> int:
+        return self._queue_size
+
+    def submit(self, mac: str, kind: EventKind, callback: Callable, *args: Any) -> None:
+        """
+        Queues the invocation of **callback** with **args** in the queue of the mote identified by **mac**.
+        If the dispatcher is closed, the callback is invoked directly.
+        """
+        with self._cond:
+            if self._closed:
+                mote_queue = None
+            else:
+                mote_queue = self._queues.get(mac)
+                if mote_queue is None:
+                    mote_queue = self._queues[mac] = _MoteQueue()
+                if kind is not EventKind.EVENT and not self._make_space(mote_queue, kind, callback, args):
+                    return
+                if self._closed:
+                    mote_queue = None
+                else:
+                    mote_queue.items.append((kind, callback, args))
+                    if kind is not EventKind.EVENT:
+                        mote_queue.messages += 1
+                    mote_queue.max_depth = max(mote_queue.max_depth, len(mote_queue.items))
+                    if not mote_queue.scheduled:
+                        mote_queue.scheduled = True
+                        self._ready.put(mote_queue)
+        if mote_queue is None:
+            callback(*args)
+
+    def _make_space(self, mote_queue: _MoteQueue, kind: EventKind, callback: Callable, args: tuple) -> bool:
+        # Applies the overflow policy, returns False if the incoming message must not be queued.
+        # Called with the condition lock held.
+        if mote_queue.messages < self._queue_size:
+            return True
+        if self._overflow is OverflowPolicy.BLOCK:
+            while mote_queue.messages >= self._queue_size and not self._closed:
+                self._cond.wait()
+            return True
+        if self._overflow is OverflowPolicy.DROP_NEWEST:
+            mote_queue.dropped += 1
+            return False
+        if self._overflow is OverflowPolicy.DROP_OLDEST:
+            for idx, item in enumerate(mote_queue.items):
+                if item[0] is not EventKind.EVENT:
+                    del mote_queue.items[idx]
+                    mote_queue.messages -= 1
+                    mote_queue.dropped += 1
+                    break
+            return True
+
+        # Coalescing: the newest queued message absorbs the incoming one, if it is of the same kind
+        last_kind, last_callback, last_args = mote_queue.items[-1]
+        if last_kind is not kind or last_callback != callback:
+            mote_queue.dropped += 1
+            return False
+        if kind is EventKind.BATCH:
+            mote_queue.items[-1] = (kind, callback, (args[0], list(last_args[1]) + list(args[1])))
+        else:
+            mote_queue.items[-1] = (kind, callback, args)
+        mote_queue.coalesced += 1
+        return False
+
+    def _work(self) -> None:
+        while True:
+            mote_queue = self._ready.get()
+            if mote_queue is None:
+                return
+            for _ in range(self._drain_size):
+                with self._cond:
+                    if not mote_queue.items:
+                        break
+                    kind, callback, args = mote_queue.items.popleft()
+                    if kind is not EventKind.EVENT:
+                        mote_queue.messages -= 1
+                        mote_queue.delivered += 1
+                    self._cond.notify_all()
+                try:
+                    callback(*args)
+                except Exception:
+                    logging.exception(f"BT MAC {args[0] if args else None}: error in callback")
+            with self._cond:
+                if mote_queue.items:
+                    self._ready.put(mote_queue)
+                else:
+                    mote_queue.scheduled = False
+                    self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Returns, for each mote, the current and maximum depth of its queue, together with the number of
+        delivered, dropped and coalesced messages.
+        """
+        with self._cond:
+            return {mac: mote_queue.stats() for mac, mote_queue in self._queues.items()}
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits up to **timeout** seconds (forever if None) for the queued events to be delivered, then stops
+        the workers. Events submitted after closing are delivered directly by the submitting thread.
+        Returns False if some events were still queued when the timeout expired.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            drained = True
+            while any(mote_queue.scheduled for mote_queue in self._queues.values()):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    drained = False
+                    break
+                self._cond.wait(remaining)
+            self._closed = True
+            self._cond.notify_all()
+        for _ in self._workers:
+            self._ready.put(None)
+        return drained
@@ -0,0 +1,107 @@
+"""
+Selection of the samples decoded by the streams.
+
+A stream can be told to decode only one chunk every N (decimation), only the values of some keys (projection)
+and only the chunks where some key changed by at least a threshold since the last chunk delivered (deadband).
+The skipped chunks and values are never unpacked: the decoder of the projection reads the wanted values only,
+from the offsets of the chunks that survive the decimation, and the deadband compares the decoded tuples before
+any message is built from them.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple, TYPE_CHECKING
+
+from ._decoding import Frameinfo, get_decoder, record_type, _numpy
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+class _ChunkFilter:
+    # Decodes the chunks of a stream selected by its decimation, deadband and projection options
+
+    def __init__(self, info: Frameinfo, decimation: int = 1, deadband: Optional[Dict[str, float]] = None,
+                 projection: Optional[Sequence[str]] = None, prefix: Tuple[str, ...] = (),
+                 prefix_values: tuple = (), record: Optional[type] = None):
+        self._decoder = get_decoder(info, projection)
+        self._decimation = decimation
+        self._phase = 0
+        self.keys = prefix + self._decoder.keys
+        self._prefix_values = prefix_values
+        self._record = record if record is not None else record_type(self.keys)
+
+        self._bands: List[Tuple[int, float]] = []
+        if deadband:
+            unknown = set(deadband).difference(self._decoder.keys)
+            if unknown:
+                raise ValueError(f"deadband keys not decoded by the stream: {', '.join(sorted(unknown))}")
+            self._bands = [(self._decoder.keys.index(key), threshold) for key, threshold in deadband.items()]
+        self._reference: Optional[List[Any]] = None
+
+    def _select(self, chunks: int) -> Tuple[int, int]:
+        # Returns the index of the first chunk to decode out of the next chunks, advancing the decimation phase
+        start = self._phase
+        self._phase = (start - chunks) % self._decimation
+        return start, self._decimation
+
+    def _changed(self, values: Any) -> List[int]:
+        # Returns the indexes of the values, tuples of the deadband keys, that differ enough from the last one kept
+        bands = [threshold for _, threshold in self._bands]
+        reference = self._reference
+        kept = []
+        for idx, current in enumerate(values):
+            if reference is not None and all(abs(value - last) < threshold
+                                             for value, last, threshold in zip(current, reference, bands)):
+                continue
+            reference = current
+            kept.append(idx)
+        self._reference = reference
+        return kept
+
+    def rows(self, frame: Any) -> Tuple[List[tuple], range]:
+        """
+        Decodes the selected chunks of **frame**, returning their values and their indexes in the frame.
+        """
+        chunks = len(frame) // self._decoder.chunksize
+        start, step = self._select(chunks)
+        if start == 0 and step == 1:
+            rows = self._decoder.decode(frame)
+        else:
+            rows = self._decoder.decode_every(frame, start, step)
+        indexes = range(start, chunks, step)
+        if self._bands:
+            kept = self._changed([tuple(row[position] for position, _ in self._bands) for row in rows])
+            if len(kept) != len(rows):
+                rows = [rows[idx] for idx in kept]
+                indexes = [indexes[idx] for idx in kept]
+        return rows, indexes
+
+    def messages(self, frame: Any, record: bool) -> Tuple[List[Any], Sequence[int]]:
+        """
+        Decodes the selected chunks of **frame** into dicts, or records if **record** is True, returning them
+        together with their indexes in the frame.
+        """
+        rows, indexes = self.rows(frame)
+        prefix = self._prefix_values
+        if record:
+            cls = self._record
+            new = tuple.__new__
+            return [new(cls, prefix + row) for row in rows], indexes
+        keys = self.keys
+        return [dict(zip(keys, prefix + row)) for row in rows], indexes
+
+    def columns(self, block: Any) -> Tuple[Dict[str, "np.ndarray"], "np.ndarray"]:
+        """
+        Decodes the selected chunks of **block** into columns, returning them together with their indexes in
+        the block.
+        """
+        chunks = len(block) // self._decoder.chunksize
+        start, step = self._select(chunks)
+        columns = self._decoder.to_columns_every(block, start, step)
+        indexes = _numpy().arange(start, chunks, step)
+        if self._bands:
+            keys = self._decoder.keys
+            kept = self._changed(zip(*(columns[keys[position]].tolist() for position, _ in self._bands)))
+            if len(kept) != len(indexes):
+                columns = {key: column[kept] for key, column in columns.items()}
+                indexes = indexes[kept]
+        return columns, indexes
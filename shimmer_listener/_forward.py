@@ -0,0 +1,433 @@
+"""
+Forwarding of the received messages to a network peer.
+
+A Forwarder sends the messages of every mote over a single TCP or Unix-domain connection. The receive loops only
+append the messages to a bounded queue: they are serialized and written by a background thread, which joins
+everything queued since its last write into a single buffer, so that a burst of messages costs one send call.
+The socket is non-blocking, a slow peer fills the bounded send buffer instead of stalling the receive loops,
+and the connection is re-established with an exponential backoff whenever it is lost.
+
+Two encodings are available: newline-delimited JSON, one object per message, and a compact length-prefixed
+binary encoding, where every group of consecutive messages of a mote with the same keys is sent as a record::
+
+    uint32   length of the rest of the record
+    uint8    mac length, followed by the utf-8 mac
+    uint8    key count, followed by the keys, each one as a uint8 length, the utf-8 key and a struct type code
+    uint32   message count, followed by the messages, each one packed as the struct format "<" + type codes
+
+All of the integers are little endian. Only numeric and boolean values are encoded (type codes "q", "d" and "?"),
+the type code of a key being the one that fits all of its values in the record: the keys with other values, such
+as the mac carried by the messages of master mode, are left out.
+"""
+
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+from threading import Condition, Thread
+from collections import deque
+from functools import partial
+import numbers
+import logging
+import random
+import select
+import socket
+import struct
+import json
+import enum
+import time
+
+
+class Encoding(enum.Enum):
+    """
+    Enum used to choose how a Forwarder serializes the messages.
+
+    - **JSON**: a JSON object per message, terminated by a newline, with the same keys as the message,
+        serialized as json.dumps does.
+    - **BINARY**: length-prefixed binary records, see the module documentation.
+    """
+
+    JSON = 0
+    BINARY = 1
+
+
+_u32 = struct.Struct("<I")
+
+
+def _groups(messages: Iterable[Any]) -> Iterator[Tuple[Tuple[str, ...], List[tuple]]]:
+    # Yields the keys and the rows of values of the messages, grouping consecutive messages with the same keys;
+    # messages can be dicts, records or dicts of numpy columns
+    keys: Optional[Tuple[str, ...]] = None
+    rows: List[tuple] = []
+    for message in messages:
+        if isinstance(message, tuple):
+            message_keys, values = message._fields, [tuple(message)]
+        else:
+            message_keys = tuple(message)
+            columns = list(message.values())
+            if columns and hasattr(columns[0], "tolist"):
+                values = list(zip(*(column.tolist() for column in columns)))
+            else:
+                values = [tuple(columns)]
+        if message_keys != keys:
+            if rows:
+                yield keys, rows
+            keys, rows = message_keys, []
+        rows.extend(values)
+    if rows:
+        yield keys, rows
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, bytes):
+        return value.decode("latin-1")
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+_json_encoder = json.JSONEncoder(default=_json_default)
+
+
+def encode_json(mac: str, messages: Iterable[Any], add_mac: bool = False) -> bytes:
+    """
+    Encodes the **messages** received from **mac** as newline-delimited JSON objects. If **add_mac** is True,
+    the mac is added to the messages that don't carry it already, as "mac".
+    """
+    lines = []
+    encode = _json_encoder.encode
+    for keys, rows in _groups(messages):
+        with_mac = add_mac and "mac" not in keys
+        for row in rows:
+            message = dict(zip(keys, row))
+            if with_mac:
+                message["mac"] = mac
+            lines.append(encode(message))
+    lines.append("")
+    return "\n".join(lines).encode()
+
+
+def _type_code(values: Iterable[Any]) -> Optional[str]:
+    # The type code fitting every value of a column, None if some of them are not numeric
+    code = "?"
+    for kind in set(map(type, values)):
+        if issubclass(kind, bool):
+            continue
+        if issubclass(kind, numbers.Integral):
+            if code == "?":
+                code = "q"
+        elif issubclass(kind, numbers.Real):
+            code = "d"
+        else:
+            return None
+    return code
+
+
+def encode_binary(mac: str, messages: Iterable[Any]) -> bytes:
+    """
+    Encodes the **messages** received from **mac** as length-prefixed binary records, see the module documentation.
+    """
+    encoded_mac = mac.encode()
+    records = []
+    for keys, rows in _groups(messages):
+        codes = [_type_code(column) for column in zip(*rows)]
+        kept = [idx for idx, code in enumerate(codes) if code is not None]
+        header = [struct.pack("<B", len(encoded_mac)), encoded_mac, struct.pack("<B", len(kept))]
+        for idx in kept:
+            key = keys[idx].encode()
+            header.append(struct.pack("<B", len(key)) + key + codes[idx].encode())
+        header.append(_u32.pack(len(rows)))
+        row_struct = struct.Struct("<" + "".join(codes[idx] for idx in kept))
+        if len(kept) == len(codes):
+            body = b"".join([row_struct.pack(*row) for row in rows])
+        else:
+            body = b"".join([row_struct.pack(*[row[idx] for idx in kept]) for row in rows])
+        record = b"".join(header) + body
+        records.append(_u32.pack(len(record)))
+        records.append(record)
+    return b"".join(records)
+
+
+def decode_binary(data: bytes) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+    """
+    Decodes the complete binary records contained in **data**, yielding the mac and the messages of each one.
+    """
+    view = memoryview(data)
+    offset = 0
+    while offset + _u32.size <= len(view):
+        length, = _u32.unpack_from(view, offset)
+        end = offset + _u32.size + length
+        if end > len(view):
+            return
+        pos = offset + _u32.size
+        mac_len = view[pos]
+        mac = bytes(view[pos + 1:pos + 1 + mac_len]).decode()
+        pos += 1 + mac_len
+        key_count = view[pos]
+        pos += 1
+        keys, codes = [], ""
+        for _ in range(key_count):
+            key_len = view[pos]
+            keys.append(bytes(view[pos + 1:pos + 1 + key_len]).decode())
+            codes += chr(view[pos + 1 + key_len])
+            pos += 2 + key_len
+        count, = _u32.unpack_from(view, pos)
+        pos += _u32.size
+        row_struct = struct.Struct("<" + codes)
+        if row_struct.size == 0:
+            yield mac, [{} for _ in range(count)]
+        else:
+            rows = row_struct.iter_unpack(view[pos:pos + count * row_struct.size])
+            yield mac, [dict(zip(keys, row)) for row in rows]
+        offset = end
+
+
+_encoders = {Encoding.JSON: encode_json, Encoding.BINARY: encode_binary}
+
+
+class Forwarder:
+    """
+    Forwards the messages of every mote to **address**, a (host, port) TCP address or the path of a Unix-domain
+    socket, over a single shared connection. Pass **on_message** and **on_batch** as the message and batch
+    handlers of the streams, or call **send** from your own handlers.
+
+    The messages wait in a queue of up to **max_pending** messages (a block of columns counting as one) and are
+    then encoded into a send buffer of up to **buffer_size** bytes; when either is full, as when the peer
+    can't keep up or is unreachable, the oldest queued messages are dropped and counted. After the connection is
+    lost, the n-th consecutive attempt to reconnect is made after **backoff_base** * 2 ^ (n - 1) seconds, capped
+    to **backoff_max**; what was left of a partially sent write is dropped, since the peer has lost it anyway.
+    """
+
+    def __init__(self, address: Union[Tuple[str, int], str], encoding: Encoding = Encoding.JSON,
+                 max_pending: int = 65536, buffer_size: int = 4 * 1024 * 1024, linger: float = 0.005,
+                 backoff_base: float = 0.5, backoff_max: float = 30.0, connect_timeout: float = 5.0,
+                 add_mac: bool = False):
+        """
+        Starts the sender thread, which connects to **address** in the background. Once woken up by new
+        messages, the thread waits **linger** seconds for more of them before encoding and sending. If
+        **add_mac** is True, the JSON messages carry the mac of their mote as "mac"; the binary records
+        always do.
+        """
+        if max_pending <= 0 or buffer_size <= 0:
+            raise ValueError("max_pending and buffer_size must be positive integers")
+        self._address = address
+        self._encode = partial(encode_json, add_mac=True) if add_mac and encoding == Encoding.JSON \
+            else _encoders[encoding]
+        self._max_pending = max_pending
+        self._buffer_size = buffer_size
+        self._linger = linger
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+        self._connect_timeout = connect_timeout
+
+        self._cond = Condition()
+        self._pending: Deque[Tuple[str, Sequence[Any]]] = deque()
+        self._pending_count = 0
+        self._waiting = False
+        self._closed = False
+        self._deadline: Optional[float] = None
+
+        # Owned by the sender thread: encoded chunks with their message count, and the bytes already
+        # sent of the first one
+        self._sock: Optional[socket.socket] = None
+        self._out: Deque[Tuple[bytes, int]] = deque()
+        self._out_bytes = 0
+        self._offset = 0
+        self._attempt = 0
+        self._retry_at = 0.0
+
+        self._sent_bytes = 0
+        self._sent_messages = 0
+        self._dropped = 0
+        self._reconnects = 0
+        self._connections = 0
+
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def send(self, mac: str, messages: Sequence[Any]) -> None:
+        """
+        Queues the **messages** of **mac** to be forwarded, without blocking.
+        """
+        with self._cond:
+            if self._closed:
+                return
+            self._pending.append((mac, messages))
+            self._pending_count += len(messages)
+            while self._pending_count > self._max_pending:
+                _, dropped = self._pending.popleft()
+                self._pending_count -= len(dropped)
+                self._dropped += len(dropped)
+            if self._waiting:
+                self._cond.notify()
+
+    def on_message(self, mac: str, message: Any) -> None:
+        """
+        Message handler forwarding **message**.
+        """
+        self.send(mac, (message,))
+
+    def on_batch(self, mac: str, batch: List[Any]) -> None:
+        """
+        Batch handler forwarding every message of **batch**.
+        """
+        self.send(mac, batch)
+
+    @property
+    def connected(self) -> bool:
+        return self._sock is not None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the forwarding statistics: whether the peer is connected, the bytes and messages sent,
+        the dropped messages, the reconnections and the messages and bytes waiting to be sent.
+        """
+        with self._cond:
+            return {"connected": self._sock is not None, "sent_bytes": self._sent_bytes,
+                    "sent_messages": self._sent_messages, "dropped": self._dropped, "reconnects": self._reconnects,
+                    "pending": self._pending_count, "buffered": self._out_bytes - self._offset}
+
+    def close(self, timeout: Optional[float] = 5.0) -> None:
+        """
+        Stops accepting messages and waits up to **timeout** seconds for the queued ones to be sent,
+        then closes the connection.
+        """
+        with self._cond:
+            if not self._closed:
+                self._closed = True
+                self._deadline = None if timeout is None else time.monotonic() + timeout
+                self._cond.notify()
+        self._thread.join()
+
+    def _take(self) -> Optional[Deque[Tuple[str, Sequence[Any]]]]:
+        # Waits for something to do, returning the queued messages, or None when the thread should exit
+        with self._cond:
+            while True:
+                idle = not self._pending and not self._out
+                if self._closed and (idle or self._deadline is not None and time.monotonic() >= self._deadline):
+                    return None
+                if not idle and (self._sock is not None or time.monotonic() >= self._retry_at):
+                    break
+                if idle:
+                    timeout = None
+                else:
+                    timeout = self._retry_at - time.monotonic()
+                if self._closed and self._deadline is not None:
+                    remaining = self._deadline - time.monotonic()
+                    timeout = remaining if timeout is None else min(timeout, remaining)
+                self._waiting = True
+                self._cond.wait(timeout)
+                self._waiting = False
+                if self._pending and self._linger > 0 and not self._closed:
+                    self._cond.wait(self._linger)
+            pending, self._pending = self._pending, deque()
+            self._pending_count = 0
+            return pending
+
+    def _buffer(self, pending: Deque[Tuple[str, Sequence[Any]]]) -> None:
+        # Encodes the queued messages into a single chunk, dropping the oldest chunks if the buffer is full
+        parts, count = [], 0
+        for mac, messages in pending:
+            try:
+                parts.append(self._encode(mac, messages))
+                count += len(messages)
+            except (TypeError, ValueError, struct.error) as err:
+                logging.error(f"cannot forward the messages of {mac}: {err}")
+                self._drop(len(messages))
+        if not parts:
+            return
+        chunk = b"".join(parts)
+        with self._cond:
+            self._out.append((chunk, count))
+            self._out_bytes += len(chunk)
+            # The partially sent chunk is kept, so that the peer never gets a truncated record
+            oldest = 1 if self._offset else 0
+            while self._out_bytes > self._buffer_size and len(self._out) > oldest:
+                dropped, dropped_count = self._out[oldest]
+                del self._out[oldest]
+                self._out_bytes -= len(dropped)
+                self._dropped += dropped_count
+
+    def _drop(self, count: int) -> None:
+        with self._cond:
+            self._dropped += count
+
+    def _connect(self) -> None:
+        if isinstance(self._address, str):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self._connect_timeout)
+            sock.connect(self._address)
+            sock.setblocking(False)
+        except OSError as err:
+            sock.close()
+            self._attempt += 1
+            delay = min(self._backoff_max, self._backoff_base * 2 ** (self._attempt - 1))
+            self._retry_at = time.monotonic() + delay * random.uniform(0.5, 1.5)
+            logging.debug(f"cannot connect to {self._address}: {err}, retrying in {delay:.1f} s")
+            return
+        if isinstance(self._address, tuple):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self._cond:
+            self._attempt = 0
+            if self._connections > 0:
+                self._reconnects += 1
+            self._connections += 1
+            self._sock = sock
+
+    def _disconnect(self, err: OSError) -> None:
+        logging.warning(f"connection to {self._address} lost: {err}")
+        with self._cond:
+            self._sock.close()
+            self._sock = None
+            self._retry_at = 0.0
+            if self._offset:
+                chunk, count = self._out.popleft()
+                self._out_bytes -= len(chunk)
+                self._dropped += count
+                self._offset = 0
+
+    def _write(self) -> None:
+        # Writes as much of the buffered data as the socket accepts, waiting for it to be writable
+        # for a short time, so that new messages keep being encoded while the peer is slow
+        while self._out:
+            chunk, count = self._out[0]
+            try:
+                sent = self._sock.send(memoryview(chunk)[self._offset:])
+            except (BlockingIOError, InterruptedError):
+                select.select([], [self._sock], [], 0.05)
+                return
+            except OSError as err:
+                self._disconnect(err)
+                return
+            with self._cond:
+                self._offset += sent
+                self._sent_bytes += sent
+                if self._offset == len(chunk):
+                    self._out.popleft()
+                    self._out_bytes -= len(chunk)
+                    self._offset = 0
+                    self._sent_messages += count
+
+    def _run(self) -> None:
+        while True:
+            pending = self._take()
+            if pending is None:
+                break
+            self._buffer(pending)
+            if self._sock is None and time.monotonic() >= self._retry_at:
+                self._connect()
+            if self._sock is not None:
+                self._write()
+
+        with self._cond:
+            if self._sock is not None:
+                self._sock.close()
+                self._sock = None
+            for _, count in self._out:
+                self._dropped += count
+            self._dropped += self._pending_count
+            self._pending.clear()
+            self._pending_count = 0
+            self._out.clear()
+            self._out_bytes = 0
+            self._offset = 0
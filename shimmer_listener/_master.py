@@ -3,17 +3,20 @@ General idea:
 - A thread keeps searching for bluetooth slaves that can be shimmer devices (*)
 - When it finds 1+, it tries to pair with them, if it manages to, it spawns
     a new thread that manages the data transfer for that node.
+- Shimmer devices are stored in a registry, so that they are connected directly in the following
+    iterations (or after a restart, if the registry is persisted), without waiting for the scan.
 
 (*) devices with an ID starting with "RN42" are shimmer devices
 """
 
-from typing import Optional, Callable, Any, Dict, Union
-from threading import Lock
-import bluetooth
+from typing import Optional, Callable, Any, Dict, List
+from threading import Event, Lock
 import logging
-import time
 
-from ._streams import BtSlaveInputStream, Frameinfo
+from ._streams import BtSlaveInputStream, Frameinfo, _setup_stream, _join_streams, _deadline, _remaining
+from ._registry import DeviceRegistry
+from ._supervisor import Supervisor
+from ._transport import _bluetooth
 
 # Lookup duration for the scan operation by the master
 # The RF port to use is the number 1
@@ -23,30 +26,68 @@ _def_scan_interval = 5
 
 # App name to frameinfo mapping
 _discovering = True
+# Set by _master_close, to interrupt the wait between two scans
+_closing = Event()
 
 
 # This list contains a reference to each open connection
 _open_conn: Dict[str, BtSlaveInputStream] = {}
 _mutex = Lock()
 
+# Known devices, used when no registry is passed to bt_listen
+_def_registry = DeviceRegistry()
+
+# Reconnects the lost motes, if enabled
+_supervisor: Optional[Supervisor] = None
+
+
+def _master_init():
+    global _discovering
+    _discovering = True
+    _closing.clear()
+
 
 def _close_stream(mac: str):
     with _mutex:
         _open_conn.pop(mac, None)
 
 
-def _close_streams():
-    for _, stream in _open_conn.items():
-        if stream.open:
-            stream.stop()
+def _close_streams() -> List[BtSlaveInputStream]:
+    # Stops every stream, returning them; their disconnect handlers remove them from _open_conn meanwhile.
+    # The ones still connecting are aborted, so that they don't wait for the presentation frame
+    with _mutex:
+        streams = list(_open_conn.values())
+    for stream in streams:
+        stream.stop()
+        stream._abort()
+    return streams
 
 
 def _master_listen(connect_handle: Optional[Callable[[str, Frameinfo], None]] = None,
                    message_handle: Optional[Callable[[str, Dict[str, Any]], None]] = None,
                    disconnect_handle: Optional[Callable[[str, bool], None]] = None,
-                   **kwargs: Union[str, float]) -> None:
+                   batch_handle: Optional[Callable[[str, List[Dict[str, Any]]], None]] = None,
+                   **kwargs: Any) -> None:
     lookup_duration = kwargs["lookup_duration"] if "lookup_duration" in kwargs else _def_lookup_duration
     scan_interval = kwargs["scan_interval"] if "scan_interval" in kwargs else _def_scan_interval
+    reactor = kwargs.get("reactor")
+    registry = kwargs.get("registry", _def_registry)
+    if isinstance(registry, str):
+        registry = DeviceRegistry(registry)
+
+    global _supervisor
+    reconnect = kwargs.get("reconnect")
+    if reconnect and _supervisor is None:
+        options = reconnect if isinstance(reconnect, dict) else {}
+        _supervisor = Supervisor(reconnect=lambda mac: open_stream(mac), **options)
+
+    # The last frameinfo of each mote is stored in the registry
+    def capture_connect(mac, info):
+        registry.update_info(mac, info)
+        if _supervisor is not None:
+            _supervisor.connected(mac)
+        if connect_handle:
+            connect_handle(mac, info)
 
     # We need to add a way to delete the stream from the open ones when it disconnects, so
     # we modify the passed disconnect handler to have a call to the local private _close_stream
@@ -54,32 +95,66 @@ def _master_listen(connect_handle: Optional[Callable[[str, Frameinfo], None]] =
         if disconnect_handle:
             disconnect_handle(mac, lost)
         _close_stream(mac)
-
+        if lost and _supervisor is not None and _discovering:
+            _supervisor.lost(mac)
+
+    def capture_error(stream, err):
+        logging.error(err)
+        _close_stream(stream._mac)
+        if _supervisor is not None and _discovering:
+            _supervisor.lost(stream._mac, failed=True)
+
+    def open_stream(mac):
+        with _mutex:
+            if mac in _open_conn or not _discovering:
+                return
+            in_stream = BtSlaveInputStream(mac=mac)
+            _open_conn[mac] = in_stream
+        logging.info(f"Pairing with {mac}..")
+        _setup_stream(in_stream, capture_connect, message_handle, capture_disconnect, batch_handle, **kwargs)
+        if _supervisor is not None:
+            _supervisor.watch(in_stream)
+        if reactor is not None:
+            reactor.add(in_stream, on_error=capture_error)
+        else:
+            in_stream.start(on_error=capture_error)
+
+    bluetooth = _bluetooth()
     while _discovering:
+        # Known motes are connected right away, in parallel, without waiting for the scan
+        # (the ones waiting for a reconnection attempt are left to the supervisor)
+        for mac in registry.shimmer_devices():
+            if _supervisor is None or not _supervisor.pending(mac):
+                open_stream(mac)
+
+        # The scan is only needed to find new devices: their names are looked up just once
         # flush_cache=True, lookup_class=False possible fix to script as exec bug?
-        found_devices = bluetooth.discover_devices(duration=lookup_duration, lookup_names=True)
-        for device in found_devices:
-            logging.info(f"Found device with MAC {device[0]}, ID {device[1]}")
-            if _is_shimmer_device(device[1]):
-                try:
-                    if device[0] not in _open_conn:
-                        logging.info(f"Pairing with {device[0]}..")
-                        in_stream = BtSlaveInputStream(mac=device[0])
-                        in_stream.on_connect = connect_handle
-                        in_stream.on_message = message_handle
-                        in_stream.on_disconnect = capture_disconnect
-                        in_stream.start()
-                        with _mutex:
-                            _open_conn[device[0]] = in_stream
-                except bluetooth.btcommon.BluetoothError as err:
-                    logging.error(err)
-        time.sleep(scan_interval)
-
-
-def _master_close():
-    global _discovering
+        try:
+            found_devices = bluetooth.discover_devices(duration=lookup_duration, lookup_names=False)
+        except bluetooth.btcommon.BluetoothError as err:
+            logging.error(err)
+            found_devices = []
+        for mac in found_devices:
+            if registry.is_shimmer(mac, bluetooth.lookup_name, _is_shimmer_device) and mac not in _open_conn:
+                logging.info(f"Found device with MAC {mac}, ID {registry.get(mac)['name']}")
+                if _supervisor is None or not _supervisor.pending(mac):
+                    open_stream(mac)
+        _closing.wait(scan_interval)
+
+
+def _master_close(timeout: Optional[float] = None) -> List[str]:
+    global _discovering, _supervisor
+    deadline = _deadline(timeout)
     _discovering = False
-    _close_streams()
+    _closing.set()
+    if _supervisor is not None:
+        _supervisor.close(_remaining(deadline))
+        _supervisor = None
+    return _join_streams(_close_streams(), deadline)
+
+
+def _master_supervisor() -> Optional[Supervisor]:
+    return _supervisor
 
 
 def _is_shimmer_device(bt_id: str) -> bool:
@@ -0,0 +1,243 @@
+"""
+Runtime metrics of the streams.
+
+Metrics are disabled by default: a stream only counts the received bytes, the decoded frames and the time spent in
+its callbacks when a StreamMetrics is attached to it, so that the reception of an uninstrumented stream pays no more
+than a None check. The metrics of every mote can be collected in a Metrics registry, which outlives the single
+connections, and served in the Prometheus text format through a MetricsExporter.
+"""
+
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+from threading import Lock, Thread
+from bisect import bisect_left
+import time
+
+from ._transport import Transport, _TransportWrapper
+
+
+class Histogram:
+    """
+    Cumulative histogram of observed values, with fixed bucket upper bounds.
+    """
+
+    _def_buckets = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+    def __init__(self, buckets: Iterable[float] = _def_buckets):
+        """
+        Initializes an empty histogram with the given bucket upper bounds, an infinite bound is always added.
+        """
+        self._bounds = sorted(buckets)
+        self._counts = [0] * (len(self._bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self._counts[bisect_left(self._bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def buckets(self) -> List[Tuple[float, int]]:
+        """
+        Returns the (upper bound, cumulative count) pairs of the histogram, the last bound being infinite.
+        """
+        cumulative = 0
+        result = []
+        for bound, count in zip(self._bounds + [float("inf")], self._counts):
+            cumulative += count
+            result.append((bound, cumulative))
+        return result
+
+
+class StreamMetrics:
+    """
+    Counters of a single mote: received bytes and recv calls, decoded frames and chunks, decode errors, frames
+    failing their CRC, resynchronizations and the bytes skipped to find the next valid frame, and a histogram
+    of the time spent in the callbacks.
+    """
+
+    def __init__(self):
+        self.bytes = 0
+        self.recv_calls = 0
+        self.frames = 0
+        self.chunks = 0
+        self.decode_errors = 0
+        self.crc_errors = 0
+        self.resyncs = 0
+        self.skipped_bytes = 0
+        self.callback_time = Histogram()
+        self._timed: Dict[Callable, Callable] = {}
+
+    def timed(self, callback: Callable) -> Callable:
+        """
+        Returns a wrapper of **callback** recording its duration; the same wrapper is returned
+        for the same callback, so that queued invocations can still be coalesced.
+        """
+        wrapper = self._timed.get(callback)
+        if wrapper is None:
+            def wrapper(*args: Any) -> None:
+                start = time.perf_counter()
+                try:
+                    callback(*args)
+                finally:
+                    self.callback_time.observe(time.perf_counter() - start)
+            self._timed[callback] = wrapper
+        return wrapper
+
+    def stats(self) -> Dict[str, Any]:
+        return {"bytes": self.bytes, "recv_calls": self.recv_calls, "frames": self.frames, "chunks": self.chunks,
+                "decode_errors": self.decode_errors, "crc_errors": self.crc_errors, "resyncs": self.resyncs,
+                "skipped_bytes": self.skipped_bytes, "callbacks": self.callback_time.count,
+                "callback_time": self.callback_time.sum}
+
+
+class _MeteredTransport(_TransportWrapper):
+    # Wraps the transport of a stream, counting the received bytes and the recv calls
+
+    def __init__(self, transport: Transport, metrics: StreamMetrics):
+        super().__init__(transport)
+        self._metrics = metrics
+
+    def recv_into(self, buffer: Any, nbytes: int = 0) -> int:
+        received = self._transport.recv_into(buffer, nbytes)
+        self._metrics.recv_calls += 1
+        self._metrics.bytes += received
+        return received
+
+
+class Metrics:
+    """
+    Registry of the StreamMetrics of every mote, kept across reconnections. Queue depths and reconnections,
+    which are tracked by the Dispatcher and the Supervisor, are merged in by the **sources** passed to
+    **add_source**.
+    """
+
+    def __init__(self):
+        self._mutex = Lock()
+        self._motes: Dict[str, StreamMetrics] = {}
+        self._sources: List[Callable[[], Dict[str, Dict[str, Any]]]] = []
+
+    def mote(self, mac: str) -> StreamMetrics:
+        """
+        Returns the metrics of the mote, creating them the first time.
+        """
+        with self._mutex:
+            metrics = self._motes.get(mac)
+            if metrics is None:
+                metrics = self._motes[mac] = StreamMetrics()
+            return metrics
+
+    def add_source(self, source: Callable[[], Dict[str, Dict[str, Any]]]) -> None:
+        """
+        Adds a function returning further statistics by mac, such as Dispatcher.stats.
+        """
+        with self._mutex:
+            self._sources.append(source)
+
+    def histograms(self) -> Dict[str, Histogram]:
+        """
+        Returns the callback time histogram of each mote.
+        """
+        with self._mutex:
+            return {mac: metrics.callback_time for mac, metrics in self._motes.items()}
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns the statistics of each mote, see StreamMetrics and the added sources.
+        """
+        with self._mutex:
+            result = {mac: metrics.stats() for mac, metrics in self._motes.items()}
+            sources = list(self._sources)
+        for source in sources:
+            for mac, stats in source().items():
+                result.setdefault(mac, {}).update(stats)
+        return result
+
+
+# Prometheus metric name, type, help text and key in the stats of each mote
+_exported = [
+    ("shimmer_received_bytes_total", "counter", "Bytes received from the mote", "bytes"),
+    ("shimmer_recv_calls_total", "counter", "Reads performed on the connection with the mote", "recv_calls"),
+    ("shimmer_frames_total", "counter", "Frames decoded", "frames"),
+    ("shimmer_chunks_total", "counter", "Chunks decoded", "chunks"),
+    ("shimmer_decode_errors_total", "counter", "Frames that couldn't be decoded", "decode_errors"),
+    ("shimmer_crc_errors_total", "counter", "Frames whose CRC didn't match", "crc_errors"),
+    ("shimmer_resyncs_total", "counter", "Frame boundaries lost and searched again", "resyncs"),
+    ("shimmer_skipped_bytes_total", "counter", "Bytes skipped searching a valid frame", "skipped_bytes"),
+    ("shimmer_queue_depth", "gauge", "Messages waiting in the dispatcher queue", "depth"),
+    ("shimmer_dropped_total", "counter", "Messages dropped by the dispatcher", "dropped"),
+    ("shimmer_reconnects_total", "counter", "Reconnections after a lost connection", "reconnects"),
+]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text(metrics: Metrics) -> str:
+    """
+    Renders the metrics in the Prometheus text exposition format.
+    """
+    stats = metrics.stats()
+    lines = []
+    for name, kind, help_text, key in _exported:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for mac, mote_stats in sorted(stats.items()):
+            if mote_stats.get(key) is not None:
+                lines.append(f'{name}{{mac="{_escape(mac)}"}} {mote_stats[key]}')
+
+    name = "shimmer_callback_seconds"
+    lines.append(f"# HELP {name} Time spent in the callbacks")
+    lines.append(f"# TYPE {name} histogram")
+    for mac, histogram in sorted(metrics.histograms().items()):
+        label = f'mac="{_escape(mac)}"'
+        for bound, count in histogram.buckets():
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'{name}_bucket{{{label},le="{le}"}} {count}')
+        lines.append(f"{name}_sum{{{label}}} {histogram.sum}")
+        lines.append(f"{name}_count{{{label}}} {histogram.count}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """
+    Serves the metrics in the Prometheus text format at http://**host**:**port**/metrics, from a background thread.
+    """
+
+    def __init__(self, metrics: Metrics, port: int, host: str = "127.0.0.1"):
+        """
+        Starts serving **metrics**; pass **port** = 0 to bind a free port, see **port**.
+        """
+        # Imported here, since the http server is slow to import and most processes never export the metrics
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+        from socketserver import ThreadingMixIn
+
+        class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = prometheus_text(metrics).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,242 @@
+"""
+Execution of the user callbacks in worker processes.
+
+A ProcessPool runs the callbacks in a pool of worker processes, so that heavy handlers don't compete for the GIL
+with the receive loops. The events of each mote are always sent to the same worker, chosen by hashing its mac,
+so that they are handled in order of arrival, connect and disconnect included. The receiving threads only append
+the invocations to a bounded queue for each worker: a sender thread ships everything queued since its last
+send as a single batch, so that the messages of a frame, or of a burst of frames, cost one IPC round.
+
+Callbacks are wrapped through **remote** before being set on the streams; they are pickled once, when wrapped,
+and must therefore be picklable, e.g. module level functions. Messages in MessageFormat.RECORD and COLUMNS
+can be pickled as well as dicts.
+"""
+
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from threading import Condition, Lock, Thread
+from collections import deque
+import multiprocessing
+import logging
+import signal
+import pickle
+import time
+import zlib
+
+from ._dispatch import EventKind, OverflowPolicy
+
+
+def _serve(inbox: "multiprocessing.Queue") -> None:
+    # Main loop of a worker process
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    handlers: Dict[int, Callable] = {}
+    while True:
+        batch = inbox.get()
+        if batch is None:
+            return
+        for handler_id, args in batch:
+            if handler_id is None:
+                handlers[args[0]] = pickle.loads(args[1])
+                continue
+            try:
+                handlers[handler_id](*args)
+            except Exception:
+                logging.exception(f"BT MAC {args[0] if args else None}: error in callback")
+
+
+class _Remote:
+    # Stand-in for a callback running in the workers, queueing its invocations
+
+    __slots__ = ("_pool", "_id", "_message")
+
+    def __init__(self, pool: "ProcessPool", handler_id: int, kind: EventKind):
+        self._pool = pool
+        self._id = handler_id
+        self._message = kind is not EventKind.EVENT
+
+    def __call__(self, mac: str, *args: Any) -> None:
+        self._pool._submit(mac, self._id, (mac,) + args, self._message)
+
+
+class _Shard:
+    def __init__(self, inbox: "multiprocessing.Queue", process: "multiprocessing.Process", lock: Lock):
+        self.inbox = inbox
+        self.process = process
+        self.ready = Condition(lock)
+        self.items: Deque[Tuple[Optional[int], tuple, bool]] = deque()
+        self.messages = 0
+
+
+class _MoteStats:
+    def __init__(self):
+        self.depth = 0
+        self.max_depth = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"depth": self.depth, "max_depth": self.max_depth, "delivered": self.delivered,
+                "dropped": self.dropped}
+
+
+class ProcessPool:
+    """
+    Runs the callbacks wrapped through **remote** in **workers** processes, each one fed by a queue holding up to
+    **queue_size** messages of the motes assigned to it before applying the **overflow** policy, which can't be
+    OverflowPolicy.COALESCE; connect and disconnect events are never dropped. Processes are started with the
+    given multiprocessing **start_method**, the platform default if None. Pass the **processes** option to
+    bt_listen to have the handlers run in a pool.
+    """
+
+    # Maximum number of batches waiting to be read by a worker before its sender thread waits for it
+    _inbox_size = 16
+
+    def __init__(self, workers: Optional[int] = None, queue_size: int = 1024,
+                 overflow: OverflowPolicy = OverflowPolicy.BLOCK, start_method: Optional[str] = None):
+        """
+        Starts the worker processes, as many as the CPUs if **workers** is None, and their sender threads.
+        """
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        if workers <= 0:
+            raise ValueError("the number of workers must be a positive integer")
+        if queue_size <= 0:
+            raise ValueError("queue_size must be a positive integer")
+        if overflow is OverflowPolicy.COALESCE:
+            raise ValueError("a ProcessPool can't coalesce the queued messages")
+        self._queue_size = queue_size
+        self._overflow = overflow
+        # The condition of the pool signals free space and closing, the one of each shard new items
+        self._lock = Lock()
+        self._cond = Condition(self._lock)
+        self._closed = False
+        self._handlers = 0
+        self._motes: Dict[str, _MoteStats] = {}
+
+        context = multiprocessing.get_context(start_method)
+        self._shards: List[_Shard] = []
+        for _ in range(workers):
+            inbox = context.Queue(self._inbox_size)
+            process = context.Process(target=_serve, args=(inbox,), daemon=True)
+            process.start()
+            self._shards.append(_Shard(inbox, process, self._lock))
+        self._senders = [Thread(target=self._send, args=(shard,), daemon=True) for shard in self._shards]
+        for sender in self._senders:
+            sender.start()
+
+    @property
+    def workers(self) -> int:
+        return len(self._shards)
+
+    def remote(self, callback: Optional[Callable], kind: EventKind = EventKind.MESSAGE) -> Optional[Callable]:
+        """
+        Returns a callable that runs **callback** in the worker assigned to the mac it is called with, or None
+        if **callback** is None. The invocations of the message and batch handlers (**kind** = EventKind.MESSAGE
+        or EventKind.BATCH) are subject to the overflow policy, those of the others (EventKind.EVENT) are not.
+        Raises the error raised by pickle if **callback** can't be sent to the workers.
+        """
+        if callback is None:
+            return None
+        pickled = pickle.dumps(callback)
+        with self._cond:
+            handler_id = self._handlers
+            self._handlers += 1
+            for shard in self._shards:
+                shard.items.append((None, (handler_id, pickled), False))
+                shard.ready.notify()
+        return _Remote(self, handler_id, kind)
+
+    def _shard(self, mac: str) -> _Shard:
+        return self._shards[zlib.crc32(mac.encode()) % len(self._shards)]
+
+    def _submit(self, mac: str, handler_id: int, args: tuple, message: bool) -> None:
+        with self._cond:
+            if self._closed:
+                return
+            shard = self._shard(mac)
+            mote = self._motes.get(mac)
+            if mote is None:
+                mote = self._motes[mac] = _MoteStats()
+            if message and shard.messages >= self._queue_size:
+                if self._overflow is OverflowPolicy.BLOCK:
+                    while shard.messages >= self._queue_size and not self._closed:
+                        self._cond.wait()
+                elif self._overflow is OverflowPolicy.DROP_NEWEST:
+                    mote.dropped += 1
+                    return
+                else:
+                    self._drop_oldest(shard)
+            shard.items.append((handler_id, args, message))
+            if message:
+                shard.messages += 1
+                mote.depth += 1
+                mote.max_depth = max(mote.max_depth, mote.depth)
+            shard.ready.notify()
+
+    def _drop_oldest(self, shard: _Shard) -> None:
+        # Called with the condition lock held
+        for idx, (handler_id, args, message) in enumerate(shard.items):
+            if message:
+                del shard.items[idx]
+                shard.messages -= 1
+                mote = self._motes[args[0]]
+                mote.depth -= 1
+                mote.dropped += 1
+                return
+
+    def _send(self, shard: _Shard) -> None:
+        while True:
+            with self._cond:
+                while not shard.items and not self._closed:
+                    shard.ready.wait()
+                if not shard.items:
+                    break
+                items, shard.items = shard.items, deque()
+                for handler_id, args, message in items:
+                    if message:
+                        mote = self._motes[args[0]]
+                        mote.depth -= 1
+                        mote.delivered += 1
+                shard.messages = 0
+                self._cond.notify_all()
+            batch = [(handler_id, args) for handler_id, args, _ in items]
+            try:
+                shard.inbox.put(batch)
+            except (ValueError, OSError):
+                # The inbox was closed by a forced shutdown
+                return
+            except Exception:
+                logging.exception("cannot send the events to a worker process")
+        shard.inbox.put(None)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Returns, for each mote, the current and maximum number of its messages waiting to be sent to the workers,
+        and the number of messages sent and dropped.
+        """
+        with self._cond:
+            return {mac: mote.stats() for mac, mote in self._motes.items()}
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """
+        Sends the queued events to the workers and waits up to **timeout** seconds (forever if None) for them
+        to be handled, then terminates the workers that are still running. Returns False if any was terminated.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            for shard in self._shards:
+                shard.ready.notify()
+        drained = True
+        for sender, shard in zip(self._senders, self._shards):
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            sender.join(remaining)
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            shard.process.join(remaining)
+            if shard.process.is_alive():
+                drained = False
+                shard.process.terminate()
+                shard.process.join()
+            shard.inbox.cancel_join_thread()
+            shard.inbox.close()
+        return drained
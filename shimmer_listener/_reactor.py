@@ -0,0 +1,184 @@
+"""
+Single threaded I/O loop serving many streams at once.
+
+Instead of a thread blocking in recv for each mote, a Reactor multiplexes every stream socket with the best
+selector available on the platform (epoll on Linux) and feeds the received data to the decoding of the stream
+it belongs to. Only the connection to a mote and the reading of its presentation frame, which are blocking,
+run in a short-lived thread, before the stream is handed over to the reactor thread.
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from threading import Lock, Thread
+import selectors
+import logging
+import socket
+import struct
+
+from ._buffer import FrameBuffer
+from ._streams import BtStream
+
+
+class Reactor:
+    """
+    Serves the sockets of many BtStreams from a single thread. Streams are added through **add**, which opens
+    them and starts reading their data from the reactor thread; stopping a stream or closing the reactor
+    disconnects it, as it would happen with a stream started through **BtStream.start**.
+    """
+
+    # Maximum time in seconds between two checks of the stopped streams and of the batch deadlines
+    _poll_interval = 0.5
+
+    def __init__(self):
+        """
+        Starts the reactor thread.
+        """
+        self._selector = selectors.DefaultSelector()
+        self._mutex = Lock()
+        self._pending: List[Tuple[BtStream, FrameBuffer]] = []
+        self._streams: Dict[Any, Tuple[BtStream, FrameBuffer]] = {}
+        self._closing = False
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ)
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def streams(self) -> List[BtStream]:
+        """
+        The streams currently served by the reactor.
+        """
+        with self._mutex:
+            return [stream for stream, _ in self._streams.values()]
+
+    def add(self, stream: BtStream, on_error: Optional[Callable[[BtStream, Exception], None]] = None) -> None:
+        """
+        Opens **stream** in a short-lived thread, then serves it from the reactor thread. If the stream can't
+        be opened, **on_error** is called with the stream and the raised exception.
+        """
+        stream._serving()
+        Thread(target=self._open, args=(stream, on_error)).start()
+
+    def _open(self, stream: BtStream, on_error: Optional[Callable[[BtStream, Exception], None]]) -> None:
+        try:
+            buffer = stream._open()
+        except (OSError, ValueError, struct.error) as err:
+            logging.error(f"BT MAC {stream._mac}: couldn't open the stream ({err})")
+            if stream._running:
+                stream._finish(lost=True)
+            else:
+                stream._transport.close()
+                stream._done.set()
+            if on_error:
+                on_error(stream, err)
+            return
+        self.register(stream, buffer)
+
+    def register(self, stream: BtStream, buffer: FrameBuffer) -> None:
+        """
+        Serves an already opened stream from the reactor thread, reading its data into **buffer**.
+        """
+        stream._transport.setblocking(False)
+        with self._mutex:
+            if self._closing:
+                closing = True
+            else:
+                closing = False
+                self._pending.append((stream, buffer))
+        if closing:
+            stream._finish(lost=False)
+        else:
+            self._wakeup()
+
+    def _wakeup(self) -> None:
+        try:
+            self._wakeup_w.send(b"\x00")
+        except OSError:
+            pass
+
+    def _run(self) -> None:
+        timeout = self._poll_interval
+        while True:
+            for key, _ in self._selector.select(timeout):
+                if key.fileobj is self._wakeup_r:
+                    try:
+                        self._wakeup_r.recv(1024)
+                    except OSError:
+                        pass
+                    continue
+                self._read(key.fileobj, *key.data)
+            timeout = self._flush_batches()
+            if not self._sync():
+                return
+
+    def _flush_batches(self) -> float:
+        # Delivers the partial batches whose deadline expired, returning the time to wait for the next one
+        timeout = self._poll_interval
+        with self._mutex:
+            served = list(self._streams.values())
+        for stream, _ in served:
+            left = stream._batch_deadline()
+            if left is None:
+                continue
+            if left == 0:
+                try:
+                    stream._flush_batch()
+                except Exception:
+                    logging.exception(f"BT MAC {stream._mac}: error while processing the received data")
+            elif left < timeout:
+                timeout = left
+        return timeout
+
+    def _read(self, transport: Any, stream: BtStream, buffer: FrameBuffer) -> None:
+        try:
+            if buffer.fill(transport) == 0:
+                raise ConnectionResetError("connection closed by the peer")
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            # A stopped stream is woken up by the shutdown of its transport
+            self._drop(stream, lost=stream._running)
+            return
+        try:
+            stream._process(buffer)
+        except Exception:
+            # A failing callback must not stop the other streams served by the reactor
+            logging.exception(f"BT MAC {stream._mac}: error while processing the received data")
+
+    def _drop(self, stream: BtStream, lost: bool) -> None:
+        with self._mutex:
+            self._streams.pop(stream._transport, None)
+        self._selector.unregister(stream._transport)
+        stream._finish(lost)
+
+    def _sync(self) -> bool:
+        # Registers the new streams and drops the stopped ones, returns False when the reactor must exit
+        with self._mutex:
+            pending, self._pending = self._pending, []
+            closing = self._closing
+            for stream, buffer in pending:
+                self._streams[stream._transport] = (stream, buffer)
+                self._selector.register(stream._transport, selectors.EVENT_READ, (stream, buffer))
+            served = list(self._streams.values())
+
+        for stream, _ in served:
+            if closing or not stream._running:
+                self._drop(stream, lost=False)
+        if closing:
+            self._selector.close()
+            self._wakeup_r.close()
+            self._wakeup_w.close()
+        return not closing
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """
+        Disconnects every served stream and stops the reactor thread, waiting up to **timeout** seconds
+        (forever if None). Returns False if the thread didn't stop in time.
+        """
+        with self._mutex:
+            if self._closing:
+                return not self._thread.is_alive()
+            self._closing = True
+        self._wakeup()
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
@@ -0,0 +1,230 @@
+"""
+Recording and replay of the raw data received from the motes.
+
+A Recorder appends every read performed by the streams, presentation frame included, to a compact binary log,
+each with the monotonic time of the read and the mac of the mote. A Replayer feeds such a log back through the
+decoding of the streams, calling the same callbacks as bt_listen, either respecting the original timing (scaled
+by a speed factor) or as fast as the callbacks can consume the data.
+
+The log starts with an 8 bytes magic string, followed by records made of a fixed header (record kind,
+timestamp in nanoseconds, mac length, payload length), the mac and the payload. An OPEN record, whose payload
+is the kind of stream, is written before the data of each connection and a CLOSE record after it.
+"""
+
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional
+from collections import namedtuple
+from threading import Lock, Thread
+import logging
+import struct
+import enum
+import time
+import os
+
+from ._decoding import Frameinfo
+from ._transport import Transport, PipeTransport, _TransportWrapper
+
+
+_magic = b"SHMLOG1\n"
+_header = struct.Struct("<BqBI")
+
+
+class RecordKind(enum.Enum):
+    """
+    Kind of a record of the log.
+    """
+
+    OPEN = 0
+    DATA = 1
+    CLOSE = 2
+
+
+LogRecord = namedtuple("LogRecord", ["kind", "timestamp", "mac", "data"])
+"""A record of the log, with its timestamp in nanoseconds"""
+
+
+def _now_ns() -> int:
+    return int(time.monotonic() * 1e9)
+
+
+class Recorder:
+    """
+    Appends the raw data received by the streams to the binary log at **path**. A single recorder can be
+    shared by every stream, see BtStream.recorder.
+    """
+
+    def __init__(self, path: str):
+        """
+        Opens the log at **path** for appending, creating it if needed. Raises ValueError if the file
+        exists but is not a log.
+        """
+        self._path = path
+        self._mutex = Lock()
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "rb") as f:
+                if f.read(len(_magic)) != _magic:
+                    raise ValueError(f"{path} is not a shimmer-listener log")
+            self._file: Optional[BinaryIO] = open(path, "ab")
+        else:
+            self._file = open(path, "ab")
+            self._file.write(_magic)
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def write(self, kind: RecordKind, mac: str, data: bytes = b"", timestamp: Optional[int] = None) -> None:
+        """
+        Appends a record, timestamped now if **timestamp** is not passed.
+        """
+        encoded_mac = mac.encode()
+        header = _header.pack(kind.value, _now_ns() if timestamp is None else timestamp,
+                              len(encoded_mac), len(data))
+        with self._mutex:
+            if self._file is None:
+                return
+            self._file.write(header)
+            self._file.write(encoded_mac)
+            self._file.write(data)
+
+    def flush(self) -> None:
+        with self._mutex:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self) -> None:
+        with self._mutex:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class _RecordingTransport(_TransportWrapper):
+    # Wraps the transport of a stream, logging every byte that is read from it. The OPEN record is
+    # written by the first read, so that wrapping a transport that is never used leaves no trace
+
+    def __init__(self, transport: Transport, recorder: Recorder, mac: str, stream_kind: str):
+        super().__init__(transport)
+        self._recorder = recorder
+        self._mac = mac
+        self._stream_kind = stream_kind
+        self._opened = False
+
+    def recv_into(self, buffer: Any, nbytes: int = 0) -> int:
+        if not self._opened:
+            self._opened = True
+            self._recorder.write(RecordKind.OPEN, self._mac, self._stream_kind.encode())
+        received = self._transport.recv_into(buffer, nbytes)
+        if received:
+            self._recorder.write(RecordKind.DATA, self._mac, bytes(buffer[:received]))
+        return received
+
+    def close(self) -> None:
+        self._transport.close()
+        if self._opened:
+            self._recorder.write(RecordKind.CLOSE, self._mac)
+
+
+def read_log(path: str) -> Iterator[LogRecord]:
+    """
+    Yields the records of the log at **path**; a truncated last record, as left by an interrupted
+    recording, is ignored. Raises ValueError if the file is not a log.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(_magic)) != _magic:
+            raise ValueError(f"{path} is not a shimmer-listener log")
+        while True:
+            header = f.read(_header.size)
+            if len(header) < _header.size:
+                return
+            kind, timestamp, mac_len, data_len = _header.unpack(header)
+            mac = f.read(mac_len)
+            data = f.read(data_len)
+            if len(mac) < mac_len or len(data) < data_len:
+                return
+            yield LogRecord(RecordKind(kind), timestamp, mac.decode(), data)
+
+
+class Replayer:
+    """
+    Replays a log through the decoding of the streams that recorded it, invoking the passed handlers as
+    bt_listen would. With **speed** = 1 the data is fed with the original timing, with **speed** = N, N times
+    faster, and with **speed** = None as fast as the streams consume it.
+    """
+
+    def __init__(self, path: str, speed: Optional[float] = 1.0,
+                 connect_handle: Optional[Callable[[str, Frameinfo], None]] = None,
+                 message_handle: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                 disconnect_handle: Optional[Callable[[str, bool], None]] = None,
+                 batch_handle: Optional[Callable[[str, List[Dict[str, Any]]], None]] = None,
+                 **kwargs: Any):
+        """
+        Prepares the replay of the log at **path**; the keyword arguments are the stream options accepted
+        by bt_listen (batch_size, batch_latency, message_format, dispatcher).
+        """
+        if speed is not None and speed <= 0:
+            raise ValueError("speed must be a positive number, or None to replay as fast as possible")
+        self._path = path
+        self._speed = speed
+        self._handles = (connect_handle, message_handle, disconnect_handle, batch_handle)
+        self._kwargs = kwargs
+
+    def _open_stream(self, mac: str, stream_kind: bytes) -> PipeTransport:
+        # Imported here, since the streams module depends on this one for the recording transport
+        from ._streams import BtMasterInputStream, BtSlaveInputStream, _setup_stream
+        pipe = PipeTransport()
+        if stream_kind == b"master":
+            stream = BtMasterInputStream(mac, pipe, None)
+        else:
+            stream = BtSlaveInputStream(mac, pipe)
+        _setup_stream(stream, *self._handles, **self._kwargs)
+        thread = Thread(target=self._serve, args=(stream,))
+        thread.start()
+        self._threads.append(thread)
+        return pipe
+
+    @staticmethod
+    def _serve(stream: Any) -> None:
+        try:
+            stream.loop_forever()
+        except ConnectionError as err:
+            logging.error(err)
+
+    def run(self) -> None:
+        """
+        Replays the whole log, returning when every replayed stream has processed all of its data.
+        """
+        self._threads: List[Thread] = []
+        pipes: Dict[str, PipeTransport] = {}
+        start = time.monotonic()
+        elapsed = 0
+        previous: Optional[int] = None
+        try:
+            for record in read_log(self._path):
+                # Timestamps of different sessions are not related, time never goes backwards in the replay
+                if previous is not None:
+                    elapsed += max(0, record.timestamp - previous)
+                previous = record.timestamp
+                if self._speed is not None:
+                    delay = start + elapsed / 1e9 / self._speed - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+
+                if record.kind is RecordKind.OPEN:
+                    if record.mac in pipes:
+                        pipes.pop(record.mac).end()
+                    pipes[record.mac] = self._open_stream(record.mac, record.data)
+                elif record.kind is RecordKind.DATA:
+                    pipe = pipes.get(record.mac)
+                    if pipe is not None:
+                        try:
+                            pipe.write(record.data)
+                        except OSError:
+                            # The stream was closed, e.g. because of a wrong presentation frame
+                            pipes.pop(record.mac)
+                elif record.mac in pipes:
+                    pipes.pop(record.mac).end()
+        finally:
+            for pipe in pipes.values():
+                pipe.end()
+        for thread in self._threads:
+            thread.join()
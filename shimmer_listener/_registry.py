@@ -0,0 +1,125 @@
+"""
+Registry of the known devices, used in master mode to reconnect to the motes without waiting for a full
+inquiry scan, and to avoid looking up the name of the same device over and over.
+
+The registry can be persisted to a JSON file, so that the known motes are connected right away after a restart.
+"""
+
+from typing import Any, Callable, Dict, List, Optional
+from threading import Lock
+import logging
+import json
+import time
+import os
+
+from ._decoding import Frameinfo
+
+
+class DeviceRegistry:
+    """
+    Keeps track of the devices found during the discovery: their name, whether they are shimmer devices, the
+    last Frameinfo they sent and the last time they were seen. If **path** is passed, the registry is loaded
+    from that file and saved back to it whenever it changes.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Initializes a registry, loading it from **path** if the file exists.
+        """
+        self._path = path
+        self._mutex = Lock()
+        self._devices: Dict[str, Dict[str, Any]] = {}
+        if path is not None and os.path.exists(path):
+            self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self._path, "r") as f:
+                devices = json.load(f)["devices"]
+        except (OSError, ValueError, KeyError) as err:
+            logging.error(f"Couldn't load the device registry from {self._path}: {err}")
+            return
+        for mac, device in devices.items():
+            info = device.get("info")
+            device["info"] = Frameinfo(*info) if info is not None else None
+            self._devices[mac] = device
+
+    def _save(self) -> None:
+        # Called with the mutex held; the file is replaced atomically
+        if self._path is None:
+            return
+        tmp_path = f"{self._path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({"devices": self._devices}, f, indent=2)
+            os.replace(tmp_path, self._path)
+        except OSError as err:
+            logging.error(f"Couldn't save the device registry to {self._path}: {err}")
+
+    def get(self, mac: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns a copy of the data stored for the device, None if it is unknown.
+        """
+        with self._mutex:
+            device = self._devices.get(mac)
+            return dict(device) if device is not None else None
+
+    def is_shimmer(self, mac: str, lookup_name: Callable[[str], Optional[str]],
+                   is_shimmer_name: Callable[[str], bool]) -> bool:
+        """
+        Returns True if the device is a shimmer device. The name of a device is looked up through
+        **lookup_name** only the first time that it is seen, and the result is cached.
+        """
+        with self._mutex:
+            device = self._devices.get(mac)
+            if device is not None:
+                device["last_seen"] = time.time()
+                return device["shimmer"]
+
+        name = lookup_name(mac)
+        if name is None:
+            # The lookup failed, the device will be checked again the next time it is found
+            return False
+        with self._mutex:
+            self._devices[mac] = {"name": name, "shimmer": is_shimmer_name(name), "info": None,
+                                  "last_seen": time.time()}
+            self._save()
+            return self._devices[mac]["shimmer"]
+
+    def add(self, mac: str, name: str, shimmer: bool = True) -> None:
+        """
+        Adds a device to the registry, or updates its name.
+        """
+        with self._mutex:
+            device = self._devices.setdefault(mac, {"info": None})
+            device.update({"name": name, "shimmer": shimmer, "last_seen": time.time()})
+            self._save()
+
+    def update_info(self, mac: str, info: Frameinfo) -> None:
+        """
+        Stores the last Frameinfo received from a device.
+        """
+        with self._mutex:
+            device = self._devices.setdefault(mac, {"name": None, "shimmer": True})
+            changed = device.get("info") != info
+            device["info"] = info
+            device["last_seen"] = time.time()
+            if changed:
+                self._save()
+
+    def remove(self, mac: str) -> None:
+        """
+        Forgets a device.
+        """
+        with self._mutex:
+            if self._devices.pop(mac, None) is not None:
+                self._save()
+
+    def shimmer_devices(self) -> List[str]:
+        """
+        Returns the mac addresses of the known shimmer devices, most recently seen first.
+        """
+        with self._mutex:
+            devices = [(device.get("last_seen", 0), mac) for mac, device in self._devices.items()
+                       if device["shimmer"]]
+        return [mac for _, mac in sorted(devices, reverse=True)]
@@ -0,0 +1,348 @@
+"""
+Shared memory hand-off of the received frames to other processes.
+
+A SharedRing is a ring buffer in a named multiprocessing.shared_memory block, written by the stream of a single
+mote: every read of the stream publishes its complete frames, exactly as received, as one or more records with
+increasing sequence numbers, while the Frameinfo describing them is kept in the header of the block. Any number
+of SharedRingReaders, in any process, attach to the ring by name and decode the records with the same decoders
+used by the streams. The readers take no locks and the writer never waits for them: a reader detects the records
+that were overwritten before it could read them (overruns) through their sequence numbers.
+
+The block starts with a header page (magic, slot size, slot count, sequence number of the next record, generation
+and length of the Frameinfo, pid of the writer, JSON Frameinfo), followed by the slots, each one made of the
+sequence number of its record plus one (0 while it is being written), the payload length, the Frameinfo generation
+and the payload.
+A reader copies a payload out of its slot and checks that the sequence number didn't change in the meantime.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+from threading import Lock
+from types import ModuleType
+import struct
+import json
+import os
+
+from ._decoding import Frameinfo, MessageFormat, get_decoder
+
+
+_magic = b"SHMRING1"
+_header_size = 4096
+_geometry = struct.Struct("<II")        # slot size, slot count, at 8
+_head = struct.Struct("<Q")             # sequence number of the next record, at 16
+_info_header = struct.Struct("<II")     # Frameinfo generation and length, at 24
+_writer = struct.Struct("<Q")           # pid of the writer, at 32
+_info_offset = 40
+_slot_header = struct.Struct("<QII")    # sequence number + 1, payload length, Frameinfo generation
+
+
+def _require_shared_memory() -> ModuleType:
+    # Imported on first use, since most processes never publish nor read the rings
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:
+        # Python < 3.8
+        raise ImportError("shared memory rings require Python 3.8 or later") from None
+    return shared_memory
+
+
+def _alive(pid: int) -> bool:
+    # Whether the writer process is still running; on Windows a block is destroyed with its last handle,
+    # so any existing block belongs to a live process
+    if os.name == "nt":
+        return True
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def ring_name(mac: str, prefix: str = "shimmer") -> str:
+    """
+    Returns the name of the SharedRing of the mote identified by **mac**.
+    """
+    return f"{prefix}_{mac.replace(':', '').lower()}"
+
+
+class SharedRing:
+    """
+    Writing side of a shared memory ring of **slots** records of up to **slot_size** bytes each, named **name**.
+    Assign it to the **ring** property of a stream (or pass **shared_memory** to bt_listen) to publish the frames
+    it receives; a read carrying more frames than a slot can hold is split into several records.
+    """
+
+    def __init__(self, name: str, slots: int = 1024, slot_size: int = 4096, replace: bool = False):
+        """
+        Creates the shared memory block. A ring with the same name left by a writer process that is gone is
+        replaced, while FileExistsError is raised if its writer is still running or if the block is not a ring,
+        unless **replace** is True: the readers attached to a replaced block keep reading its old mapping.
+        """
+        shared_memory = _require_shared_memory()
+        if slots <= 0 or slot_size <= 0:
+            raise ValueError("slots and slot_size must be positive integers")
+        self._slots = slots
+        self._slot_size = slot_size
+        self._stride = _slot_header.size + slot_size
+        self._stride += -self._stride % 8
+        size = _header_size + slots * self._stride
+        try:
+            self._shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            # Inspected without tracking, so that a live block is not unlinked when this process exits
+            existing = _attach(name)
+            try:
+                ring = existing.size >= _header_size and bytes(existing.buf[:len(_magic)]) == _magic
+                pid = _writer.unpack_from(existing.buf, 32)[0] if ring else 0
+            finally:
+                existing.close()
+            if not replace:
+                if not ring:
+                    raise FileExistsError(f"{name} is not a shared ring, pass replace=True to replace it") from None
+                if _alive(pid):
+                    raise FileExistsError(f"the shared ring {name} is in use by the process {pid}, "
+                                          "pass replace=True to replace it") from None
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            self._shm = shared_memory.SharedMemory(name, create=True, size=size)
+        self._buf = self._shm.buf
+        self._buf[:_header_size] = bytes(_header_size)
+        self._buf[:len(_magic)] = _magic
+        _geometry.pack_into(self._buf, 8, slot_size, slots)
+        _writer.pack_into(self._buf, 32, os.getpid())
+        self._head = 0
+        self._info: Optional[Frameinfo] = None
+        self._generation = 0
+        self._mutex = Lock()
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def head(self) -> int:
+        """
+        Sequence number of the next record.
+        """
+        return self._head
+
+    def set_frameinfo(self, info: Frameinfo) -> None:
+        """
+        Publishes the Frameinfo describing the frames of the following records.
+        """
+        encoded = json.dumps(info._asdict()).encode()
+        if _info_offset + len(encoded) > _header_size:
+            raise ValueError("the Frameinfo doesn't fit in the header of the ring")
+        with self._mutex:
+            self._generation += 1
+            self._buf[_info_offset:_info_offset + len(encoded)] = encoded
+            _info_header.pack_into(self._buf, 24, self._generation, len(encoded))
+            self._info = info
+
+    def write(self, data: Any) -> int:
+        """
+        Publishes **data** as a single record, returning its sequence number.
+        """
+        size = len(data)
+        if size > self._slot_size:
+            raise ValueError(f"a record can't be larger than {self._slot_size} B")
+        with self._mutex:
+            seq = self._head
+            offset = _header_size + (seq % self._slots) * self._stride
+            buf = self._buf
+            _head.pack_into(buf, offset, 0)
+            payload = offset + _slot_header.size
+            buf[payload:payload + size] = data
+            _slot_header.pack_into(buf, offset, seq + 1, size, self._generation)
+            self._head = seq + 1
+            _head.pack_into(buf, 16, seq + 1)
+            return seq
+
+    def write_frames(self, frames: memoryview, info: Frameinfo) -> None:
+        """
+        Publishes the contiguous complete **frames** described by **info**, in as few records as possible.
+        """
+        if info is not self._info:
+            self.set_frameinfo(info)
+        per_record = max(1, self._slot_size // info.framesize) * info.framesize
+        for start in range(0, len(frames), per_record):
+            self.write(frames[start:start + per_record])
+
+    def close(self, unlink: bool = True) -> None:
+        """
+        Detaches from the ring and, unless **unlink** is False, destroys it; attached readers keep their mapping.
+        """
+        self._buf = None
+        self._shm.close()
+        if unlink:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class SharedRings:
+    """
+    Creates the SharedRing of each mote the first time that it connects, named after its mac (see ring_name),
+    and keeps it across reconnections, so that readers stay attached. See SharedRing for **replace**.
+    """
+
+    def __init__(self, prefix: str = "shimmer", slots: int = 1024, slot_size: int = 4096, replace: bool = False):
+        _require_shared_memory()
+        self._prefix = prefix
+        self._slots = slots
+        self._slot_size = slot_size
+        self._replace = replace
+        self._mutex = Lock()
+        self._rings: Dict[str, SharedRing] = {}
+
+    def ring(self, mac: str) -> SharedRing:
+        """
+        Returns the ring of the mote, creating it the first time.
+        """
+        with self._mutex:
+            ring = self._rings.get(mac)
+            if ring is None:
+                ring = self._rings[mac] = SharedRing(ring_name(mac, self._prefix), self._slots, self._slot_size,
+                                                       self._replace)
+            return ring
+
+    def names(self) -> Dict[str, str]:
+        """
+        Returns the name of the ring of each mote.
+        """
+        with self._mutex:
+            return {mac: ring.name for mac, ring in self._rings.items()}
+
+    def close(self) -> None:
+        with self._mutex:
+            for ring in self._rings.values():
+                ring.close()
+            self._rings.clear()
+
+
+_attach_mutex = Lock()
+
+
+def _attach(name: str) -> Any:
+    # Readers must not unlink the block when they exit, which the resource tracker does before Python 3.13;
+    # the registration is skipped rather than undone, since the tracker may be shared with the writer
+    shared_memory = _require_shared_memory()
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        pass
+    from multiprocessing import resource_tracker
+    with _attach_mutex:
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name)
+        finally:
+            resource_tracker.register = register
+
+
+class SharedRingReader:
+    """
+    Reading side of a SharedRing, attached by **name** from any process. Reading starts from the next record
+    written after attaching or, if **oldest** is True, from the oldest record still in the ring.
+    """
+
+    def __init__(self, name: str, oldest: bool = False):
+        self._shm = _attach(name)
+        self._buf = self._shm.buf
+        if bytes(self._buf[:len(_magic)]) != _magic:
+            self.close()
+            raise ValueError(f"{name} is not a shared ring")
+        self._slot_size, self._slots = _geometry.unpack_from(self._buf, 8)
+        self._stride = _slot_header.size + self._slot_size
+        self._stride += -self._stride % 8
+        head = self._read_head()
+        self._next = max(0, head - self._slots) if oldest else head
+        self._lost = 0
+        self._generation = 0
+        self._info: Optional[Frameinfo] = None
+
+    def _read_head(self) -> int:
+        return _head.unpack_from(self._buf, 16)[0]
+
+    @property
+    def next(self) -> int:
+        """
+        Sequence number of the next record to read.
+        """
+        return self._next
+
+    @property
+    def lost(self) -> int:
+        """
+        Number of records overwritten before they could be read.
+        """
+        return self._lost
+
+    @property
+    def frameinfo(self) -> Optional[Frameinfo]:
+        """
+        The Frameinfo of the last record read, or the current one if no record was read yet.
+        """
+        if self._info is None:
+            self._load_info()
+        return self._info
+
+    def _load_info(self) -> None:
+        generation, length = _info_header.unpack_from(self._buf, 24)
+        if length == 0:
+            return
+        info = json.loads(bytes(self._buf[_info_offset:_info_offset + length]).decode())
+        self._info = Frameinfo(**info)
+        self._generation = generation
+
+    def read(self) -> Optional[Tuple[int, bytes]]:
+        """
+        Returns the sequence number and the payload of the next record, or None if no new record was written.
+        Records overwritten before being read are skipped and counted in **lost**.
+        """
+        while True:
+            head = self._read_head()
+            if self._next >= head:
+                return None
+            if head - self._next > self._slots:
+                self._lost += head - self._slots - self._next
+                self._next = head - self._slots
+            offset = _header_size + (self._next % self._slots) * self._stride
+            seq, size, generation = _slot_header.unpack_from(self._buf, offset)
+            payload = offset + _slot_header.size
+            data = bytes(self._buf[payload:payload + min(size, self._slot_size)])
+            if seq != self._next + 1 or _head.unpack_from(self._buf, offset)[0] != seq:
+                # Overwritten while reading, or the writer lapped the reader since head was read
+                self._lost += 1
+                self._next += 1
+                continue
+            if generation != self._generation:
+                self._load_info()
+            self._next += 1
+            return seq - 1, data
+
+    def read_messages(self, message_format: MessageFormat = MessageFormat.DICT) -> Optional[Tuple[int, List[Any]]]:
+        """
+        Reads the next record as **read** does, decoding its frames with the current Frameinfo of the ring:
+        a list of dicts or records, or a single dict of numpy arrays for MessageFormat.COLUMNS.
+        """
+        record = self.read()
+        if record is None:
+            return None
+        seq, data = record
+        decoder = get_decoder(self._info)
+        if message_format is MessageFormat.COLUMNS:
+            return seq, [decoder.to_columns(data)]
+        if message_format is MessageFormat.RECORD:
+            return seq, decoder.to_records(data)
+        return seq, decoder.to_dicts(data)
+
+    def close(self) -> None:
+        self._buf = None
+        self._shm.close()
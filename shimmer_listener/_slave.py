@@ -5,45 +5,186 @@ We acquire data from the accelerometer and from the gyroscope modules on the mot
 them via a process function. This approach can be used both for data to be locally transformed or for the data
 to be forwarded to other apps (e.g. nodered)
 
-This library is mainly used in master mode and its slave mode functionalities are limited to the bluetoothMasterApp.
+The server socket only accepts the connections of the motes: each accepted mote is handed to a bounded pool of
+worker threads (or to the reactor), which run its stream, so that a busy or slow stream never delays the accept
+of the following motes. Motes can also describe their frames through the presentation protocol, as in master
+mode, instead of running the bluetoothMasterApp.
 """
 
-from typing import Optional, Callable, Any, Dict, Union
-from bluetooth import *
+from typing import Optional, Callable, Any, Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
 import logging
+import socket
 
-from ._streams import BtMasterInputStream, Frameinfo
+from ._streams import BtStream, BtMasterInputStream, BtSlaveInputStream, Frameinfo, _setup_stream, _join_streams, \
+    _deadline, _remaining
+from ._supervisor import Supervisor
+from ._transport import RfcommTransport, _bluetooth
+
+# Default number of connections waiting to be accepted and of motes served at the same time
+_def_backlog = 8
+_def_max_connections = 64
 
 # Bluetooth server socket that acts as a slave for multiple
-_bt_sock: BluetoothSocket
+_bt_sock: Any = None
+
+# This dict contains a reference to each open connection
+_open_conn: Dict[str, BtStream] = {}
+_mutex = Lock()
+_accepting = False
+
+# Runs the streams of the accepted motes, one worker each
+_workers: Optional[ThreadPoolExecutor] = None
+
+# Recycles the stalled connections, if enabled; the motes reconnect on their own in slave mode
+_supervisor: Optional[Supervisor] = None
 
 # Standard bt service uuid taken from the bluetoothMaster repo
 _uuid = "85b98cdc-9f43-4f88-92cd-0c3fcf631d1d"
 
 
-def _slave_init():
-    global _bt_sock
-    _bt_sock = BluetoothSocket(RFCOMM)
-    _bt_sock.bind(("", PORT_ANY))
-    _bt_sock.listen(1)
-    advertise_service(_bt_sock, "BlRead", service_id=_uuid,
-                      service_classes=[_uuid, SERIAL_PORT_CLASS], profiles=[SERIAL_PORT_PROFILE])
+def _slave_init(backlog: int = _def_backlog):
+    global _bt_sock, _accepting
+    bluetooth = _bluetooth()
+    _bt_sock = bluetooth.BluetoothSocket(bluetooth.RFCOMM)
+    _bt_sock.bind(("", bluetooth.PORT_ANY))
+    _bt_sock.listen(backlog)
+    bluetooth.advertise_service(_bt_sock, "BlRead", service_id=_uuid,
+                                service_classes=[_uuid, bluetooth.SERIAL_PORT_CLASS],
+                                profiles=[bluetooth.SERIAL_PORT_PROFILE])
+    _accepting = True
+
+
+def _close_stream(mac: str, stream: BtStream) -> None:
+    # Forgets the stream, unless it was already replaced by a newer connection of the same mote
+    with _mutex:
+        if _open_conn.get(mac) is stream:
+            del _open_conn[mac]
+
+
+def _close_streams() -> List[BtStream]:
+    # Stops every open stream, returning them; their disconnect handlers remove them from _open_conn meanwhile
+    with _mutex:
+        streams = list(_open_conn.values())
+    for stream in streams:
+        _stop_stream(stream)
+    return streams
+
+
+def _stop_stream(stream: BtStream) -> None:
+    # Stops the stream, shutting its connection down even if no worker opened it yet
+    stream.stop()
+    stream._abort()
+
+
+def _serve(stream: BtStream) -> None:
+    # Runs in a worker, until the stream disconnects
+    if not _accepting:
+        # The server was closed while the stream was waiting for a free worker
+        stream.transport.close()
+        _close_stream(stream._mac, stream)
+        return
+    try:
+        stream.loop_forever()
+    except ConnectionError as err:
+        logging.error(err)
+    except Exception:
+        logging.exception(f"BT MAC {stream._mac}: error in the stream")
+    finally:
+        _close_stream(stream._mac, stream)
 
 
 def _slave_listen(connect_handle: Optional[Callable[[str, Frameinfo], None]] = None,
                   message_handle: Optional[Callable[[str, Dict[str, Any]], None]] = None,
                   disconnect_handle: Optional[Callable[[str, bool], None]] = None,
-                  **kwargs: Union[str, float]) -> None:
-    global _bt_sock
-    while True:
-        client_sock, client_info = _bt_sock.accept()
-        logging.info("Mote connection with BT MAC: {}".format(client_info[0]))
-        in_stream = BtMasterInputStream(mac=client_info[0], sock=client_sock, uuid=_uuid)
-        in_stream.on_connect = connect_handle
-        in_stream.on_message = message_handle
-        in_stream.on_disconnect = disconnect_handle
-        in_stream.start()
-
-
-def _slave_close():
+                  batch_handle: Optional[Callable[[str, List[Dict[str, Any]]], None]] = None,
+                  **kwargs: Any) -> None:
+    global _supervisor, _workers
+    reactor = kwargs.get("reactor")
+    presentation = kwargs.get("presentation", False)
+    max_connections = kwargs.get("max_connections", _def_max_connections)
+    reconnect = kwargs.get("reconnect")
+    if reconnect and _supervisor is None:
+        options = reconnect if isinstance(reconnect, dict) else {}
+        _supervisor = Supervisor(reconnect=None, **options)
+    if reactor is None and _workers is None:
+        _workers = ThreadPoolExecutor(max_connections, thread_name_prefix="shimmer-slave")
+
+    def capture_error(stream, err):
+        logging.error(err)
+        _close_stream(stream._mac, stream)
+
+    while _accepting:
+        try:
+            client_sock, client_info = _bt_sock.accept()
+        except OSError as err:
+            # BluetoothError is an OSError too
+            if not _accepting:
+                break
+            logging.error(err)
+            continue
+        mac = client_info[0]
+        logging.info("Mote connection with BT MAC: {}".format(mac))
+        transport = RfcommTransport(sock=client_sock)
+        if presentation:
+            in_stream = BtSlaveInputStream(mac, transport)
+        else:
+            in_stream = BtMasterInputStream(mac=mac, sock=transport, uuid=_uuid)
+
+        with _mutex:
+            previous = _open_conn.get(mac)
+            if previous is None and len(_open_conn) >= max_connections:
+                in_stream = None
+            else:
+                _open_conn[mac] = in_stream
+        if in_stream is None:
+            logging.warning(f"BT MAC {mac}: refused, {max_connections} motes are already connected")
+            transport.close()
+            continue
+        if previous is not None:
+            # The mote reconnected before its old connection was found to be lost
+            _stop_stream(previous)
+
+        # The disconnect handler only forgets its own stream, not a newer one of the same mote
+        def capture_disconnect(mote, lost, stream=in_stream):
+            if disconnect_handle:
+                disconnect_handle(mote, lost)
+            _close_stream(mote, stream)
+
+        _setup_stream(in_stream, connect_handle, message_handle, capture_disconnect, batch_handle, **kwargs)
+        if _supervisor is not None:
+            _supervisor.watch(in_stream)
+        if reactor is not None:
+            reactor.add(in_stream, on_error=capture_error)
+        else:
+            _workers.submit(_serve, in_stream)
+
+
+def _slave_close(timeout: Optional[float] = None) -> List[str]:
+    global _supervisor, _accepting, _workers
+    deadline = _deadline(timeout)
+    _accepting = False
+    if _supervisor is not None:
+        _supervisor.close(_remaining(deadline))
+        _supervisor = None
+    try:
+        # Closing the socket alone doesn't wake up a thread blocked accepting on it, at least on Linux
+        _bt_sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
     _bt_sock.close()
+    alive = _join_streams(_close_streams(), deadline)
+    if _workers is not None:
+        _workers.shutdown(wait=False)
+        _workers = None
+    return alive
+
+
+def _slave_streams() -> Dict[str, BtStream]:
+    with _mutex:
+        return dict(_open_conn)
+
+
+def _slave_supervisor() -> Optional[Supervisor]:
+    return _supervisor
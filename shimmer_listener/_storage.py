@@ -0,0 +1,423 @@
+"""
+Columnar on-disk storage of the decoded samples.
+
+A ColumnStore writes the messages of each mote to its own sequence of column files, rolled by size or age.
+The receive loops only append the messages to a bounded queue: a background thread buffers them by mote and
+writes them as blocks, each holding a contiguous array for every key, so that a column of a block can be
+mapped with numpy.memmap without any parsing. Files are named <mac>-<date>-<time>-<sequence>.shmc.
+
+A column file is laid out as follows, all of the integers being little endian and every section being
+aligned to 8 bytes::
+
+    b"SHMCOL1\\n"
+    uint32   header length, followed by the utf-8 JSON header: mac, keys, numpy dtype of each key
+             and Frameinfo of the mote
+    blocks   each one made of b"BLK1", a uint32 row count, then the column of each key in the header order
+    index    b"IDX1", a uint32 block count, then the (uint64 offset, uint64 rows) of each block,
+             written when the file is closed
+    trailer  uint64 offset of the index, followed by b"SHMCEND\\n"
+
+A file that wasn't closed, like the one being written, has no index: its complete blocks can still be read.
+"""
+
+from typing import Any, BinaryIO, Callable, Deque, Dict, List, Optional, Sequence, Tuple, TYPE_CHECKING
+from threading import Condition, Thread
+from collections import deque
+import logging
+import struct
+import json
+import time
+import os
+
+from ._decoding import Frameinfo, numpy_dtype, _numpy, _require_numpy
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+_magic = b"SHMCOL1\n"
+_end_magic = b"SHMCEND\n"
+_block = struct.Struct("<4sI")
+_index = struct.Struct("<4sI")
+_index_entry = struct.Struct("<QQ")
+_trailer = struct.Struct("<Q8s")
+
+
+def _padding(size: int) -> bytes:
+    return b"\x00" * (-size % 8)
+
+
+class _MoteFile:
+    # The column file being written for a mote
+
+    def __init__(self, path: str, mac: str, info: Optional[Frameinfo], dtypes: List[Tuple[str, "np.dtype"]]):
+        self.path = path
+        self.dtypes = dtypes
+        self.blocks: List[Tuple[int, int]] = []
+        self.opened_at = time.monotonic()
+        self.file: BinaryIO = open(path, "wb")
+        header = {"mac": mac, "keys": [key for key, _ in dtypes], "dtypes": [dtype.str for _, dtype in dtypes],
+                  "frameinfo": info._asdict() if info is not None else None}
+        encoded = json.dumps(header).encode()
+        self.file.write(_magic + struct.pack("<I", len(encoded)) + encoded + _padding(len(encoded) + 12))
+        self.size = self.file.tell()
+
+    def write_block(self, columns: Dict[str, "np.ndarray"], rows: int) -> None:
+        np = _numpy()
+        parts = [_block.pack(b"BLK1", rows)]
+        for key, dtype in self.dtypes:
+            data = np.ascontiguousarray(columns[key], dtype=dtype).tobytes()
+            parts.append(data)
+            parts.append(_padding(len(data)))
+        data = b"".join(parts)
+        self.file.write(data)
+        self.file.flush()
+        self.blocks.append((self.size, rows))
+        self.size += len(data)
+
+    def close(self) -> None:
+        index = [_index.pack(b"IDX1", len(self.blocks))]
+        index.extend(_index_entry.pack(offset, rows) for offset, rows in self.blocks)
+        index.append(_trailer.pack(self.size, _end_magic))
+        self.file.write(b"".join(index))
+        self.file.close()
+
+
+class _MoteBuffer:
+    def __init__(self):
+        self.info: Optional[Frameinfo] = None
+        self.dtypes: Optional[List[Tuple[str, "np.dtype"]]] = None
+        self.columns: Dict[str, List[Any]] = {}
+        self.rows = 0
+        self.since = time.monotonic()
+        self.file: Optional[_MoteFile] = None
+        self.sequence = 0
+
+
+def _columns(messages: Sequence[Any]) -> Tuple[Dict[str, Any], int]:
+    # Converts dicts, records or dicts of numpy columns into a column for each key
+    first = messages[0]
+    if isinstance(first, tuple):
+        return dict(zip(first._fields, zip(*messages))), len(messages)
+    values = list(first.values())
+    if values and hasattr(values[0], "dtype"):
+        if len(messages) == 1:
+            return first, len(values[0])
+        np = _numpy()
+        columns = {key: np.concatenate([message[key] for message in messages]) for key in first}
+        return columns, len(next(iter(columns.values())))
+    return {key: [message[key] for message in messages] for key in first}, len(messages)
+
+
+# Errors of a single mote, which are logged without stopping the writer thread
+_store_errors = (OSError, ValueError, TypeError, KeyError)
+
+
+def _dtypes(info: Optional[Frameinfo], columns: Dict[str, Any]) -> List[Tuple[str, "np.dtype"]]:
+    # The dtype of the keys described by the Frameinfo, the others are inferred from their values;
+    # keys without a fixed size binary representation, such as the mac, are left out
+    known = {}
+    if info is not None:
+        try:
+            fields = numpy_dtype(info).fields
+            known = {key: fields[key][0] for key in info.keys}
+        except ValueError:
+            pass
+    dtypes = []
+    for key, values in columns.items():
+        dtype = known.get(key)
+        if dtype is None:
+            dtype = _numpy().asarray(values[:1]).dtype
+        if dtype.kind in "biufcS":
+            dtypes.append((key, dtype.newbyteorder("<") if dtype.byteorder == ">" else dtype))
+    return dtypes
+
+
+class ColumnStore:
+    """
+    Stores the messages of every mote in column files under **directory**, see the module documentation for
+    their layout and ColumnFile to read them. Pass **on_connect**, **on_batch** (or **on_message**) and
+    **on_disconnect** as the handlers of the streams, or call them from your own handlers; the keys of each mote
+    and their types are taken from its Frameinfo. Requires numpy.
+
+    The messages of a mote are buffered and written as a block when **block_rows** rows are buffered or
+    **flush_interval** seconds have passed; a file is closed and a new one is started when it reaches
+    **max_bytes** bytes or **max_age** seconds, and when the mote disconnects. Up to **max_pending** messages
+    (a block of columns counting as one) can wait for the writer thread, further messages are dropped and counted.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 64 * 1024 * 1024, max_age: Optional[float] = 3600.0,
+                 block_rows: int = 8192, flush_interval: float = 1.0, max_pending: int = 65536):
+        """
+        Creates **directory** if needed and starts the writer thread.
+        """
+        _require_numpy("the column storage")
+        if max_bytes <= 0 or block_rows <= 0 or max_pending <= 0:
+            raise ValueError("max_bytes, block_rows and max_pending must be positive integers")
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._max_age = max_age
+        self._block_rows = block_rows
+        self._flush_interval = flush_interval
+        self._max_pending = max_pending
+
+        self._cond = Condition()
+        self._pending: Deque[Tuple[str, str, Any]] = deque()
+        self._pending_count = 0
+        self._closed = False
+        self._dropped = 0
+        self._written_rows = 0
+        self._files: List[str] = []
+        self._motes: Dict[str, _MoteBuffer] = {}
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _put(self, kind: str, mac: str, payload: Any, count: int = 0) -> None:
+        with self._cond:
+            if self._closed:
+                return
+            if count and self._pending_count + count > self._max_pending:
+                self._dropped += count
+                return
+            self._pending.append((kind, mac, payload))
+            self._pending_count += count
+            self._cond.notify()
+
+    def on_connect(self, mac: str, info: Frameinfo) -> None:
+        """
+        Connect handler recording the Frameinfo of the mote.
+        """
+        self._put("connect", mac, info)
+
+    def on_message(self, mac: str, message: Any) -> None:
+        """
+        Message handler storing **message**.
+        """
+        self._put("data", mac, (message,), 1)
+
+    def on_batch(self, mac: str, batch: List[Any]) -> None:
+        """
+        Batch handler storing every message of **batch**.
+        """
+        if batch:
+            self._put("data", mac, batch, len(batch))
+
+    def on_disconnect(self, mac: str, lost: bool) -> None:
+        """
+        Disconnect handler closing the file of the mote.
+        """
+        self._put("disconnect", mac, lost)
+
+    @property
+    def files(self) -> List[str]:
+        """
+        The paths of the files created up to now, in order of creation.
+        """
+        with self._cond:
+            return list(self._files)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the number of rows written, of messages dropped and waiting for the writer, and of files created.
+        """
+        with self._cond:
+            return {"rows": self._written_rows, "dropped": self._dropped, "pending": self._pending_count,
+                    "files": len(self._files)}
+
+    def close(self) -> None:
+        """
+        Writes the messages still waiting or buffered, closes every file and stops the writer thread.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _buffer(self, mac: str, messages: Sequence[Any]) -> None:
+        mote = self._motes.setdefault(mac, _MoteBuffer())
+        columns, rows = _columns(messages)
+        if mote.dtypes is None:
+            mote.dtypes = _dtypes(mote.info, columns)
+        if mote.rows == 0:
+            mote.since = time.monotonic()
+        for key, _ in mote.dtypes:
+            mote.columns.setdefault(key, []).append(columns[key])
+        mote.rows += rows
+        if mote.rows >= self._block_rows:
+            self._flush(mac, mote)
+
+    def _flush(self, mac: str, mote: _MoteBuffer) -> None:
+        # Writes the buffered rows of the mote as a block, rolling its file if needed
+        if mote.rows == 0:
+            return
+        np = _numpy()
+        parts, rows = mote.columns, mote.rows
+        mote.columns = {}
+        mote.rows = 0
+        try:
+            columns = {key: np.concatenate([np.asarray(part, dtype=dtype) for part in parts[key]])
+                       for key, dtype in mote.dtypes}
+            if mote.file is None:
+                name = f"{mac.replace(':', '')}-{time.strftime('%Y%m%d-%H%M%S')}-{mote.sequence:04d}.shmc"
+                mote.sequence += 1
+                mote.file = _MoteFile(os.path.join(self._directory, name), mac, mote.info, mote.dtypes)
+                with self._cond:
+                    self._files.append(mote.file.path)
+            mote.file.write_block(columns, rows)
+        except _store_errors:
+            with self._cond:
+                self._dropped += rows
+            raise
+        with self._cond:
+            self._written_rows += rows
+        if mote.file.size >= self._max_bytes or \
+                self._max_age is not None and time.monotonic() - mote.file.opened_at >= self._max_age:
+            self._roll(mote)
+
+    @staticmethod
+    def _roll(mote: _MoteBuffer) -> None:
+        if mote.file is not None:
+            column_file, mote.file = mote.file, None
+            column_file.close()
+
+    def _handle(self, kind: str, mac: str, payload: Any) -> None:
+        if kind == "data":
+            self._buffer(mac, payload)
+            return
+        mote = self._motes.setdefault(mac, _MoteBuffer())
+        try:
+            self._flush(mac, mote)
+        finally:
+            self._roll(mote)
+            if kind == "connect":
+                # The keys of a reconnected mote may have changed
+                mote.info = payload
+                mote.dtypes = None
+
+    @staticmethod
+    def _attempt(mac: str, action: Callable[..., None], *args: Any) -> None:
+        # Runs a step of the writer thread, logging its errors instead of letting them stop the thread
+        try:
+            action(*args)
+        except _store_errors as err:
+            logging.error(f"cannot store the data of {mac}: {err}")
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not self._pending and not self._closed:
+                    self._cond.wait(self._flush_interval)
+                pending, self._pending = self._pending, deque()
+                self._pending_count = 0
+                closed = self._closed
+            for kind, mac, payload in pending:
+                self._attempt(mac, self._handle, kind, mac, payload)
+            now = time.monotonic()
+            for mac, mote in self._motes.items():
+                if mote.rows and now - mote.since >= self._flush_interval:
+                    self._attempt(mac, self._flush, mac, mote)
+            if closed:
+                break
+        # A mote failing to flush its rows still gets its file closed, as every other mote
+        for mac, mote in self._motes.items():
+            self._attempt(mac, self._flush, mac, mote)
+            self._attempt(mac, self._roll, mote)
+
+
+class ColumnFile:
+    """
+    Reads a column file written by a ColumnStore, mapping its columns in memory.
+    """
+
+    def __init__(self, path: str):
+        """
+        Parses the header and the index of the file at **path**; the blocks of a file that wasn't closed
+        are found by scanning it.
+        """
+        np = _require_numpy("the column storage")
+        self.path = path
+        with open(path, "rb") as file:
+            if file.read(len(_magic)) != _magic:
+                raise ValueError(f"{path} is not a column file")
+            length, = struct.unpack("<I", file.read(4))
+            header = json.loads(file.read(length).decode())
+            data_start = len(_magic) + 4 + length
+            data_start += -data_start % 8
+            self.mac: str = header["mac"]
+            self.keys: List[str] = header["keys"]
+            self.dtypes: Dict[str, np.dtype] = {key: np.dtype(dtype) for key, dtype in
+                                                zip(self.keys, header["dtypes"])}
+            info = header["frameinfo"]
+            self.frameinfo: Optional[Frameinfo] = Frameinfo(**info) if info is not None else None
+
+            file.seek(0, os.SEEK_END)
+            size = file.tell()
+            self.blocks: List[Tuple[int, int]] = []
+            self.complete = False
+            if size >= data_start + _trailer.size:
+                file.seek(size - _trailer.size)
+                index_offset, end_magic = _trailer.unpack(file.read(_trailer.size))
+                if end_magic == _end_magic:
+                    file.seek(index_offset)
+                    _, count = _index.unpack(file.read(_index.size))
+                    self.blocks = [_index_entry.unpack(file.read(_index_entry.size)) for _ in range(count)]
+                    self.complete = True
+            if not self.complete:
+                self.blocks = self._scan(file, data_start, size)
+
+    def _block_size(self, rows: int) -> int:
+        size = _block.size
+        for dtype in self.dtypes.values():
+            column = rows * dtype.itemsize
+            size += column + -column % 8
+        return size
+
+    def _scan(self, file: BinaryIO, offset: int, size: int) -> List[Tuple[int, int]]:
+        blocks = []
+        while offset + _block.size <= size:
+            file.seek(offset)
+            magic, rows = _block.unpack(file.read(_block.size))
+            block_size = self._block_size(rows)
+            if magic != b"BLK1" or offset + block_size > size:
+                break
+            blocks.append((offset, rows))
+            offset += block_size
+        return blocks
+
+    @property
+    def rows(self) -> int:
+        return sum(rows for _, rows in self.blocks)
+
+    def block(self, idx: int) -> Dict[str, "np.memmap"]:
+        """
+        Returns the columns of the **idx**-th block, memory-mapped read-only.
+        """
+        np = _numpy()
+        offset, rows = self.blocks[idx]
+        offset += _block.size
+        columns = {}
+        for key in self.keys:
+            dtype = self.dtypes[key]
+            columns[key] = np.memmap(self.path, dtype=dtype, mode="r", offset=offset, shape=(rows,)) if rows \
+                else np.empty(0, dtype=dtype)
+            column = rows * dtype.itemsize
+            offset += column + -column % 8
+        return columns
+
+    def column(self, key: str) -> "np.ndarray":
+        """
+        Returns every value of **key** in the file: the memory-mapped column itself if the file holds a single
+        block, otherwise their concatenation.
+        """
+        if len(self.blocks) == 1:
+            return self.block(0)[key]
+        np = _numpy()
+        return np.concatenate([self.block(idx)[key] for idx in range(len(self.blocks))]) if self.blocks \
+            else np.empty(0, dtype=self.dtypes[key])
+
+    def columns(self) -> Dict[str, "np.ndarray"]:
+        """
+        Returns every column of the file, see **column**.
+        """
+        return {key: self.column(key) for key in self.keys}
@@ -1,24 +1,32 @@
-from typing import Optional, Callable, Dict, Any
+from typing import Optional, Callable, Dict, Any, List, Sequence
 from abc import ABC, abstractmethod
 from collections import namedtuple
-from threading import Thread
-import bluetooth
+from threading import Event, Thread
+import socket
 import struct
+import time
 
-
-class Frameinfo(namedtuple("frameinfo", ["framesize", "lenchunks", "format", "keys"])):
-    """A description of the format used by the shimmer device to communicate. The data received through the
-    presentation protocol at startup is contained in an instance of this class."""
-    pass
+from ._buffer import FrameBuffer
+from ._decoding import Frameinfo, MessageFormat, get_decoder, record_type, _numpy, _require_numpy
+from ._dispatch import Dispatcher, EventKind
+from ._transport import Transport, SocketTransport, RfcommTransport, TransportError
+from ._recording import Recorder, _RecordingTransport
+from ._metrics import StreamMetrics, _MeteredTransport
+from ._tracing import Tracer, _Timestamper, _TimedTransport, _Traced, monotonic_ns
+from ._shm import SharedRing
+from ._filtering import _ChunkFilter
 
 
 SlaveDataTuple = namedtuple("DataTuple", ["mac", "accel_x", "accel_y", "accel_z", "gyro_x", "gyro_y", "gyro_z"])
 """Incoming data format for the only slave app supported"""
 
+# Lets pickle find the class by its name
+DataTuple = SlaveDataTuple
+
 
 class BtStream(ABC):
     """
-    Abstraction of a Bluetooth input stream coming from a mote with given mac over a given socket.
+    Abstraction of a Bluetooth input stream coming from a mote with given mac over a given transport.
     A series of callbacks can be used and set as properties to intercept certain events:
 
     - **on_connect(mac: str, info: frameinfo) -> None**
@@ -32,10 +40,25 @@ class BtStream(ABC):
         Called when a message is received from a mote identified by **mac**. The message is
         returned as a dict with the keys previously obtained from the *presentation protocol*.
 
+    The data passed to on_message/on_batch depends on the **message_format** of the stream, see MessageFormat.
+
+    - **on_batch(mac: str, batch: List[Dict[str, Any]]) -> None**
+
+        Called with a list of messages received from a mote identified by **mac**. By default, a batch
+        contains every message of a single frame; setting **batch_size** and/or **batch_latency**, messages
+        are grouped until the batch holds **batch_size** messages, or until the oldest one has been waiting
+        for **batch_latency** seconds. The latency deadline holds even if the mote stops sending data, and
+        any partial batch is delivered before the stream disconnects.
+
     - **on_disconnect(mac: str, lost: bool) -> None**
 
         Called when a mote identified by **mac** disconnects. If **lost** is true, the disconnect
         event happened because the connection has been lost.
+
+    By default, callbacks run in the thread receiving the data; setting a **dispatcher**, they are queued
+    and run by its worker pool instead, so that slow callbacks don't stall the reception.
+
+    The data is read from a Transport, an RFCOMM connection by default, see the **transport** property.
     """
 
     def __init__(self, mac: str):
@@ -46,11 +69,54 @@ class BtStream(ABC):
         super().__init__()
         self._mac = mac
         self._running = False
+        self._stopped = False
+        # Set while no thread is serving the connection, see join
+        self._done = Event()
+        self._done.set()
+        self._transport: Optional[Transport] = None
+        self._base_transport: Optional[Transport] = None
+        self._recorder: Optional[Recorder] = None
+        self._metrics: Optional[StreamMetrics] = None
+
+        # Host timestamps and tracing
+        self._timestamps = False
+        self._tracer: Optional[Tracer] = None
+        self._recv_ns = 0
+        self._timestamper = _Timestamper()
+        self._stamp_first = 0.0
+        self._stamp_step = 0.0
+
+        # Shared memory ring publishing the received frames
+        self._ring: Optional[SharedRing] = None
+
+        # Selection of the decoded samples, compiled when the Frameinfo is known
+        self._decimation = 1
+        self._deadband: Optional[Dict[str, float]] = None
+        self._projection: Optional[Sequence[str]] = None
+        self._filter: Optional[_ChunkFilter] = None
+
+        # Validation of the frame boundaries, see _sync
+        self._frame_check: Optional[Callable[[memoryview], bool]] = None
+        self._synced = True
 
         # Callbacks
         self._on_connect: Optional[Callable[[str, Frameinfo], None]] = None
         self._on_message: Optional[Callable[[str, Dict[str, Any]], None]] = None
         self._on_disconnect: Optional[Callable[[str, bool], None]] = None
+        self._on_batch: Optional[Callable[[str, List[Dict[str, Any]]], None]] = None
+
+        # Batching options and state
+        self._batch_size: Optional[int] = None
+        self._batch_latency: Optional[float] = None
+        self._batch: List[Any] = []
+        self._batch_start = 0.0
+        self._read_timeout: Optional[float] = None
+        self._message_format = MessageFormat.DICT
+        self._dispatcher: Optional[Dispatcher] = None
+
+        # Reception timing, used to detect stalled streams
+        self._last_data: Optional[float] = None
+        self._frame_interval: Optional[float] = None
 
     @property
     def on_connect(self):
@@ -76,6 +142,457 @@ class BtStream(ABC):
     def on_disconnect(self, callback):
         self._on_disconnect = callback
 
+    @property
+    def on_batch(self):
+        return self._on_batch
+
+    @on_batch.setter
+    def on_batch(self, callback):
+        self._on_batch = callback
+
+    @property
+    def transport(self) -> Transport:
+        """
+        The Transport carrying the data of the mote.
+        """
+        return self._base_transport
+
+    @property
+    def recorder(self) -> Optional[Recorder]:
+        """
+        The Recorder logging the raw data received by this stream, None if it is not recorded.
+        It must be set before starting the stream.
+        """
+        return self._recorder
+
+    @recorder.setter
+    def recorder(self, recorder: Optional[Recorder]):
+        if recorder is self._recorder:
+            return
+        if self._running:
+            raise ValueError("cannot change the recorder of a running stream")
+        self._recorder = recorder
+        self._set_transport(self._base_transport)
+
+    @property
+    def metrics(self) -> Optional[StreamMetrics]:
+        """
+        The StreamMetrics counting the data received by this stream, None (the default) to disable them.
+        It must be set before starting the stream.
+        """
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, metrics: Optional[StreamMetrics]):
+        if metrics is self._metrics:
+            return
+        if self._running:
+            raise ValueError("cannot change the metrics of a running stream")
+        self._metrics = metrics
+        self._set_transport(self._base_transport)
+
+    @property
+    def timestamps(self) -> bool:
+        """
+        If True, every message gets a **timestamp**: the time.monotonic_ns() time at which the read that completed
+        it returned, interpolated backwards for the samples received together, by the sampling interval estimated
+        from the received data. Timestamps are stored in the "timestamp" key, field or column of the messages.
+        It must be set before starting the stream.
+        """
+        return self._timestamps
+
+    @timestamps.setter
+    def timestamps(self, timestamps: bool):
+        if timestamps == self._timestamps:
+            return
+        if self._running:
+            raise ValueError("cannot change the timestamps of a running stream")
+        self._timestamps = timestamps
+        self._set_transport(self._base_transport)
+
+    @property
+    def tracer(self) -> Optional[Tracer]:
+        """
+        The Tracer notified when data is received, decoded, dispatched to the callbacks and when these return,
+        None (the default) to disable tracing. It must be set before starting the stream.
+        """
+        return self._tracer
+
+    @tracer.setter
+    def tracer(self, tracer: Optional[Tracer]):
+        if tracer is self._tracer:
+            return
+        if self._running:
+            raise ValueError("cannot change the tracer of a running stream")
+        self._tracer = tracer
+        self._set_transport(self._base_transport)
+
+    @property
+    def ring(self) -> Optional[SharedRing]:
+        """
+        The SharedRing publishing the frames received by this stream to other processes, None (the default)
+        to disable it. It must be set before starting the stream.
+        """
+        return self._ring
+
+    @ring.setter
+    def ring(self, ring: Optional[SharedRing]):
+        if ring is self._ring:
+            return
+        if self._running:
+            raise ValueError("cannot change the ring of a running stream")
+        self._ring = ring
+
+    @property
+    def decimation(self) -> int:
+        """
+        Only one chunk every **decimation** chunks received is decoded and delivered, defaults to 1 (every chunk).
+        It must be set before starting the stream.
+        """
+        return self._decimation
+
+    @decimation.setter
+    def decimation(self, decimation: int):
+        if decimation <= 0:
+            raise ValueError("decimation must be a positive integer")
+        if decimation == self._decimation:
+            return
+        if self._running:
+            raise ValueError("cannot change the decimation of a running stream")
+        self._decimation = decimation
+
+    @property
+    def deadband(self) -> Optional[Dict[str, float]]:
+        """
+        A threshold for some of the keys of the Frameinfo: a chunk is delivered only if the value of any of these
+        keys differs by at least its threshold from the one of the last chunk delivered. None (the default)
+        delivers every chunk. It must be set before starting the stream.
+        """
+        return self._deadband
+
+    @deadband.setter
+    def deadband(self, deadband: Optional[Dict[str, float]]):
+        if deadband == self._deadband:
+            return
+        if self._running:
+            raise ValueError("cannot change the deadband of a running stream")
+        self._deadband = dict(deadband) if deadband else None
+
+    @property
+    def projection(self) -> Optional[Sequence[str]]:
+        """
+        The keys of the Frameinfo to decode, in the order of the Frameinfo; the values of the others are skipped
+        without being unpacked. None (the default) decodes every key. It must be set before starting the stream.
+        """
+        return self._projection
+
+    @projection.setter
+    def projection(self, projection: Optional[Sequence[str]]):
+        if projection == self._projection:
+            return
+        if self._running:
+            raise ValueError("cannot change the projection of a running stream")
+        if projection is not None and not projection:
+            raise ValueError("the projection must contain at least a key")
+        self._projection = tuple(projection) if projection is not None else None
+
+    @property
+    def frame_check(self) -> Optional[Callable[[memoryview], bool]]:
+        """
+        A function returning True if the frame it is passed is valid, None to disable the check. When a frame
+        doesn't pass the check, the stream drops it and looks for the next valid one, one byte at a time or,
+        if the check has a **boundary** attribute, from the next byte with that value. Disabled by default;
+        BtMasterInputStreams can check the boundaries and the CRC of their frames through check_master_frame,
+        see MasterFrameCheck. It must be set before starting the stream.
+        """
+        return self._frame_check
+
+    @frame_check.setter
+    def frame_check(self, frame_check: Optional[Callable[[memoryview], bool]]):
+        if frame_check is self._frame_check:
+            return
+        if self._running:
+            raise ValueError("cannot change the frame check of a running stream")
+        self._frame_check = frame_check
+
+    def _make_filter(self, info: Frameinfo, **kwargs: Any) -> None:
+        # Compiles the selection options for the Frameinfo of the connected mote, if any is set
+        if self._decimation == 1 and self._deadband is None and self._projection is None:
+            self._filter = None
+            return
+        self._filter = _ChunkFilter(info, self._decimation, self._deadband, self._projection, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the metrics of this stream (received bytes and recv calls, decoded frames and chunks, decode
+        errors, number of callbacks and the time spent in them), together with the queue statistics of the
+        dispatcher, if any. Returns an empty dict if the stream has no metrics.
+        """
+        if self._metrics is None:
+            return {}
+        stats = self._metrics.stats()
+        if self._dispatcher is not None:
+            stats.update(self._dispatcher.stats().get(self._mac, {}))
+        return stats
+
+    def _set_transport(self, transport: Transport) -> None:
+        # Wraps the transport with the enabled instrumentation: metrics count what is actually received,
+        # the recorder logs it
+        self._base_transport = transport
+        if self._metrics is not None:
+            transport = _MeteredTransport(transport, self._metrics)
+        if self._timestamps or self._tracer is not None:
+            transport = _TimedTransport(transport, self._received)
+        if self._recorder is not None:
+            transport = _RecordingTransport(transport, self._recorder, self._mac, self._stream_kind)
+        self._transport = transport
+
+    def _received(self, size: int, recv_ns: int) -> None:
+        # Called after every read when timestamps or tracing are enabled
+        self._recv_ns = recv_ns
+        if self._tracer is not None:
+            self._tracer.on_recv(self._mac, size, recv_ns)
+
+    def _begin_stamps(self, samples: int) -> None:
+        # Called by _process before delivering the samples completed by the last read
+        self._stamp_first, self._stamp_step = self._timestamper.stamp(self._recv_ns, samples)
+
+    def _stamp(self, messages: List[Any], indexes: Optional[Sequence[int]] = None,
+               chunks: Optional[int] = None) -> List[Any]:
+        # Adds the interpolated timestamps to the messages, which follow the ones stamped before them; if some
+        # chunks were filtered out, indexes are the positions of the messages among the chunks received
+        first, step = self._stamp_first, self._stamp_step
+        if self._message_format is MessageFormat.COLUMNS:
+            columns = messages[0]
+            count = len(next(iter(columns.values())))
+            np = _numpy()
+            positions = np.arange(count) if indexes is None else indexes
+            columns["timestamp"] = (first + positions * step).astype(np.int64)
+        elif self._message_format is MessageFormat.RECORD:
+            count = len(messages)
+            positions = range(count) if indexes is None else indexes
+            stamped = record_type(messages[0]._fields + ("timestamp",)) if messages else None
+            messages = [tuple.__new__(stamped, message + (int(first + position * step),))
+                        for message, position in zip(messages, positions)]
+        else:
+            count = len(messages)
+            positions = range(count) if indexes is None else indexes
+            for message, position in zip(messages, positions):
+                message["timestamp"] = int(first + position * step)
+        self._stamp_first = first + (count if chunks is None else chunks) * step
+        return messages
+
+    def _decode_error(self) -> None:
+        if self._metrics is not None:
+            self._metrics.decode_errors += 1
+
+    def _blocks(self, buffer: FrameBuffer, framesize: int, chunksize: int) -> List[memoryview]:
+        # Takes the complete frames out of the buffer, as a single block or, if the stream has a frame check,
+        # as the blocks of consecutive valid frames, and starts timestamping their chunks
+        blocks = [buffer.block(framesize)] if self._frame_check is None else self._sync(buffer, framesize)
+        if self._timestamps:
+            self._begin_stamps(sum(len(block) for block in blocks) // chunksize)
+        return blocks
+
+    def _sync(self, buffer: FrameBuffer, framesize: int) -> List[memoryview]:
+        # Takes the valid frames out of the buffer, skipping the bytes between them; while the stream is in sync,
+        # all of the buffered frames are checked at once if the frame check supports it
+        check = self._frame_check
+        valid_prefix = getattr(check, "valid_prefix", None)
+        blocks = []
+        while True:
+            view = buffer.peek(framesize)
+            count = len(view) // framesize
+            if not count:
+                return blocks
+            if not self._synced:
+                valid = 1 if check(view[:framesize]) else 0
+                self._synced = valid == 1
+            elif valid_prefix is not None:
+                valid = valid_prefix(view, count)
+            else:
+                valid = 0
+                while valid < count and check(view[valid * framesize:(valid + 1) * framesize]):
+                    valid += 1
+            if valid:
+                blocks.append(buffer.block(framesize, valid))
+                if valid == count:
+                    return blocks
+                continue
+            self._resync(buffer, view[:framesize])
+
+    def _resync(self, buffer: FrameBuffer, frame: memoryview) -> None:
+        # Skips the invalid frame at the start of the buffer up to the next candidate frame start
+        check = self._frame_check
+        if self._synced:
+            self._synced = False
+            if self._metrics is not None:
+                self._metrics.resyncs += 1
+                framed = getattr(check, "framed", None)
+                if framed is not None and framed(frame):
+                    self._metrics.crc_errors += 1
+        boundary = getattr(check, "boundary", None)
+        skip = 1
+        if boundary is not None:
+            skip = buffer.find(boundary, 1)
+            if skip < 0:
+                skip = buffer.available
+        buffer.skip(skip)
+        if self._metrics is not None:
+            self._metrics.skipped_bytes += skip
+
+    def _count(self, frames: int, chunks: int) -> None:
+        # Called by _process with the number of decoded frames and chunks, if the stream has metrics
+        self._metrics.frames += frames
+        self._metrics.chunks += chunks
+
+    @property
+    def dispatcher(self) -> Optional[Dispatcher]:
+        """
+        The Dispatcher running the callbacks of this stream, None if they run in the receiving thread.
+        """
+        return self._dispatcher
+
+    @dispatcher.setter
+    def dispatcher(self, dispatcher: Optional[Dispatcher]):
+        self._dispatcher = dispatcher
+
+    def _notify(self, kind: EventKind, callback: Optional[Callable], *args: Any) -> None:
+        # Invokes the callback directly, or through the dispatcher if the stream has one
+        if callback is None:
+            return
+        if self._metrics is not None:
+            callback = self._metrics.timed(callback)
+        if self._tracer is not None and kind is not EventKind.EVENT:
+            callback = _Traced(callback, self._tracer, kind, self._recv_ns)
+            self._tracer.on_dispatch(self._mac, kind, self._recv_ns, monotonic_ns())
+        if self._dispatcher is None:
+            callback(self._mac, *args)
+        else:
+            self._dispatcher.submit(self._mac, kind, callback, self._mac, *args)
+
+    @property
+    def message_format(self) -> MessageFormat:
+        """
+        The format of the messages passed to the on_message/on_batch callbacks, defaults to MessageFormat.DICT.
+        """
+        return self._message_format
+
+    @message_format.setter
+    def message_format(self, message_format: MessageFormat):
+        if message_format is MessageFormat.COLUMNS:
+            _require_numpy()
+        self._message_format = message_format
+
+    @property
+    def batch_size(self) -> Optional[int]:
+        """
+        Maximum number of messages passed to a single on_batch call, None to disable the count limit.
+        """
+        return self._batch_size
+
+    @batch_size.setter
+    def batch_size(self, size: Optional[int]):
+        if size is not None and size <= 0:
+            raise ValueError("batch_size must be a positive integer")
+        self._batch_size = size
+
+    @property
+    def batch_latency(self) -> Optional[float]:
+        """
+        Maximum time in seconds that a message can wait in a partial batch, None to disable the deadline.
+        """
+        return self._batch_latency
+
+    @batch_latency.setter
+    def batch_latency(self, latency: Optional[float]):
+        if latency is not None and latency < 0:
+            raise ValueError("batch_latency must be a non-negative number")
+        self._batch_latency = latency
+
+    @property
+    def last_data(self) -> Optional[float]:
+        """
+        The time.monotonic() value of the last time that data was delivered, None if no data was received yet.
+        """
+        return self._last_data
+
+    @property
+    def frame_interval(self) -> Optional[float]:
+        """
+        The average time in seconds between two received frames, None if not enough data was received yet.
+        """
+        return self._frame_interval
+
+    def _deliver(self, messages: List[Any], indexes: Optional[Sequence[int]] = None,
+                 chunks: Optional[int] = None) -> None:
+        # Notifies the messages decoded from a single frame to the on_message and on_batch callbacks;
+        # indexes and chunks are passed when the stream has a filter (see _stamp)
+        if self._timestamps:
+            messages = self._stamp(messages, indexes, chunks)
+        count = len(next(iter(messages[0].values()))) if self._message_format is MessageFormat.COLUMNS \
+            else len(messages)
+        if self._tracer is not None:
+            self._tracer.on_decode(self._mac, count, self._recv_ns, monotonic_ns())
+        now = time.monotonic()
+        if self._last_data is not None:
+            interval = now - self._last_data
+            self._frame_interval = interval if self._frame_interval is None \
+                else 0.9 * self._frame_interval + 0.1 * interval
+        self._last_data = now
+        if not count:
+            # Every chunk was filtered out
+            return
+
+        if self._on_message:
+            for message in messages:
+                self._notify(EventKind.MESSAGE, self._on_message, message)
+        if not self._on_batch:
+            return
+        if self._batch_size is None and self._batch_latency is None:
+            self._notify(EventKind.BATCH, self._on_batch, messages)
+            return
+
+        if not self._batch:
+            self._batch_start = now
+        self._batch.extend(messages)
+        if self._batch_size is not None:
+            while len(self._batch) >= self._batch_size:
+                batch = self._batch[:self._batch_size]
+                del self._batch[:self._batch_size]
+                self._notify(EventKind.BATCH, self._on_batch, batch)
+        if self._batch and self._batch_latency is not None and now - self._batch_start >= self._batch_latency:
+            self._flush_batch()
+
+    def _flush_batch(self) -> None:
+        # Delivers any pending partial batch
+        if self._batch and self._on_batch:
+            batch = self._batch
+            self._batch = []
+            self._notify(EventKind.BATCH, self._on_batch, batch)
+
+    def _batch_deadline(self) -> Optional[float]:
+        # Seconds left before the pending partial batch must be delivered, None if there is no deadline
+        if not self._batch or self._batch_latency is None:
+            return None
+        return max(self._batch_start + self._batch_latency - time.monotonic(), 0.0)
+
+    def _fill(self, buffer: FrameBuffer) -> int:
+        # Reads from the blocking transport into buffer, as buffer.fill does, but waits for the data only until
+        # the deadline of the pending partial batch, delivering the batch if nothing arrives meanwhile
+        while True:
+            timeout = self._batch_deadline()
+            if timeout == 0:
+                self._flush_batch()
+                timeout = None
+            if timeout != self._read_timeout:
+                self._transport.settimeout(timeout)
+                self._read_timeout = timeout
+            try:
+                return buffer.fill(self._transport)
+            except socket.timeout:
+                self._flush_batch()
+
     @property
     def open(self) -> bool:
         """
@@ -85,26 +602,78 @@ class BtStream(ABC):
 
     def stop(self) -> None:
         """
-        Stops the Input stream: N.B. if this is called while when the stream loop is doing work,
-        that iteration of the loop won't be stopped.
+        Stops the Input stream, interrupting any pending read, so that the stream doesn't wait for the mote to send
+        more data before disconnecting. The disconnect callback is called with lost = False.
         """
         if self._running:
             self._running = False
+            self._stopped = True
+            self._abort()
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits up to **timeout** seconds (forever if None) for the stream to release its connection, e.g. after
+        **stop**. Returns False if it is still running.
+        """
+        return self._done.wait(timeout)
+
+    def _serving(self) -> None:
+        # Marks the stream as served by a thread, until _finish or the end of its loop
+        self._stopped = False
+        self._read_timeout = None
+        self._done.clear()
+
+    @abstractmethod
+    def _open(self) -> FrameBuffer:
+        pass
+
+    @abstractmethod
+    def _process(self, buffer: FrameBuffer) -> None:
+        pass
+
+    def _abort(self) -> None:
+        # Shuts the transport down, so that a thread blocked in recv returns immediately
+        self._transport.shutdown()
+
+    def _finish(self, lost: bool) -> None:
+        # Delivers any pending data, notifies the disconnection and releases the transport
+        self._flush_batch()
+        self._notify(EventKind.EVENT, self.on_disconnect, lost)
+        self._running = False
+        self._transport.close()
+        self._done.set()
 
     @abstractmethod
     def _loop(self):
         pass
 
-    def start(self):
+    def start(self, on_error: Optional[Callable[["BtStream", Exception], None]] = None):
         """
-        Starts the Input stream, non blocking.
+        Starts the Input stream, non blocking. If **on_error** is passed, it is called with the stream and
+        the raised exception when the stream can't be opened, instead of letting the exception propagate
+        in the stream thread.
         """
         if not self._running:
-            Thread(target=self._loop).start()
+            self._serving()
+            Thread(target=self._run, args=(on_error,), name=f"shimmer-{self._mac}").start()
+
+    def _run(self, on_error: Optional[Callable[["BtStream", Exception], None]]) -> None:
+        try:
+            self._loop()
+        except ConnectionError as err:
+            if on_error is None:
+                raise
+            on_error(self, err)
+        finally:
+            self._done.set()
 
     def loop_forever(self):
         if not self._running:
-            self._loop()
+            self._serving()
+            try:
+                self._loop()
+            finally:
+                self._done.set()
 
 
 class BtMasterInputStream(BtStream):
@@ -118,44 +687,85 @@ class BtMasterInputStream(BtStream):
     _framesize = 22
     _slave_frameinfo = Frameinfo(_framesize, _framesize, "HHHHHHHB",
                                  ["mac", "accel_x", "accel_y", "accel_z", "gyro_x", "gyro_y", "gyro_z"])
+    # Full frame layout: 7 B header, six sensor values, crc and end marker
+    _data_frameinfo = Frameinfo(_framesize, _framesize, "=7x6H3x",
+                                ["accel_x", "accel_y", "accel_z", "gyro_x", "gyro_y", "gyro_z"])
+    _frame_struct = struct.Struct(_data_frameinfo.format)
+    _stream_kind = "master"
 
-    def __init__(self, mac: str, sock: bluetooth.BluetoothSocket, uuid: str):
+    def __init__(self, mac: str, sock: Any, uuid: str):
         """
-        Initializes a new input stream from a Master mote.
+        Initializes a new input stream from a Master mote, connected through **sock**, either a Transport
+        or a connected socket object (such as the BluetoothSocket accepted from the mote).
         """
         super().__init__(mac=mac)
         self._uuid = uuid
-        self._sock = sock
+        self._set_transport(sock if isinstance(sock, Transport) else SocketTransport(sock))
+
+    def _process(self, buffer: FrameBuffer) -> None:
+        for block in self._blocks(buffer, self._framesize, self._framesize):
+            self._process_block(block)
+
+    def _process_block(self, block: memoryview) -> None:
+        # the following data split refers to the 22 B long frame structure discussed earlier
+        # the first seven and the last three bytes (crc, end) are ignored since we don't need them
+        # in this particular app, or only checked by the frame check, if enabled
+        frames = len(block) // self._framesize
+        if self._ring is not None:
+            self._ring.write_frames(block, self._data_frameinfo)
+        if self._metrics is not None:
+            self._count(frames, frames)
+        if self._filter is not None:
+            self._process_filtered(block)
+            return
+        if self._message_format is MessageFormat.COLUMNS:
+            if block:
+                self._deliver([get_decoder(self._data_frameinfo).to_columns(block)])
+            return
+        record = self._message_format is MessageFormat.RECORD
+        for data in self._frame_struct.iter_unpack(block):
+            fmt_data = (self._mac,) + data
+            if record:
+                self._deliver([tuple.__new__(SlaveDataTuple, fmt_data)])
+            else:
+                self._deliver([dict(zip(SlaveDataTuple._fields, fmt_data))])
+
+    def _process_filtered(self, block: memoryview) -> None:
+        # Decodes the frames selected by the filter of the stream, every frame being a single chunk
+        if self._message_format is MessageFormat.COLUMNS:
+            if block:
+                columns, indexes = self._filter.columns(block)
+                self._deliver([columns], indexes, len(block) // self._framesize)
+            return
+        record = self._message_format is MessageFormat.RECORD
+        for start in range(0, len(block), self._framesize):
+            messages, indexes = self._filter.messages(block[start:start + self._framesize], record)
+            self._deliver(messages, indexes, 1)
+
+    def _open(self) -> FrameBuffer:
+        # The connection is already established by the mote, there's no presentation frame to wait for
+        self._make_filter(self._data_frameinfo, prefix=("mac",), prefix_values=(self._mac,),
+                          record=SlaveDataTuple if self._projection is None else None)
+        self._notify(EventKind.EVENT, self.on_connect, self._slave_frameinfo)
+        self._running = True
+        self._synced = True
+        return FrameBuffer()
 
     def _loop(self) -> None:
-        if self.on_connect:
-            self.on_connect(self._mac, self._slave_frameinfo)
-
-        self._running = True
+        buffer = self._open()
         try:
             while self._running:
-                numbytes = 0
-                ddata = bytearray()
-                while numbytes < self._framesize:
-                    ddata += bytearray(self._sock.recv(self._framesize))
-                    numbytes = len(ddata)
-
-                # the following data split refers to the 22 B long frame structure discussed earlier
-                # the first seven and the last two fields (crc, end) are ignored since we don't need them
-                # in this particular app
-                data = ddata[0:self._framesize]
-                (accel_x, accel_y, accel_z, gyro_x, gyro_y, gyro_z, _, _) = struct.unpack("HHHHHHHB", data[7:22])
-                fmt_data = SlaveDataTuple(self._mac, accel_x, accel_y, accel_z, gyro_x, gyro_y, gyro_z)
-                if self.on_message:
-                    self.on_message(self._mac, fmt_data._asdict())
-            if self.on_disconnect:
-                self.on_disconnect(self._mac, False)
-        except bluetooth.btcommon.BluetoothError:
-            if self.on_disconnect:
-                self.on_disconnect(self._mac, True)
+                if self._fill(buffer) == 0:
+                    raise ConnectionResetError("connection closed by the peer")
+                self._process(buffer)
+            self._flush_batch()
+            self._notify(EventKind.EVENT, self.on_disconnect, False)
+        except ConnectionError:
+            self._flush_batch()
+            self._notify(EventKind.EVENT, self.on_disconnect, self._running)
         finally:
             self._running = False
-            self._sock.close()
+            self._transport.close()
 
 
 class BtSlaveInputStream(BtStream):
@@ -173,22 +783,19 @@ class BtSlaveInputStream(BtStream):
     """
     _pres_frame_size = 112
     _pres_frame_fmt = "BB10s100s"
+    _stream_kind = "slave"
 
-    def __init__(self, mac: str):
+    def __init__(self, mac: str, transport: Optional[Transport] = None):
         """
-        Initializes a new input stream from a Master mote.
+        Initializes a new input stream from a Slave mote, connecting through **transport**,
+        an RFCOMM connection to **mac** by default.
         """
         super().__init__(mac=mac)
         self._info = None
-        self._sock = bluetooth.BluetoothSocket(bluetooth.RFCOMM)
+        self._decoder = None
+        self._set_transport(transport if transport is not None else RfcommTransport(mac))
 
-    def _to_dict(self, raw_data: tuple):
-        d = {}
-        for idx, key in enumerate(self._info.keys):
-            d[key] = raw_data[idx]
-        return d
-
-    def _init_frameinfo(self, info: bytearray):
+    def _init_frameinfo(self, info: memoryview):
         fmt_unp = struct.unpack(BtSlaveInputStream._pres_frame_fmt, info)
         framesize = fmt_unp[0]
         lenchunks = fmt_unp[1]
@@ -209,53 +816,142 @@ class BtSlaveInputStream(BtStream):
                 or len(data_keys) != len(struct.unpack(chunk_fmt, b'\x00' * struct.calcsize(chunk_fmt))):
             raise ValueError
         self._info = Frameinfo(framesize, lenchunks, chunk_fmt, data_keys)
+        self._decoder = get_decoder(self._info)
+        self._synced = True
+        # Raises ValueError if the mote doesn't send the keys of the projection or of the deadband
+        self._make_filter(self._info)
+
+    def _connect(self) -> None:
+        # BUG in Win10 implementation, this will try to connect to previously paired
+        # devices, even when not on or close enough, raising an OSError
+        self._transport.connect()
+
+    def _process(self, buffer: FrameBuffer) -> None:
+        # Decodes the complete frames held by the buffer and notifies them to the callbacks
+        for block in self._blocks(buffer, self._info.framesize, self._info.lenchunks):
+            self._process_block(block)
+
+    def _process_block(self, block: memoryview) -> None:
+        framesize = self._info.framesize
+        frames = len(block) // framesize
+        if self._ring is not None:
+            self._ring.write_frames(block, self._info)
+        if self._metrics is not None:
+            self._count(frames, frames * (framesize // self._info.lenchunks))
+        if self._filter is not None:
+            self._process_filtered(block)
+            return
+        if self._message_format is MessageFormat.COLUMNS:
+            # Every complete frame received up to now is decoded with a single numpy call
+            if block:
+                self._deliver([self._decoder.to_columns(block)])
+            return
+        decode = self._decoder.to_records if self._message_format is MessageFormat.RECORD \
+            else self._decoder.to_dicts
+        for start in range(0, len(block), framesize):
+            # Every chunk of the frame is decoded in a single pass, then
+            # the messages are notified to the on message/batch callbacks
+            self._deliver(decode(block[start:start + framesize]))
+
+    def _process_filtered(self, block: memoryview) -> None:
+        # Decodes the chunks of the complete frames selected by the filter of the stream
+        framesize = self._info.framesize
+        if self._message_format is MessageFormat.COLUMNS:
+            if block:
+                columns, indexes = self._filter.columns(block)
+                self._deliver([columns], indexes, len(block) // self._info.lenchunks)
+            return
+        record = self._message_format is MessageFormat.RECORD
+        for start in range(0, len(block), framesize):
+            messages, indexes = self._filter.messages(block[start:start + framesize], record)
+            self._deliver(messages, indexes, framesize // self._info.lenchunks)
+
+    def _open(self) -> FrameBuffer:
+        self._connect()
+        self._running = True
 
-    def _loop(self):
+        # Wait for a 112 B presentation frame, without reading past it
+        buffer = FrameBuffer()
+        fmt_frame = buffer.read_exact(self._transport, BtSlaveInputStream._pres_frame_size)
+
+        # Parse presentation and notify the on connect callback
         try:
-            # Init BT socket and loop
-            # BUG in Win10 implementation, this will try to connect to previously paired
-            # devices, even when not on or close enough, raising an OSError
-            rf_port = 1
-            self._sock.connect((self._mac, rf_port))
-            self._running = True
-
-            # Wait for a 112 B presentation frame
-            fmt_len = 0
-            fmt_frame = bytearray()
-            while fmt_len < BtSlaveInputStream._pres_frame_size:
-                fmt_frame += bytearray(self._sock.recv(BtSlaveInputStream._pres_frame_size))
-                fmt_len = len(fmt_frame)
-
-            # Parse presentation and notify the on connect callback
             self._init_frameinfo(fmt_frame)
-            if self.on_connect:
-                self.on_connect(self._mac, self._info)
+        except (ValueError, struct.error):
+            self._decode_error()
+            raise
+        self._notify(EventKind.EVENT, self.on_connect, self._info)
+        return buffer
+
+    def _loop(self):
+        try:
+            buffer = self._open()
 
-            # Data reading loop based on frameinfo format
+            # Data reading loop based on frameinfo format: every read fills the buffer as much as
+            # possible, partial frames are kept in the buffer until the next read completes them
             while self._running:
-                data_len = 0
-                data = bytearray()
-                while data_len < self._info.framesize:
-                    data += bytearray(self._sock.recv(self._info.framesize))
-                    data_len = len(data)
-                for idx in range(0, self._info.framesize, self._info.lenchunks):
-                    raw_data = struct.unpack(self._info.format, data[idx:idx + self._info.lenchunks])
-                    # Msg received: Notify on message callback
-                    if self.on_message:
-                        self.on_message(self._mac, self._to_dict(raw_data))
-            if self.on_disconnect:
-                self.on_disconnect(self._mac, False)
-
-        except bluetooth.btcommon.BluetoothError:
-            if self._running and self.on_disconnect:
-                self.on_disconnect(self._mac, True)
+                if self._fill(buffer) == 0:
+                    raise ConnectionResetError("connection closed by the peer")
+                self._process(buffer)
+            self._flush_batch()
+            self._notify(EventKind.EVENT, self.on_disconnect, False)
+
+        except ConnectionError:
+            self._flush_batch()
+            if self._running or self._stopped:
+                # A stream stopped while blocked in recv is a clean disconnection
+                self._notify(EventKind.EVENT, self.on_disconnect, self._running)
             else:
-                raise bluetooth.BluetoothError(f"BT MAC {self._mac}: couldn't connect to the bluetooth interface")
+                raise TransportError(f"BT MAC {self._mac}: couldn't connect to the bluetooth interface")
         except (ValueError, struct.error):
-            if self._running and self.on_disconnect:
-                self.on_disconnect(self._mac, True)
+            if self._running:
+                self._notify(EventKind.EVENT, self.on_disconnect, True)
             else:
                 raise ConnectionError(f"BT MAC {self._mac}: error in decoding presentation frame!")
         finally:
             self._running = False
-            self._sock.close()
+            self._transport.close()
+
+
+def _deadline(timeout: Optional[float]) -> Optional[float]:
+    return None if timeout is None else time.monotonic() + timeout
+
+
+def _remaining(deadline: Optional[float]) -> Optional[float]:
+    # Seconds left before deadline, a time.monotonic() value, None if it is None (no deadline)
+    return None if deadline is None else max(deadline - time.monotonic(), 0)
+
+
+def _join_streams(streams: List[BtStream], deadline: Optional[float] = None) -> List[str]:
+    # Waits until deadline (forever if None) for the streams to release their connections,
+    # returning the macs of the ones still running
+    return [stream._mac for stream in streams if not stream.join(_remaining(deadline))]
+
+
+def _setup_stream(stream: BtStream,
+                  connect_handle: Optional[Callable[[str, Frameinfo], None]] = None,
+                  message_handle: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                  disconnect_handle: Optional[Callable[[str, bool], None]] = None,
+                  batch_handle: Optional[Callable[[str, List[Dict[str, Any]]], None]] = None,
+                  **kwargs: Any) -> None:
+    # Attaches the handlers and the stream options passed to bt_listen to a newly created stream
+    stream.on_connect = connect_handle
+    stream.on_message = message_handle
+    stream.on_disconnect = disconnect_handle
+    stream.on_batch = batch_handle
+    stream.batch_size = kwargs.get("batch_size")
+    stream.batch_latency = kwargs.get("batch_latency")
+    stream.message_format = kwargs.get("message_format", MessageFormat.DICT)
+    stream.dispatcher = kwargs.get("dispatcher")
+    stream.recorder = kwargs.get("recorder")
+    stream.timestamps = kwargs.get("timestamps", False)
+    stream.decimation = kwargs.get("decimation", 1)
+    if "frame_check" in kwargs:
+        stream.frame_check = kwargs["frame_check"]
+    stream.deadband = kwargs.get("deadband")
+    stream.projection = kwargs.get("projection")
+    rings = kwargs.get("rings")
+    stream.ring = rings.ring(stream._mac) if rings is not None else None
+    stream.tracer = kwargs.get("tracer")
+    metrics = kwargs.get("metrics")
+    stream.metrics = metrics.mote(stream._mac) if metrics is not None else None
@@ -0,0 +1,198 @@
+"""
+Supervision of the open streams.
+
+A Supervisor reconnects to the motes whose connection was lost as soon as possible, retrying with a jittered
+exponential backoff, and recycles the connections that stay open without delivering any data. The stall timeout
+of each stream is derived from its observed frame interval, since the Frameinfo doesn't carry the sampling rate.
+"""
+
+from typing import Callable, Dict, List, Optional, Tuple
+from threading import Condition, Thread
+import logging
+import random
+import heapq
+import time
+
+from ._streams import BtStream
+
+
+class _MoteState:
+    def __init__(self):
+        self.attempt = 0
+        self.reconnects = 0
+        self.failures = 0
+        self.stalls = 0
+        self.lost_at: Optional[float] = None
+        self.last_gap: Optional[float] = None
+        self.max_gap = 0.0
+        self.total_gap = 0.0
+
+    def stats(self) -> Dict[str, float]:
+        return {"reconnects": self.reconnects, "failures": self.failures, "stalls": self.stalls,
+                "attempt": self.attempt, "last_gap": self.last_gap, "max_gap": self.max_gap,
+                "total_gap": self.total_gap}
+
+
+class Supervisor:
+    """
+    Reconnects lost motes with a jittered exponential backoff and recycles stalled streams.
+
+    The n-th consecutive reconnection attempt for a mote is made right away if n = 0, otherwise after
+    **backoff_base** * **backoff_factor** ^ (n - 1) seconds, capped to **backoff_max** and randomly scaled
+    by up to ±**jitter**. A stream is considered stalled when it delivers no data for **stall_factor** times
+    its average frame interval, and never less than **min_stall_timeout** seconds; a stream that hasn't
+    received any data yet is given **connect_stall_timeout** seconds.
+    """
+
+    def __init__(self, reconnect: Optional[Callable[[str], None]] = None, backoff_base: float = 1.0,
+                 backoff_factor: float = 2.0, backoff_max: float = 60.0, jitter: float = 0.5,
+                 stall_factor: float = 10.0, min_stall_timeout: float = 5.0, connect_stall_timeout: float = 30.0,
+                 check_interval: float = 1.0):
+        """
+        Starts the supervisor thread; **reconnect** is called with the mac of each mote to reconnect to,
+        if None, the supervisor only recycles stalled streams.
+        """
+        self._reconnect = reconnect
+        self._backoff_base = backoff_base
+        self._backoff_factor = backoff_factor
+        self._backoff_max = backoff_max
+        self._jitter = jitter
+        self._stall_factor = stall_factor
+        self._min_stall_timeout = min_stall_timeout
+        self._connect_stall_timeout = connect_stall_timeout
+        self._check_interval = check_interval
+
+        self._cond = Condition()
+        self._motes: Dict[str, _MoteState] = {}
+        self._scheduled: List[Tuple[float, str]] = []
+        self._watched: Dict[str, Tuple[BtStream, float]] = {}
+        self._closed = False
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _state(self, mac: str) -> _MoteState:
+        state = self._motes.get(mac)
+        if state is None:
+            state = self._motes[mac] = _MoteState()
+        return state
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Returns the delay before the given reconnection attempt.
+        """
+        if attempt == 0:
+            return 0.0
+        delay = min(self._backoff_max, self._backoff_base * self._backoff_factor ** (attempt - 1))
+        return delay * random.uniform(1 - self._jitter, 1 + self._jitter)
+
+    def watch(self, stream: BtStream) -> None:
+        """
+        Starts checking the stream for stalls, until it disconnects.
+        """
+        with self._cond:
+            self._watched[stream._mac] = (stream, time.monotonic())
+
+    def connected(self, mac: str) -> None:
+        """
+        Notifies that the mote is connected again, resetting its backoff.
+        """
+        with self._cond:
+            state = self._state(mac)
+            if state.lost_at is not None:
+                gap = time.monotonic() - state.lost_at
+                state.last_gap = gap
+                state.max_gap = max(state.max_gap, gap)
+                state.total_gap += gap
+                state.lost_at = None
+                state.reconnects += 1
+            state.attempt = 0
+
+    def lost(self, mac: str, failed: bool = False) -> None:
+        """
+        Notifies that the connection with the mote was lost, or that a connection attempt **failed**,
+        scheduling the next reconnection attempt.
+        """
+        with self._cond:
+            state = self._state(mac)
+            self._watched.pop(mac, None)
+            if failed:
+                state.failures += 1
+            if state.lost_at is None:
+                state.lost_at = time.monotonic()
+            if self._reconnect is None or self._closed or self.pending(mac):
+                return
+            delay = self.backoff(state.attempt)
+            state.attempt += 1
+            heapq.heappush(self._scheduled, (time.monotonic() + delay, mac))
+            self._cond.notify_all()
+
+    def pending(self, mac: str) -> bool:
+        """
+        Returns True if a reconnection attempt is scheduled for the mote.
+        """
+        with self._cond:
+            return any(scheduled_mac == mac for _, scheduled_mac in self._scheduled)
+
+    def _stall_timeout(self, stream: BtStream) -> float:
+        if stream.frame_interval is None:
+            return self._connect_stall_timeout
+        return max(self._min_stall_timeout, self._stall_factor * stream.frame_interval)
+
+    def _run(self) -> None:
+        next_check = time.monotonic()
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                due = []
+                while self._scheduled and self._scheduled[0][0] <= now:
+                    due.append(heapq.heappop(self._scheduled)[1])
+                stalled = []
+                if now >= next_check:
+                    next_check = now + self._check_interval
+                    for mac, (stream, watched_at) in list(self._watched.items()):
+                        if not stream.open:
+                            # The stall timeout starts when the stream is open
+                            self._watched[mac] = (stream, now)
+                            continue
+                        last_data = stream.last_data if stream.last_data is not None else watched_at
+                        if now - last_data > self._stall_timeout(stream):
+                            self._state(mac).stalls += 1
+                            del self._watched[mac]
+                            stalled.append(stream)
+                if not due and not stalled:
+                    if self._closed:
+                        return
+                    timeout = next_check - now
+                    if self._scheduled:
+                        timeout = min(timeout, self._scheduled[0][0] - now)
+                    self._cond.wait(max(timeout, 0))
+                    continue
+
+            for stream in stalled:
+                logging.warning(f"BT MAC {stream._mac}: no data received, recycling the connection")
+                stream._abort()
+            for mac in due:
+                try:
+                    self._reconnect(mac)
+                except Exception:
+                    logging.exception(f"BT MAC {mac}: error while reconnecting")
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns, for each mote, the number of reconnections, failed attempts and recycled stalls, the current
+        backoff attempt and the duration in seconds of the gaps in the reception due to lost connections
+        (last, maximum and total).
+        """
+        with self._cond:
+            return {mac: state.stats() for mac, state in self._motes.items()}
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """
+        Cancels any scheduled reconnection and stops the supervisor thread.
+        """
+        with self._cond:
+            self._closed = True
+            self._scheduled.clear()
+            self._watched.clear()
+            self._cond.notify_all()
+        self._thread.join(timeout)
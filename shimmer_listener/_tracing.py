@@ -0,0 +1,178 @@
+"""
+Host timestamps and tracing of the received data.
+
+When timestamps are enabled, the time at which each read completes is taken with time.monotonic_ns() and the
+samples it completes are spread backwards from it, one sampling interval apart: the interval is estimated from the
+number of samples received over time, so the samples of a frame, or of a burst of frames delivered at once by the
+Bluetooth stack, get the timestamps they would have had if they were received one at a time.
+
+A Tracer is notified at each stage of the path of the data (recv, decode, dispatch and callback return) with the
+time the read carrying the data completed, so that the latency of each stage can be measured.
+"""
+
+from typing import Any, Callable, Dict, Optional, Tuple
+from threading import Lock
+import time
+
+from ._dispatch import EventKind
+from ._metrics import Histogram
+from ._transport import Transport, _TransportWrapper
+
+try:
+    monotonic_ns = time.monotonic_ns
+except AttributeError:
+    # Python < 3.7
+    def monotonic_ns() -> int:
+        return int(time.monotonic() * 1e9)
+
+
+class _Timestamper:
+    # Estimates the sampling interval and interpolates the timestamps of the received samples
+
+    def __init__(self):
+        self._last_recv: Optional[int] = None
+        self._last_stamp: Optional[float] = None
+        self._interval: Optional[float] = None
+
+    def stamp(self, recv_ns: int, samples: int) -> Tuple[float, float]:
+        # Returns the timestamp of the first of the samples completed by the read at recv_ns, and the interval
+        # between two consecutive samples. The last sample is stamped recv_ns, timestamps never go backwards
+        if samples <= 0:
+            return float(recv_ns), 0.0
+        if self._last_recv is not None:
+            observed = (recv_ns - self._last_recv) / samples
+            self._interval = observed if self._interval is None else 0.9 * self._interval + 0.1 * observed
+        self._last_recv = recv_ns
+
+        step = self._interval or 0.0
+        first = recv_ns - (samples - 1) * step
+        if self._last_stamp is not None and first <= self._last_stamp:
+            step = (recv_ns - self._last_stamp) / samples
+            first = self._last_stamp + step
+        self._last_stamp = float(recv_ns)
+        return first, step
+
+
+class _TimedTransport(_TransportWrapper):
+    # Wraps the transport of a stream, notifying the completion time of every read
+
+    def __init__(self, transport: Transport, on_recv: Callable[[int, int], None]):
+        super().__init__(transport)
+        self._on_recv = on_recv
+
+    def recv_into(self, buffer: Any, nbytes: int = 0) -> int:
+        received = self._transport.recv_into(buffer, nbytes)
+        self._on_recv(received, monotonic_ns())
+        return received
+
+
+class Tracer:
+    """
+    Receives the trace events of the streams it is attached to, see BtStream.tracer. Every method gets
+    the mac of the mote, the time.monotonic_ns() completion time of the read carrying the data (**recv_ns**)
+    and the current time (**now_ns**); the default implementation ignores every event.
+
+    The methods are called by the receiving threads and, when a Dispatcher is used, by its workers,
+    so they must be quick and thread safe.
+    """
+
+    def on_recv(self, mac: str, size: int, recv_ns: int) -> None:
+        """
+        Called when a read of **size** bytes completes.
+        """
+        pass
+
+    def on_decode(self, mac: str, messages: int, recv_ns: int, now_ns: int) -> None:
+        """
+        Called when a frame, or a block of frames, is decoded into **messages** messages.
+        """
+        pass
+
+    def on_dispatch(self, mac: str, kind: EventKind, recv_ns: int, now_ns: int) -> None:
+        """
+        Called when a message or batch callback is invoked, or queued to the dispatcher.
+        """
+        pass
+
+    def on_return(self, mac: str, kind: EventKind, recv_ns: int, now_ns: int) -> None:
+        """
+        Called when a message or batch callback returns.
+        """
+        pass
+
+
+class _Traced:
+    # Callback wrapper notifying its return to the tracer; wrappers of the same callback compare equal,
+    # so that queued invocations can still be coalesced
+
+    __slots__ = ("callback", "tracer", "kind", "recv_ns")
+
+    def __init__(self, callback: Callable, tracer: Tracer, kind: EventKind, recv_ns: int):
+        self.callback = callback
+        self.tracer = tracer
+        self.kind = kind
+        self.recv_ns = recv_ns
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, _Traced) and self.callback == other.callback
+
+    def __hash__(self) -> int:
+        return hash(self.callback)
+
+    def __call__(self, mac: str, *args: Any) -> None:
+        try:
+            self.callback(mac, *args)
+        finally:
+            self.tracer.on_return(mac, self.kind, self.recv_ns, monotonic_ns())
+
+
+class _MoteLatency:
+    def __init__(self):
+        self.histogram = Histogram()
+        self.last: Optional[float] = None
+        self.max = 0.0
+        self.jitter = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        histogram = self.histogram
+        mean = histogram.sum / histogram.count if histogram.count else None
+        return {"deliveries": histogram.count, "latency_mean": mean, "latency_last": self.last,
+                "latency_max": self.max, "jitter": self.jitter}
+
+
+class LatencyTracer(Tracer):
+    """
+    Tracer measuring, for each mote, the latency in seconds from the completion of a read to the return of the
+    callbacks receiving its data, and its jitter, estimated as in RFC 3550 (the smoothed mean deviation between
+    consecutive latencies).
+    """
+
+    def __init__(self):
+        self._mutex = Lock()
+        self._motes: Dict[str, _MoteLatency] = {}
+
+    def on_return(self, mac: str, kind: EventKind, recv_ns: int, now_ns: int) -> None:
+        latency = (now_ns - recv_ns) / 1e9
+        with self._mutex:
+            mote = self._motes.get(mac)
+            if mote is None:
+                mote = self._motes[mac] = _MoteLatency()
+            mote.histogram.observe(latency)
+            if mote.last is not None:
+                mote.jitter += (abs(latency - mote.last) - mote.jitter) / 16
+            mote.last = latency
+            mote.max = max(mote.max, latency)
+
+    def histograms(self) -> Dict[str, Histogram]:
+        """
+        Returns the latency histogram of each mote.
+        """
+        with self._mutex:
+            return {mac: mote.histogram for mac, mote in self._motes.items()}
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns, for each mote, the number of traced deliveries, the mean, last and maximum latency and the jitter.
+        """
+        with self._mutex:
+            return {mac: mote.stats() for mac, mote in self._motes.items()}
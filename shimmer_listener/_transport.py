@@ -0,0 +1,276 @@
+"""
+Transports carrying the byte stream of a mote.
+
+The streams only need to connect, read into a buffer and close their connection, so the same decoding can be fed
+by an RFCOMM socket, by a TCP or Unix-domain socket (e.g. a serial-to-TCP bridge or a replay server) or by an
+in-process pipe written by a test harness or a load generator, with no Bluetooth hardware involved.
+
+Every transport maps the errors of the underlying connection to ConnectionError subclasses, TransportError for
+anything but a connection reset, so that the streams handle them in the same way whatever the transport. The
+exceptions signaling that a non-blocking or timed out read has no data yet (BlockingIOError, InterruptedError,
+socket.timeout) are left untouched.
+
+pybluez is only imported when a Bluetooth connection is first needed, so that the rest of the library can be
+used where it isn't installed (pip install shimmer-listener[bluetooth]).
+"""
+
+from typing import Any, Optional, Tuple
+from abc import ABC, abstractmethod
+from types import ModuleType
+import socket
+import errno
+
+
+def _bluetooth() -> ModuleType:
+    # Imports pybluez on first use, raising an ImportError explaining how to install it if it is missing
+    try:
+        import bluetooth
+    except ImportError as err:
+        raise ImportError("pybluez is required for the bluetooth connections: "
+                          "pip install shimmer-listener[bluetooth]") from err
+    return bluetooth
+
+
+class TransportError(ConnectionError):
+    """
+    Raised when a transport operation fails.
+    """
+    pass
+
+
+class Transport(ABC):
+    """
+    Byte stream connection with a mote. Transports expose a socket-like interface (recv_into, fileno,
+    setblocking), so that they can be read through a FrameBuffer and multiplexed by a Reactor or an asyncio loop.
+    """
+
+    @abstractmethod
+    def connect(self) -> None:
+        """
+        Establishes the connection, a no-op for the transports that are already connected.
+        """
+        pass
+
+    @abstractmethod
+    def recv_into(self, buffer: Any, nbytes: int = 0) -> int:
+        """
+        Reads up to **nbytes** bytes (len(buffer) if 0) into **buffer**, returning the number of bytes received,
+        0 meaning that the peer closed the connection.
+        """
+        pass
+
+    def recv(self, size: int) -> bytes:
+        """
+        Reads up to **size** bytes.
+        """
+        buffer = bytearray(size)
+        received = self.recv_into(buffer, size)
+        return bytes(buffer[:received])
+
+    @abstractmethod
+    def fileno(self) -> int:
+        """
+        The file descriptor that can be polled for incoming data.
+        """
+        pass
+
+    @abstractmethod
+    def setblocking(self, flag: bool) -> None:
+        pass
+
+    @abstractmethod
+    def settimeout(self, timeout: Optional[float]) -> None:
+        pass
+
+    @abstractmethod
+    def shutdown(self) -> None:
+        """
+        Shuts the connection down, so that a thread blocked in a read returns immediately. Never raises.
+        """
+        pass
+
+    @abstractmethod
+    def close(self) -> None:
+        pass
+
+
+class _TransportWrapper(Transport):
+    # Base of the transports adding some behavior to another one, to which every operation is delegated
+
+    def __init__(self, transport: Transport):
+        self._transport = transport
+
+    def connect(self) -> None:
+        self._transport.connect()
+
+    def recv_into(self, buffer: Any, nbytes: int = 0) -> int:
+        return self._transport.recv_into(buffer, nbytes)
+
+    def fileno(self) -> int:
+        return self._transport.fileno()
+
+    def setblocking(self, flag: bool) -> None:
+        self._transport.setblocking(flag)
+
+    def settimeout(self, timeout: Optional[float]) -> None:
+        self._transport.settimeout(timeout)
+
+    def shutdown(self) -> None:
+        self._transport.shutdown()
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+def _map_error(err: OSError) -> OSError:
+    # Errors without data to read and connection resets are kept, any other failure becomes a TransportError
+    if isinstance(err, (BlockingIOError, InterruptedError, socket.timeout, ConnectionError)):
+        return err
+    if str(err) == "timed out":
+        # pybluez raises the expired timeouts as a generic BluetoothError
+        return socket.timeout(str(err))
+    if err.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+        # As it does with the reads of a non-blocking socket without data to read
+        return BlockingIOError(err.errno, err.strerror)
+    mapped = TransportError(str(err))
+    mapped.__cause__ = err
+    return mapped
+
+
+class SocketTransport(Transport):
+    """
+    Transport over a socket object, connected to **address** by **connect** if passed. Sockets that only
+    implement recv, such as the pybluez BluetoothSocket, are read through an intermediate copy.
+    """
+
+    def __init__(self, sock: Any, address: Any = None):
+        """
+        Wraps **sock**, which is already connected unless an **address** is passed.
+        """
+        self._sock = sock
+        self._address = address
+
+    @property
+    def address(self) -> Any:
+        return self._address
+
+    def connect(self) -> None:
+        if self._address is None:
+            return
+        try:
+            self._sock.connect(self._address)
+        except OSError as err:
+            raise _map_error(err)
+
+    def recv_into(self, buffer: Any, nbytes: int = 0) -> int:
+        try:
+            recv_into = getattr(self._sock, "recv_into", None)
+            if recv_into is not None:
+                return recv_into(buffer, nbytes)
+            data = self._sock.recv(nbytes or len(buffer))
+        except OSError as err:
+            raise _map_error(err)
+        received = len(data)
+        buffer[:received] = data
+        return received
+
+    def recv(self, size: int) -> bytes:
+        try:
+            return self._sock.recv(size)
+        except OSError as err:
+            raise _map_error(err)
+
+    def fileno(self) -> int:
+        return self._sock.fileno()
+
+    def setblocking(self, flag: bool) -> None:
+        self._sock.setblocking(flag)
+
+    def settimeout(self, timeout: Optional[float]) -> None:
+        self._sock.settimeout(timeout)
+
+    def shutdown(self) -> None:
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close(self) -> None:
+        try:
+            self._sock.close()
+        except OSError:
+            pass
+
+
+class RfcommTransport(SocketTransport):
+    """
+    Bluetooth RFCOMM transport, connecting to the mote with the given **mac** on **port**,
+    or wrapping an already connected BluetoothSocket.
+    """
+
+    # RFCOMM channel of the shimmer serial port profile
+    _def_port = 1
+
+    def __init__(self, mac: Optional[str] = None, port: int = _def_port, sock: Any = None):
+        """
+        Creates a new RFCOMM socket connecting to (**mac**, **port**), or wraps **sock** if passed.
+        """
+        if sock is None:
+            bluetooth = _bluetooth()
+            sock = bluetooth.BluetoothSocket(bluetooth.RFCOMM)
+            address = (mac, port)
+        else:
+            address = None
+        super().__init__(sock, address)
+
+
+class TcpTransport(SocketTransport):
+    """
+    TCP transport, e.g. towards a serial-to-TCP bridge forwarding the data of a mote.
+    """
+
+    def __init__(self, address: Tuple[str, int]):
+        """
+        Creates a new TCP socket connecting to (host, port) **address**.
+        """
+        super().__init__(socket.socket(socket.AF_INET, socket.SOCK_STREAM), address)
+
+
+class UnixTransport(SocketTransport):
+    """
+    Unix-domain stream socket transport.
+    """
+
+    def __init__(self, path: str):
+        """
+        Creates a new Unix-domain socket connecting to **path**.
+        """
+        super().__init__(socket.socket(socket.AF_UNIX, socket.SOCK_STREAM), path)
+
+
+class PipeTransport(SocketTransport):
+    """
+    In-process transport: the bytes passed to **write** are read by the stream as if they were sent by a mote,
+    and **end** closes the writing side, as a mote disconnecting. The pipe is backed by a socket pair, so it can
+    be polled by a Reactor or an asyncio loop like any other transport.
+    """
+
+    def __init__(self):
+        """
+        Creates a new, already connected, pipe.
+        """
+        reader, self._writer = socket.socketpair()
+        super().__init__(reader)
+
+    def write(self, data: bytes) -> None:
+        """
+        Sends **data** to the reading side, blocking while the pipe is full.
+        """
+        self._writer.sendall(data)
+
+    def end(self) -> None:
+        """
+        Closes the writing side: the stream reads the data still in the pipe, then sees the connection closed.
+        The writing side is left to the writer, closing the stream doesn't close it.
+        """
+        self._writer.close()
@@ -0,0 +1,13 @@
+"""
+Benchmarks of the decoding of the streams, fed by emulated motes instead of real ones.
+
+A MoteEmulator streams synthetic data over in-process sockets, speaking the presentation protocol of the slave
+motes or the 22 B frames of the BluetoothMasterTest app, at a given rate; run_benchmark reads it through the
+usual streams and measures the decoding throughput, the latency of the messages, the CPU and memory usage.
+The shimmer-bench console script runs it for a growing number of motes.
+"""
+
+from ._emulator import MoteEmulator
+from ._runner import BenchmarkResult, run_benchmark
+
+__all__ = ["MoteEmulator", "BenchmarkResult", "run_benchmark"]
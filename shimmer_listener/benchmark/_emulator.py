@@ -0,0 +1,177 @@
+from typing import Dict, List, Optional
+from threading import Event, Thread
+from array import array
+import struct
+import time
+
+from .. import BtMode
+from .._streams import BtStream, BtMasterInputStream, BtSlaveInputStream
+from .._framing import master_frame
+from .._transport import PipeTransport
+
+
+class MoteEmulator:
+    """
+    Emulates **motes** shimmer motes streaming their data over in-process socket pairs, either as the slave
+    motes read in master mode (**mode** = BtMode.MASTER), which send the presentation frame followed by frames
+    of **chunks** chunks of a sequence number and **values** samples each, or as the BluetoothMasterTest motes
+    read in slave mode (**mode** = BtMode.SLAVE), which send valid 22 B frames (see master_frame) carrying
+    the sequence number in accel_x. Every mote sends **rate** frames per second, or as many as the streams can
+    read if **rate** is 0.
+
+    The sequence number of a frame is its index modulo 65536, the time it was sent can be retrieved through
+    **sent_at** to measure the latency of its messages.
+    """
+
+    _seq_range = 65536
+
+    def __init__(self, motes: int, mode: BtMode = BtMode.MASTER, rate: float = 0, chunks: int = 4,
+                 values: int = 6):
+        """
+        Prepares the emulated motes, see the class docstring for the meaning of the parameters.
+        """
+        if motes <= 0:
+            raise ValueError("the number of motes must be a positive integer")
+        if rate < 0:
+            raise ValueError("rate must be a non-negative number")
+        if not 0 < values < 10:
+            raise ValueError("values must be between 1 and 9")
+        self._mode = mode
+        self._rate = rate
+        self._macs = [f"00:00:00:00:{idx // 256:02X}:{idx % 256:02X}" for idx in range(motes)]
+        self._pipes: Dict[str, PipeTransport] = {}
+        self._sent_at = array("d", [0.0]) * self._seq_range
+        self._frames_sent = 0
+        self._bytes_sent = 0
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+
+        if mode is BtMode.MASTER:
+            self._chunk_fmt = f"H{values}h"
+            self._chunk = struct.Struct(self._chunk_fmt)
+            self._chunks = chunks
+            self._framesize = self._chunk.size * chunks
+            if self._framesize > 255:
+                raise ValueError("the frame size can't be larger than 255 B")
+            self._keys = ["seq"] + [f"v{idx}" for idx in range(values)]
+            self._samples = list(range(values))
+        else:
+            self._framesize = BtMasterInputStream._framesize
+            self._keys = ["accel_x"]
+
+    @property
+    def macs(self) -> List[str]:
+        return list(self._macs)
+
+    @property
+    def seq_key(self) -> str:
+        """
+        The message key holding the sequence number of the frame.
+        """
+        return self._keys[0]
+
+    @property
+    def framesize(self) -> int:
+        return self._framesize
+
+    @property
+    def frames_sent(self) -> int:
+        """
+        Number of frames sent by each mote.
+        """
+        return self._frames_sent
+
+    @property
+    def bytes_sent(self) -> int:
+        """
+        Number of bytes sent by all of the motes.
+        """
+        return self._bytes_sent
+
+    def sent_at(self, seq: int) -> float:
+        """
+        The time.monotonic() value of when the frames with sequence number **seq** were sent.
+        """
+        return self._sent_at[seq]
+
+    def presentation_frame(self) -> bytes:
+        """
+        Returns the presentation frame sent by each mote in BtMode.MASTER.
+        """
+        keys = b"".join(struct.pack("10s", key.encode()) for key in self._keys)
+        return struct.pack(BtSlaveInputStream._pres_frame_fmt, self._framesize, self._chunk.size,
+                           self._chunk_fmt.encode(), keys)
+
+    def frame(self, seq: int) -> bytes:
+        """
+        Returns the frame with sequence number **seq**.
+        """
+        if self._mode is BtMode.MASTER:
+            return self._chunk.pack(seq, *self._samples) * self._chunks
+        return master_frame((seq, 1, 2, 3, 4, 5))
+
+    def streams(self) -> List[BtStream]:
+        """
+        Creates a stream reading each emulated mote, to be started before the emulator.
+        """
+        streams: List[BtStream] = []
+        for mac in self._macs:
+            pipe = PipeTransport()
+            self._pipes[mac] = pipe
+            if self._mode is BtMode.MASTER:
+                streams.append(BtSlaveInputStream(mac, pipe))
+            else:
+                streams.append(BtMasterInputStream(mac, pipe, None))
+        return streams
+
+    def start(self) -> None:
+        """
+        Starts sending the data of every mote from a background thread.
+        """
+        if self._mode is BtMode.MASTER:
+            for pipe in self._pipes.values():
+                pipe.write(self.presentation_frame())
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _send(self, count: int) -> None:
+        # Sends the next count frames of every mote, all of them timestamped before the first write
+        first = self._frames_sent
+        data = b"".join(self.frame((first + idx) % self._seq_range) for idx in range(count))
+        now = time.monotonic()
+        for idx in range(count):
+            self._sent_at[(first + idx) % self._seq_range] = now
+        for mac, pipe in list(self._pipes.items()):
+            try:
+                pipe.write(data)
+                self._bytes_sent += len(data)
+            except OSError:
+                # The stream was closed
+                del self._pipes[mac]
+                pipe.end()
+        self._frames_sent += count
+
+    def _run(self) -> None:
+        # Frames are sent in bursts: as many as needed to keep up with the rate, or a fixed amount
+        # for each round when sending as fast as possible
+        start = time.monotonic()
+        burst = 64
+        while not self._stop.is_set() and self._pipes:
+            if self._rate == 0:
+                self._send(burst)
+                continue
+            due = int((time.monotonic() - start) * self._rate) + 1
+            if due > self._frames_sent:
+                self._send(due - self._frames_sent)
+            self._stop.wait(max(0.0, start + due / self._rate - time.monotonic()))
+
+    def stop(self) -> None:
+        """
+        Stops sending, then closes the connection of every mote.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        for pipe in self._pipes.values():
+            pipe.end()
+        self._pipes.clear()
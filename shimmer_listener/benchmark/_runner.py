@@ -0,0 +1,103 @@
+from typing import Any, List, Optional
+from collections import namedtuple
+from threading import Condition
+from array import array
+import time
+import sys
+
+from .. import BtMode, MessageFormat, Reactor
+from ._emulator import MoteEmulator
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+BenchmarkResult = namedtuple("BenchmarkResult", [
+    "motes", "messages", "frames", "elapsed", "throughput", "byte_rate",
+    "latency_p50", "latency_p95", "latency_p99", "latency_max", "cpu", "max_rss"])
+"""
+Result of a benchmark run: decoded messages and sent frames, elapsed seconds, messages and bytes per second,
+message latency percentiles in seconds, CPU usage (1.0 being a fully busy core) and peak resident memory in MiB
+(None where unavailable)
+"""
+
+
+def _percentile(values: List[float], percentile: float) -> Optional[float]:
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * percentile / 100))]
+
+
+def _max_rss() -> Optional[float]:
+    # ru_maxrss is in KiB on Linux, in bytes on macOS
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+
+
+def run_benchmark(motes: int, mode: BtMode = BtMode.MASTER, rate: float = 0, duration: float = 5.0,
+                  chunks: int = 4, values: int = 6, message_format: MessageFormat = MessageFormat.DICT,
+                  reactor: bool = False) -> BenchmarkResult:
+    """
+    Streams the data of **motes** emulated motes (see MoteEmulator for **mode**, **rate**, **chunks** and
+    **values**) for **duration** seconds through the usual streams, decoding it in the given **message_format**,
+    with a thread for each stream or with a single Reactor. The emulator runs in the same process, so the
+    measured CPU usage includes the cost of generating the data.
+    """
+    emulator = MoteEmulator(motes, mode, rate, chunks, values)
+    seq_key = emulator.seq_key
+    latencies = array("d")
+    received = {"disconnected": 0}
+    done = Condition()
+    sent_at = emulator.sent_at
+
+    def on_message(_, message: Any) -> None:
+        now = time.monotonic()
+        if message_format is MessageFormat.COLUMNS:
+            seqs = message[seq_key].tolist()
+        elif message_format is MessageFormat.RECORD:
+            seqs = (getattr(message, seq_key),)
+        else:
+            seqs = (message[seq_key],)
+        for seq in seqs:
+            latencies.append(now - sent_at(seq))
+
+    def on_disconnect(*_) -> None:
+        with done:
+            received["disconnected"] += 1
+            done.notify_all()
+
+    streams = emulator.streams()
+    stream_reactor = Reactor() if reactor else None
+    for stream in streams:
+        stream.on_message = on_message
+        stream.on_disconnect = on_disconnect
+        stream.message_format = message_format
+        if stream_reactor is not None:
+            stream_reactor.add(stream)
+        else:
+            stream.start()
+
+    start = time.monotonic()
+    cpu_start = time.process_time()
+    emulator.start()
+    time.sleep(duration)
+    emulator.stop()
+    with done:
+        done.wait_for(lambda: received["disconnected"] == motes, timeout=max(10.0, duration))
+    elapsed = time.monotonic() - start
+    cpu = (time.process_time() - cpu_start) / elapsed
+    if stream_reactor is not None:
+        stream_reactor.close()
+
+    frames = emulator.frames_sent * motes
+    ordered = sorted(latencies)
+    return BenchmarkResult(
+        motes=motes, messages=len(ordered), frames=frames, elapsed=elapsed,
+        throughput=len(ordered) / elapsed, byte_rate=emulator.bytes_sent / elapsed,
+        latency_p50=_percentile(ordered, 50), latency_p95=_percentile(ordered, 95),
+        latency_p99=_percentile(ordered, 99), latency_max=ordered[-1] if ordered else None,
+        cpu=cpu, max_rss=_max_rss())
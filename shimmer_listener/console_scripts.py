@@ -1,6 +1,7 @@
-from shimmer_listener import bt_init, bt_listen, bt_close, BtMode
-import bluetooth
+from shimmer_listener import bt_init, bt_listen, bt_close, BtMode, MessageFormat
+import argparse
 import logging
+import json
 
 
 logging.basicConfig(level=logging.INFO)
@@ -44,8 +45,51 @@ def printer_app():
     try:
         bt_listen(connect_handle=on_connect, message_handle=on_message,
                   disconnect_handle=on_disconnect)
-    except bluetooth.btcommon.BluetoothError as be:
+    except OSError as be:
+        # Raised as BluetoothError by pybluez
         logging.error(be)
         bt_close()
     except KeyboardInterrupt:
         bt_close()
+
+
+def bench_app():
+    """
+    Benchmarks the decoding of the streams with a growing number of emulated motes, printing the throughput,
+    the latency percentiles, the CPU and memory usage of each run.
+    """
+    from shimmer_listener.benchmark import run_benchmark
+
+    parser = argparse.ArgumentParser(prog="shimmer-bench", description=bench_app.__doc__)
+    parser.add_argument("--motes", default="1,10,50",
+                        help="comma separated numbers of emulated motes, one run each (default: 1,10,50)")
+    parser.add_argument("--mode", choices=["master", "slave"], default="master",
+                        help="master: motes using the presentation protocol, slave: BluetoothMasterTest motes")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="frames per second sent by each mote, 0 to send as fast as possible (default: 0)")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds for each run (default: 5)")
+    parser.add_argument("--chunks", type=int, default=4, help="chunks per frame in master mode (default: 4)")
+    parser.add_argument("--values", type=int, default=6, help="values per chunk in master mode (default: 6)")
+    parser.add_argument("--format", choices=[fmt.name.lower() for fmt in MessageFormat], default="dict",
+                        help="message format (default: dict)")
+    parser.add_argument("--reactor", action="store_true", help="serve every stream from a single thread")
+    parser.add_argument("--json", action="store_true", help="print a JSON object for each run")
+    args = parser.parse_args()
+
+    if not args.json:
+        print(f"{'motes':>6} {'msg/s':>12} {'KiB/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'max ms':>8} {'cpu':>6} {'rss MiB':>8}")
+    for motes in (int(count) for count in args.motes.split(",")):
+        result = run_benchmark(motes, BtMode[args.mode.upper()], args.rate, args.duration, args.chunks,
+                               args.values, MessageFormat[args.format.upper()], args.reactor)
+        if args.json:
+            print(json.dumps(result._asdict()), flush=True)
+            continue
+
+        def ms(value):
+            return f"{value * 1000:8.2f}" if value is not None else f"{'-':>8}"
+
+        max_rss = f"{result.max_rss:8.1f}" if result.max_rss is not None else f"{'-':>8}"
+        print(f"{result.motes:>6} {result.throughput:>12.0f} {result.byte_rate / 1024:>10.1f} "
+              f"{ms(result.latency_p50)} {ms(result.latency_p95)} {ms(result.latency_p99)} "
+              f"{ms(result.latency_max)} {result.cpu:>6.2f} {max_rss}", flush=True)
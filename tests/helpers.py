@@ -0,0 +1,28 @@
+"""
+Fixtures shared by the test modules: a mote running the presentation protocol, sending four shorts per chunk.
+"""
+
+from shimmer_listener import Frameinfo
+
+import struct
+import time
+
+
+data_dict = {"accel_x": 2000, "accel_y": 2001, "accel_z": 2002, "batt": 2003}
+
+# A single chunk, holding the values of data_dict
+data_frame = b"\xd0\x07\xd1\x07\xd2\x07\xd3\x07"
+
+frameinfo = Frameinfo(120, 8, "hhhh", list(data_dict))
+
+
+def presentation_frame(info: Frameinfo = frameinfo) -> bytes:
+    keys = b"".join(struct.pack("10s", key.encode()) for key in info.keys)
+    return struct.pack("BB10s100s", info.framesize, info.lenchunks, info.format.encode(), keys)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
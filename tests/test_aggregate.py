@@ -0,0 +1,115 @@
+from shimmer_listener import Aggregator, BtSlaveInputStream, Frameinfo, MessageFormat, PipeTransport, record_type
+from helpers import presentation_frame
+
+import statistics
+import struct
+import unittest
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+info = Frameinfo(16, 8, "hhhh", ["accel_x", "accel_y", "accel_z", "batt"])
+
+
+class TestAggregator(unittest.TestCase):
+    def setUp(self):
+        self.results = []
+
+    def on_window(self, mac, result):
+        self.results.append((mac, result))
+
+    def check(self, stats, values):
+        self.assertAlmostEqual(stats.mean, statistics.mean(values))
+        self.assertAlmostEqual(stats.var, statistics.pvariance(values))
+        self.assertAlmostEqual(stats.rms, (sum(v * v for v in values) / len(values)) ** 0.5)
+        self.assertEqual(stats.min, min(values))
+        self.assertEqual(stats.max, max(values))
+
+    def test_tumbling_samples(self):
+        aggregator = Aggregator(self.on_window, size=4)
+        aggregator.on_connect("00:11", info)
+        values = [3, 1, 4, 1, 5, 9, 2, 6, 5, 3]
+        aggregator.on_batch("00:11", [{"accel_x": v, "accel_y": 0, "accel_z": 0, "batt": 1, "timestamp": idx}
+                                      for idx, v in enumerate(values)])
+        self.assertEqual(len(self.results), 2)
+        mac, result = self.results[1]
+        self.assertEqual(mac, "00:11")
+        self.assertEqual((result.start, result.end, result.count), (4, 7, 4))
+        self.assertEqual(set(result.stats), set(info.keys))
+        self.check(result.stats["accel_x"], values[4:8])
+
+    def test_sliding_samples(self):
+        aggregator = Aggregator(self.on_window, size=4, slide=2, keys=["accel_x"])
+        values = [3, 1, 4, 1, 5, 9, 2, 6, 5, 3]
+        for v in values:
+            aggregator.on_message("00:11", {"accel_x": v, "batt": 1})
+        self.assertEqual([result.count for _, result in self.results], [4, 4, 4, 4])
+        for idx, (_, result) in enumerate(self.results):
+            self.assertEqual(list(result.stats), ["accel_x"])
+            self.check(result.stats["accel_x"], values[idx * 2:idx * 2 + 4])
+
+    def test_sliding_time(self):
+        aggregator = Aggregator(self.on_window, duration=1.0, slide=0.5)
+        record = record_type(["x", "timestamp"])
+        second = 10 ** 9
+        aggregator.on_batch("00:11", [record(idx, idx * second // 4) for idx in range(12)])
+        # Windows ending at 1 s, 1.5 s, 2 s and 2.5 s, each one holding the samples of the last second
+        self.assertEqual([result.count for _, result in self.results], [4, 4, 4, 4])
+        self.check(self.results[1][1].stats["x"], [2, 3, 4, 5])
+        self.assertEqual(self.results[1][1].start, second // 2)
+
+    def test_tumbling_time(self):
+        aggregator = Aggregator(self.on_window, duration=1.0)
+        second = 10 ** 9
+        for timestamp, v in [(0, 1), (second // 2, 2), (second, 3), (3 * second, 4), (3 * second + 1, 6)]:
+            aggregator.on_message("00:11", {"x": v, "timestamp": timestamp})
+        self.assertEqual([result.count for _, result in self.results], [2, 1])
+        aggregator.on_message("00:11", {"x": 0, "timestamp": 4 * second})
+        self.check(self.results[2][1].stats["x"], [4, 6])
+
+    def test_disconnect(self):
+        aggregator = Aggregator(self.on_window, size=2)
+        aggregator.on_message("00:11", {"x": 1})
+        aggregator.on_disconnect("00:11", True)
+        aggregator.on_message("00:11", {"x": 2})
+        self.assertEqual(self.results, [])
+        aggregator.on_message("00:11", {"x": 3})
+        self.check(self.results[0][1].stats["x"], [2, 3])
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            Aggregator(self.on_window)
+        with self.assertRaises(ValueError):
+            Aggregator(self.on_window, size=4, duration=1.0)
+        with self.assertRaises(ValueError):
+            Aggregator(self.on_window, size=0)
+        with self.assertRaises(ValueError):
+            Aggregator(self.on_window, size=4, slide=0.5)
+        with self.assertRaises(ValueError):
+            Aggregator(self.on_window, size=4, slide=1.5)
+        Aggregator(self.on_window, size=4, slide=2.0)
+        Aggregator(self.on_window, duration=1.0, slide=0.5)
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_columns(self):
+        aggregator = Aggregator(self.on_window, size=4)
+        transport = PipeTransport()
+        stream = BtSlaveInputStream("00:11", transport)
+        stream.message_format = MessageFormat.COLUMNS
+        stream.on_connect = aggregator.on_connect
+        stream.on_batch = aggregator.on_batch
+        stream.timestamps = True
+        values = list(range(10))
+        transport.write(presentation_frame(info) + b"".join(struct.pack("<hhhh", v, 2 * v, 0, 1) for v in values))
+        transport.end()
+        try:
+            stream.loop_forever()
+        except ConnectionError:
+            pass
+        self.assertEqual(len(self.results), 2)
+        self.check(self.results[0][1].stats["accel_y"], [2 * v for v in values[:4]])
+        self.check(self.results[1][1].stats["accel_x"], values[4:8])
+        self.assertIsInstance(self.results[0][1].stats["accel_x"].mean, float)
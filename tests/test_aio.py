@@ -0,0 +1,137 @@
+import shimmer_listener
+from helpers import data_frame
+
+from types import SimpleNamespace
+from unittest import mock
+import asyncio
+import socket
+import struct
+import unittest
+
+
+data_dict = {"accel_x": 2000, "accel_y": 2001, "accel_z": 2002, "batt": 2003}
+
+
+def generate_frame(wrong: str) -> bytes:
+    if wrong == "framesize":
+        return struct.pack("BB10s100s", 0, 12, b"h", b"")
+    keys = b"".join(struct.pack("10s", key.encode()) for key in data_dict)
+    return struct.pack("BB10s100s", 120, 8, b"hhhh", keys)
+
+
+class TestAsyncBtStream(unittest.TestCase):
+    def setUp(self):
+        self.mote, local = socket.socketpair()
+        self.stream = shimmer_listener.AsyncBtStream("mac", transport=shimmer_listener.SocketTransport(local))
+
+    def tearDown(self):
+        self.mote.close()
+
+    def test_iterate(self):
+        events = []
+
+        async def on_disconnect(mac, lost):
+            events.append(("disconnect", mac, lost))
+
+        async def run():
+            self.stream.on_connect = lambda mac, info: events.append(("connect", mac, info.keys))
+            self.stream.on_disconnect = on_disconnect
+            self.mote.sendall(generate_frame("ok"))
+            await self.stream.connect()
+            self.mote.sendall(b"\xd0\x07\xd1\x07\xd2\x07\xd3\x07" * 30)
+            self.mote.close()
+            frames = [frame async for frame in self.stream]
+            await asyncio.sleep(0)
+            return frames
+
+        frames = asyncio.run(run())
+        self.assertEqual(len(frames), 30)
+        self.assertDictEqual(frames[0], data_dict)
+        self.assertEqual(events[0], ("connect", "mac", ["accel_x", "accel_y", "accel_z", "batt"]))
+        self.assertEqual(events[-1], ("disconnect", "mac", True))
+
+    def test_wrong_presentation(self):
+        async def run():
+            self.mote.sendall(generate_frame("framesize"))
+            await self.stream.connect()
+
+        self.assertRaises(ConnectionError, asyncio.run, run())
+
+
+    def test_close_connecting(self):
+        async def run():
+            task = asyncio.ensure_future(self.stream.connect())
+            await asyncio.sleep(0.05)
+            await self.stream.close()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            return [frame async for frame in self.stream]
+
+        self.assertEqual(asyncio.run(run()), [])
+        self.assertFalse(self.stream.open)
+        self.mote.settimeout(1)
+        self.assertEqual(self.mote.recv(1), b"")
+
+
+class TestAsyncBtListener(unittest.TestCase):
+    def setUp(self):
+        # No device is ever discovered, the motes are added explicitly
+        bluetooth = SimpleNamespace(discover_devices=lambda **kwargs: [])
+        patcher = mock.patch("shimmer_listener._aio._bluetooth", return_value=bluetooth)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.motes = []
+
+    def tearDown(self):
+        for mote in self.motes:
+            mote.close()
+
+    def connect(self):
+        mote, local = socket.socketpair()
+        self.motes.append(mote)
+        return mote, shimmer_listener.SocketTransport(local)
+
+    def test_merge(self):
+        async def run():
+            received = []
+            async with shimmer_listener.AsyncBtListener(scan_interval=0.01) as listener:
+                for mac in ("mac0", "mac1"):
+                    mote, transport = self.connect()
+                    mote.sendall(generate_frame("ok") + data_frame * 15)
+                    listener.add(mac, transport)
+                async for mac, frame in listener:
+                    received.append((mac, frame))
+                    if len(received) == 30:
+                        break
+            return received, listener.streams
+
+        received, streams = asyncio.run(run())
+        self.assertEqual(sorted(mac for mac, _ in received), ["mac0"] * 15 + ["mac1"] * 15)
+        self.assertDictEqual(received[0][1], data_dict)
+        self.assertEqual(streams, {})
+
+    def test_close_connecting(self):
+        # A stream still waiting for its presentation frame is closed with the listener, before or after
+        # starting to connect
+        for delay in (None, 0.05):
+            with self.subTest(delay=delay):
+                mote, transport = self.connect()
+
+                async def run():
+                    listener = shimmer_listener.AsyncBtListener(scan_interval=0.01)
+                    await listener.start()
+                    stream = listener.add("mac", transport)
+                    if delay is not None:
+                        await asyncio.sleep(delay)
+                    await listener.close()
+                    return stream, [item async for item in listener]
+
+                stream, items = asyncio.run(run())
+                self.assertEqual(items, [])
+                self.assertFalse(stream.open)
+                mote.settimeout(1)
+                self.assertEqual(mote.recv(1), b"")
+
+
+if __name__ == "__main__":
+    unittest.main()
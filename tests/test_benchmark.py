@@ -0,0 +1,25 @@
+from shimmer_listener import BtMode, MessageFormat
+from shimmer_listener.benchmark import MoteEmulator, run_benchmark
+
+import unittest
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_master_mode(self):
+        result = run_benchmark(2, BtMode.MASTER, rate=100, duration=0.3, chunks=4)
+        # Every chunk of every frame sent is decoded as a message
+        self.assertEqual(result.messages, result.frames * 4)
+        self.assertGreater(result.messages, 0)
+        self.assertLessEqual(result.latency_p50, result.latency_max)
+
+    def test_slave_mode(self):
+        result = run_benchmark(3, BtMode.SLAVE, duration=0.2, message_format=MessageFormat.RECORD, reactor=True)
+        self.assertEqual(result.messages, result.frames)
+        self.assertGreater(result.throughput, 0)
+
+    def test_frames(self):
+        emulator = MoteEmulator(1, BtMode.MASTER, chunks=3, values=2)
+        self.assertEqual(emulator.framesize, 18)
+        self.assertEqual(len(emulator.frame(7)), 18)
+        self.assertEqual(len(emulator.presentation_frame()), 112)
+        self.assertEqual(len(MoteEmulator(1, BtMode.SLAVE).frame(7)), 22)
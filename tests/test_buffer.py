@@ -0,0 +1,52 @@
+from shimmer_listener._buffer import FrameBuffer
+
+import unittest
+
+
+class ChunkedSock:
+    """Returns the given payload in reads of at most chunk bytes."""
+    def __init__(self, payload: bytes, chunk: int):
+        self.payload = payload
+        self.chunk = chunk
+
+    def recv(self, length):
+        size = min(length, self.chunk)
+        data, self.payload = self.payload[:size], self.payload[size:]
+        return data
+
+
+class ChunkedSockInto(ChunkedSock):
+    def recv_into(self, buf, nbytes):
+        data = self.recv(nbytes)
+        buf[:len(data)] = data
+        return len(data)
+
+
+class TestFrameBuffer(unittest.TestCase):
+    def test_partial_frames_carried_over(self):
+        payload = bytes(range(50))
+        for sock_type in (ChunkedSock, ChunkedSockInto):
+            sock = sock_type(payload, 7)
+            buffer = FrameBuffer(32)
+            frames = []
+            while buffer.fill(sock):
+                frames.extend(bytes(frame) for frame in buffer.frames(10))
+            self.assertEqual(frames, [payload[idx:idx + 10] for idx in range(0, 50, 10)])
+
+    def test_read_exact_does_not_overread(self):
+        sock = ChunkedSock(b"a" * 112 + b"b" * 8, 200)
+        buffer = FrameBuffer()
+        self.assertEqual(bytes(buffer.read_exact(sock, 112)), b"a" * 112)
+        self.assertEqual(buffer.available, 0)
+        self.assertEqual(sock.payload, b"b" * 8)
+
+    def test_read_exact_closed(self):
+        buffer = FrameBuffer()
+        self.assertRaises(ConnectionResetError, buffer.read_exact, ChunkedSock(b"a" * 10, 4), 112)
+
+    def test_block(self):
+        sock = ChunkedSock(bytes(range(25)), 100)
+        buffer = FrameBuffer()
+        buffer.fill(sock)
+        self.assertEqual(bytes(buffer.block(10)), bytes(range(20)))
+        self.assertEqual(buffer.available, 5)
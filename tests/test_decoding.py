@@ -0,0 +1,85 @@
+from shimmer_listener._decoding import Frameinfo, FrameDecoder, get_decoder, numpy_dtype, record_type
+
+import struct
+import unittest
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+info = Frameinfo(16, 8, "hhhh", ["accel_x", "accel_y", "accel_z", "batt"])
+frame = struct.pack("hhhhhhhh", 1, 2, 3, 4, 5, 6, 7, 8)
+
+
+class TestFrameDecoder(unittest.TestCase):
+    def test_decode(self):
+        decoder = FrameDecoder(info)
+        self.assertEqual(decoder.decode(frame), [(1, 2, 3, 4), (5, 6, 7, 8)])
+
+    def test_to_dicts(self):
+        decoder = FrameDecoder(info)
+        self.assertEqual(decoder.to_dicts(memoryview(frame)),
+                         [{"accel_x": 1, "accel_y": 2, "accel_z": 3, "batt": 4},
+                          {"accel_x": 5, "accel_y": 6, "accel_z": 7, "batt": 8}])
+
+    def test_cached_by_format(self):
+        same = Frameinfo(120, 8, "hhhh", ["accel_x", "accel_y", "accel_z", "batt"])
+        other = Frameinfo(16, 8, "HHHH", ["accel_x", "accel_y", "accel_z", "batt"])
+        self.assertIs(get_decoder(info), get_decoder(same))
+        self.assertIsNot(get_decoder(info), get_decoder(other))
+
+    def test_projection(self):
+        decoder = get_decoder(info, ["batt", "accel_y"])
+        self.assertEqual(decoder.keys, ("accel_y", "batt"))
+        self.assertEqual(decoder.chunksize, 8)
+        self.assertEqual(decoder.to_dicts(frame), [{"accel_y": 2, "batt": 4}, {"accel_y": 6, "batt": 8}])
+        self.assertEqual(decoder.decode_every(frame + frame, 1, 2), [(6, 8), (6, 8)])
+        self.assertRaises(ValueError, FrameDecoder, info, ["gyro_x"])
+
+    def test_projection_alignment(self):
+        for fmt in ("bhd", "<bhd", "bi", "4s?xi"):
+            values = struct.unpack(fmt, bytes(range(struct.calcsize(fmt))))
+            keys = [f"k{idx}" for idx in range(len(values))]
+            fmt_info = Frameinfo(struct.calcsize(fmt), struct.calcsize(fmt), fmt, keys)
+            decoder = FrameDecoder(fmt_info, keys[1:])
+            self.assertEqual(decoder.decode(bytes(range(struct.calcsize(fmt)))), [values[1:]])
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestColumnsDecoding(unittest.TestCase):
+    def test_to_columns(self):
+        columns = FrameDecoder(info).to_columns(memoryview(frame + frame))
+        self.assertEqual(list(columns), info.keys)
+        self.assertEqual(columns["accel_x"].tolist(), [1, 5, 1, 5])
+        self.assertEqual(columns["batt"].tolist(), [4, 8, 4, 8])
+
+    def test_to_columns_every(self):
+        columns = get_decoder(info, ["accel_z"]).to_columns_every(memoryview(frame + frame), 1, 2)
+        self.assertEqual(list(columns), ["accel_z"])
+        self.assertEqual(columns["accel_z"].tolist(), [7, 7])
+
+    def test_dtype_alignment(self):
+        for fmt in ("bhd", "<bhd", ">3Bf", "=7x6H3x", "4s?xi"):
+            values = struct.unpack(fmt, bytes(range(struct.calcsize(fmt))))
+            keys = [f"k{idx}" for idx in range(len(values))]
+            dtype = numpy_dtype(Frameinfo(struct.calcsize(fmt), struct.calcsize(fmt), fmt, keys))
+            self.assertEqual(dtype.itemsize, struct.calcsize(fmt))
+            decoded = np.frombuffer(bytes(range(struct.calcsize(fmt))), dtype=dtype)[0].tolist()
+            self.assertEqual(decoded, values)
+
+    def test_wrong_keys(self):
+        self.assertRaises(ValueError, numpy_dtype, Frameinfo(8, 8, "hhhh", ["accel_x"]))
+
+
+class TestRecordDecoding(unittest.TestCase):
+    def test_to_records(self):
+        records = FrameDecoder(info).to_records(frame)
+        self.assertEqual(records[0].accel_x, 1)
+        self.assertEqual(records[1].batt, 8)
+        self.assertEqual(records[0]._asdict(), {"accel_x": 1, "accel_y": 2, "accel_z": 3, "batt": 4})
+
+    def test_record_type_cached(self):
+        self.assertIs(record_type(info.keys), record_type(tuple(info.keys)))
+        self.assertFalse(hasattr(record_type(info.keys)(1, 2, 3, 4), "__dict__"))
@@ -0,0 +1,71 @@
+from shimmer_listener._dispatch import Dispatcher, EventKind, OverflowPolicy
+
+from threading import Event
+import unittest
+
+
+class TestDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.received = []
+        self.gate = Event()
+
+    def blocking_callback(self, mac, value):
+        self.gate.wait(5)
+        self.received.append((mac, value))
+
+    def fill(self, dispatcher, count, kind=EventKind.MESSAGE):
+        # The first message is taken by the worker, that blocks on the gate
+        dispatcher.submit("mac", kind, self.blocking_callback, "mac", -1)
+        while dispatcher.stats()["mac"]["depth"]:
+            pass
+        for idx in range(count):
+            dispatcher.submit("mac", kind, self.blocking_callback, "mac", idx)
+
+    def test_order_preserved(self):
+        dispatcher = Dispatcher(workers=4)
+        for idx in range(200):
+            dispatcher.submit(f"mac{idx % 3}", EventKind.MESSAGE, lambda mac, value: self.received.append((mac, value)),
+                              f"mac{idx % 3}", idx)
+        self.assertTrue(dispatcher.close(5))
+        for mac in ("mac0", "mac1", "mac2"):
+            values = [value for m, value in self.received if m == mac]
+            self.assertEqual(values, sorted(values))
+        self.assertEqual(len(self.received), 200)
+
+    def test_drop_newest(self):
+        dispatcher = Dispatcher(queue_size=2, overflow=OverflowPolicy.DROP_NEWEST)
+        self.fill(dispatcher, 4)
+        self.gate.set()
+        dispatcher.close(5)
+        self.assertEqual([value for _, value in self.received], [-1, 0, 1])
+        self.assertEqual(dispatcher.stats()["mac"]["dropped"], 2)
+
+    def test_drop_oldest(self):
+        dispatcher = Dispatcher(queue_size=2, overflow=OverflowPolicy.DROP_OLDEST)
+        self.fill(dispatcher, 4)
+        self.gate.set()
+        dispatcher.close(5)
+        self.assertEqual([value for _, value in self.received], [-1, 2, 3])
+        self.assertEqual(dispatcher.stats()["mac"]["dropped"], 2)
+
+    def test_coalesce(self):
+        dispatcher = Dispatcher(queue_size=2, overflow=OverflowPolicy.COALESCE)
+        self.fill(dispatcher, 4)
+        self.gate.set()
+        dispatcher.close(5)
+        self.assertEqual([value for _, value in self.received], [-1, 0, 3])
+        self.assertEqual(dispatcher.stats()["mac"]["coalesced"], 2)
+
+    def test_events_never_dropped(self):
+        dispatcher = Dispatcher(queue_size=1, overflow=OverflowPolicy.DROP_NEWEST)
+        self.fill(dispatcher, 1)
+        dispatcher.submit("mac", EventKind.EVENT, self.blocking_callback, "mac", "disconnect")
+        self.gate.set()
+        dispatcher.close(5)
+        self.assertEqual(self.received[-1], ("mac", "disconnect"))
+
+    def test_submit_after_close(self):
+        dispatcher = Dispatcher()
+        dispatcher.close()
+        dispatcher.submit("mac", EventKind.MESSAGE, lambda mac, value: self.received.append(value), "mac", 1)
+        self.assertEqual(self.received, [1])
@@ -0,0 +1,102 @@
+from shimmer_listener import BtMasterInputStream, BtSlaveInputStream, Frameinfo, MessageFormat, PipeTransport, \
+    master_frame
+from helpers import presentation_frame
+
+import struct
+import unittest
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+info = Frameinfo(16, 8, "hhhh", ["accel_x", "accel_y", "accel_z", "batt"])
+
+
+def chunks(values) -> bytes:
+    return b"".join(struct.pack("hhhh", v, 2 * v, 3 * v, 1) for v in values)
+
+
+class TestSlaveFiltering(unittest.TestCase):
+    def setUp(self):
+        self.transport = PipeTransport()
+        self.stream = BtSlaveInputStream("00:11", self.transport)
+        self.messages = []
+        self.stream.on_message = lambda mac, message: self.messages.append(message)
+
+    def run_stream(self, data: bytes):
+        # Every write is received by a separate read, so that the filters keep their state across frames
+        self.transport.write(presentation_frame(info))
+        for start in range(0, len(data), 24):
+            self.transport.write(data[start:start + 24])
+        self.transport.end()
+        try:
+            self.stream.loop_forever()
+        except ConnectionError:
+            pass
+
+    def test_decimation(self):
+        self.stream.decimation = 3
+        self.run_stream(chunks(range(10)))
+        self.assertEqual([message["accel_x"] for message in self.messages], [0, 3, 6, 9])
+
+    def test_projection(self):
+        self.stream.projection = ["accel_z", "accel_x"]
+        self.stream.message_format = MessageFormat.RECORD
+        self.run_stream(chunks(range(2)))
+        self.assertEqual(self.messages[1]._fields, ("accel_x", "accel_z"))
+        self.assertEqual(tuple(self.messages[1]), (1, 3))
+
+    def test_deadband(self):
+        self.stream.deadband = {"accel_x": 5}
+        self.stream.timestamps = True
+        self.run_stream(chunks([0, 1, 4, 5, 6, 12, 8, 7, 0, 0]))
+        self.assertEqual([message["accel_x"] for message in self.messages], [0, 5, 12, 7, 0])
+        stamps = [message["timestamp"] for message in self.messages]
+        self.assertEqual(stamps, sorted(stamps))
+
+    def test_unknown_key(self):
+        self.stream.projection = ["gyro_x"]
+        lost = []
+        self.stream.on_disconnect = lambda mac, was_lost: lost.append(was_lost)
+        self.run_stream(chunks(range(2)))
+        self.assertEqual(self.messages, [])
+        self.assertEqual(lost, [True])
+
+    def test_running(self):
+        self.stream._running = True
+        with self.assertRaises(ValueError):
+            self.stream.decimation = 2
+        self.stream._running = False
+        with self.assertRaises(ValueError):
+            self.stream.decimation = 0
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_columns(self):
+        self.stream.message_format = MessageFormat.COLUMNS
+        self.stream.decimation = 2
+        self.stream.deadband = {"accel_x": 4}
+        self.stream.projection = ["accel_x"]
+        batches = []
+        self.stream.on_message = None
+        self.stream.on_batch = lambda mac, batch: batches.append(batch[0])
+        self.run_stream(chunks(range(20)))
+        self.assertEqual([list(batch) for batch in batches], [["accel_x"]] * len(batches))
+        self.assertEqual(np.concatenate([batch["accel_x"] for batch in batches]).tolist(), [0, 4, 8, 12, 16])
+
+
+class TestMasterFiltering(unittest.TestCase):
+    def test_decimation(self):
+        transport = PipeTransport()
+        stream = BtMasterInputStream("00:11", transport, None)
+        stream.decimation = 2
+        stream.projection = ["accel_y"]
+        messages = []
+        stream.on_message = lambda mac, message: messages.append(message)
+        for value in range(5):
+            transport.write(master_frame((value, value + 100, 0, 0, 0, 0)))
+        transport.end()
+        stream.loop_forever()
+        self.assertEqual(messages, [{"mac": "00:11", "accel_y": 100}, {"mac": "00:11", "accel_y": 102},
+                                    {"mac": "00:11", "accel_y": 104}])
@@ -0,0 +1,145 @@
+from shimmer_listener import Encoding, Forwarder, decode_binary, record_type
+from shimmer_listener._forward import encode_binary, encode_json
+from helpers import wait_for
+
+from threading import Thread
+import socket
+import json
+import time
+import unittest
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class Peer:
+    # TCP server collecting everything it receives, one connection at a time
+    def __init__(self, port=0):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(("127.0.0.1", port))
+        self.server.listen(1)
+        self.address = self.server.getsockname()
+        self.data = b""
+        self.client = None
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            self.client, _ = self.server.accept()
+        except OSError:
+            return
+        with self.client:
+            while True:
+                try:
+                    data = self.client.recv(65536)
+                except OSError:
+                    break
+                if not data:
+                    break
+                self.data += data
+
+    def close(self):
+        if self.client is not None:
+            try:
+                self.client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.server.close()
+        self.thread.join(1)
+
+
+class TestEncoding(unittest.TestCase):
+    def test_json(self):
+        data = encode_json("mac", [{"a": 1, "b": 2.5}, {"a": 2, "b": 3.5}])
+        lines = data.decode().splitlines()
+        self.assertTrue(data.endswith(b"\n"))
+        self.assertEqual([json.loads(line) for line in lines], [{"a": 1, "b": 2.5}, {"a": 2, "b": 3.5}])
+        # The same bytes as the json.dumps of each message
+        self.assertEqual(data.decode(), "".join(json.dumps(message) + "\n" for message in
+                                                [{"a": 1, "b": 2.5}, {"a": 2, "b": 3.5}]))
+        lines = encode_json("mac", [{"a": 1}, {"a": 2, "mac": "other"}], add_mac=True).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [{"a": 1, "mac": "mac"}, {"a": 2, "mac": "other"}])
+
+    def test_binary(self):
+        record = record_type(["a", "b"])
+        messages = [{"a": 1, "b": 2.5}, tuple.__new__(record, (2, 3.5)), {"c": True}]
+        decoded = list(decode_binary(encode_binary("mac", messages)))
+        self.assertEqual(decoded, [("mac", [{"a": 1, "b": 2.5}, {"a": 2, "b": 3.5}]), ("mac", [{"c": True}])])
+
+    def test_binary_types(self):
+        # The type code of a key fits all of its values, not only those of the first message
+        messages = [{"a": 1, "b": True, "c": 1}, {"a": 2.5, "b": False, "c": "x"}]
+        self.assertEqual(list(decode_binary(encode_binary("mac", messages))),
+                         [("mac", [{"a": 1.0, "b": True}, {"a": 2.5, "b": False}])])
+
+    def test_binary_non_numeric(self):
+        # The mac carried by the messages of master mode is left out
+        data = encode_binary("mac", [{"mac": "mac", "accel_x": 1}])
+        self.assertEqual(list(decode_binary(data)), [("mac", [{"accel_x": 1}])])
+        self.assertEqual(list(decode_binary(data[:-1])), [])
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_columns(self):
+        columns = {"a": np.arange(3, dtype=np.int16), "b": np.arange(3, dtype=np.float32) / 2}
+        decoded = list(decode_binary(encode_binary("mac", [columns])))
+        self.assertEqual(decoded, [("mac", [{"a": 0, "b": 0.0}, {"a": 1, "b": 0.5}, {"a": 2, "b": 1.0}])])
+        lines = encode_json("mac", [columns]).decode().splitlines()
+        self.assertEqual(json.loads(lines[2]), {"a": 2, "b": 1.0})
+
+
+class TestForwarder(unittest.TestCase):
+    def test_forward(self):
+        peer = Peer()
+        forwarder = Forwarder(peer.address, Encoding.BINARY)
+        for idx in range(100):
+            forwarder.on_message("mac", {"seq": idx})
+        forwarder.on_batch("other", [{"seq": 100}, {"seq": 101}])
+        forwarder.close()
+        peer.thread.join(5)
+        peer.close()
+        received = [(mac, message["seq"]) for mac, messages in decode_binary(peer.data) for message in messages]
+        self.assertEqual(received, [("mac", idx) for idx in range(100)] + [("other", 100), ("other", 101)])
+        stats = forwarder.stats()
+        self.assertEqual(stats["sent_messages"], 102)
+        self.assertEqual(stats["dropped"], 0)
+        self.assertEqual(stats["sent_bytes"], len(peer.data))
+
+    def test_reconnect(self):
+        peer = Peer()
+        forwarder = Forwarder(peer.address, backoff_base=0.05)
+        forwarder.on_message("mac", {"seq": 0})
+        self.assertTrue(wait_for(lambda: peer.data.endswith(b"\n")))
+        port = peer.address[1]
+        peer.close()
+        # The lost connection is noticed by a write, the messages sent until then are lost
+        for _ in range(100):
+            if not forwarder.connected:
+                break
+            forwarder.on_message("mac", {"seq": -1})
+            time.sleep(0.02)
+        self.assertFalse(forwarder.connected)
+
+        peer = Peer(port)
+        forwarder.on_message("mac", {"seq": 1})
+        self.assertTrue(wait_for(lambda: b'"seq": 1' in peer.data))
+        forwarder.close()
+        peer.close()
+        self.assertEqual(forwarder.stats()["reconnects"], 1)
+
+    def test_unreachable(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(("127.0.0.1", 0))
+        address = server.getsockname()
+        server.close()
+        forwarder = Forwarder(address, max_pending=10, backoff_base=10)
+        for idx in range(25):
+            forwarder.on_message("mac", {"seq": idx})
+        forwarder.close(timeout=0.1)
+        stats = forwarder.stats()
+        self.assertFalse(stats["connected"])
+        self.assertEqual(stats["sent_messages"], 0)
+        self.assertEqual(stats["dropped"], 25)
@@ -0,0 +1,133 @@
+from shimmer_listener import BtMasterInputStream, BtSlaveInputStream, Frameinfo, MasterFrameCheck, MessageFormat, \
+    Metrics, PipeTransport, check_master_frame, crc16, master_frame
+
+import struct
+import unittest
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class TestMasterFrameCheck(unittest.TestCase):
+    def test_crc(self):
+        # CRC-16/CCITT with initial value 0 (XMODEM)
+        self.assertEqual(crc16(b"123456789"), 0x31C3)
+
+    def test_layout(self):
+        # A frame written out byte by byte: header 1-6, values 100-600 little endian, CRC 0xBA67
+        frame = bytes.fromhex("c0 010203040506 6400 c800 2c01 9001 f401 5802 67ba c0")
+        self.assertTrue(MasterFrameCheck()(frame))
+        self.assertEqual(master_frame((100, 200, 300, 400, 500, 600), b"\x01\x02\x03\x04\x05\x06"), frame)
+
+    def test_check(self):
+        check = MasterFrameCheck()
+        frame = bytearray(master_frame(range(6), b"\x01\x02\x03\x04\x05\x06"))
+        self.assertTrue(check(frame))
+        frame[10] ^= 0x01
+        self.assertTrue(check.framed(frame))
+        self.assertFalse(check(frame))
+
+    def test_valid_prefix(self):
+        check = MasterFrameCheck()
+        for count in (4, 40):
+            block = bytearray(b"".join(master_frame((idx,) * 6) for idx in range(count)))
+            self.assertEqual(check.valid_prefix(block, count), count)
+            block[22 * (count // 2) + 20] ^= 0xFF
+            self.assertEqual(check.valid_prefix(block, count), count // 2)
+
+
+class TestResync(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+        self.messages = []
+
+    def run_master(self, *writes):
+        transport = PipeTransport()
+        stream = BtMasterInputStream("mac", transport, None)
+        stream.frame_check = check_master_frame
+        stream.metrics = self.metrics.mote("mac")
+        stream.on_message = lambda mac, message: self.messages.append(message["accel_x"])
+        for data in writes:
+            transport.write(data)
+        transport.end()
+        stream.loop_forever()
+        return self.metrics.stats()["mac"]
+
+    def test_lost_byte(self):
+        frames = [master_frame((value, 0, 0, 0, 0, 0)) for value in range(40)]
+        data = b"".join(frames[:10]) + frames[10][1:] + b"".join(frames[11:])
+        stats = self.run_master(data)
+        self.assertEqual(self.messages, list(range(10)) + list(range(11, 40)))
+        self.assertEqual(stats["resyncs"], 1)
+        self.assertEqual(stats["crc_errors"], 0)
+        self.assertEqual(stats["skipped_bytes"], 21)
+
+    def test_corrupted_frame(self):
+        frames = [bytearray(master_frame((value, 0, 0, 0, 0, 0))) for value in range(5)]
+        frames[2][8] ^= 0x10
+        # Frames split across reads, as they are received
+        data = b"".join(frames)
+        stats = self.run_master(data[:30], data[30:50], data[50:])
+        self.assertEqual(self.messages, [0, 1, 3, 4])
+        self.assertEqual(stats["crc_errors"], 1)
+        self.assertEqual(stats["resyncs"], 1)
+        self.assertEqual(stats["frames"], 4)
+
+    def test_garbage(self):
+        data = b"\xc0\x01\xc0" + master_frame((7, 0, 0, 0, 0, 0)) + b"\x00" * 5 + master_frame((8, 0, 0, 0, 0, 0))
+        stats = self.run_master(data)
+        self.assertEqual(self.messages, [7, 8])
+        self.assertEqual(stats["resyncs"], 2)
+
+    def test_disabled(self):
+        # Frames without boundaries nor CRC are decoded, unless a check is enabled
+        transport = PipeTransport()
+        stream = BtMasterInputStream("mac", transport, None)
+        self.assertIsNone(stream.frame_check)
+        stream.on_message = lambda mac, message: self.messages.append(message["accel_x"])
+        transport.write(b"\x00" * 7 + struct.pack("=6H", 5, 0, 0, 0, 0, 0) + b"\x00" * 3)
+        transport.end()
+        stream.loop_forever()
+        self.assertEqual(self.messages, [5])
+
+
+class TestSlaveFrameCheck(unittest.TestCase):
+    def test_frame_check(self):
+        # Frames of two chunks, the first value of a frame being 0x7FFF
+        info = Frameinfo(8, 4, "hh", ["marker", "value"])
+        keys = b"".join(struct.pack("10s", key.encode()) for key in info.keys)
+        frames = [struct.pack("hhhh", 0x7FFF, value, value, value) for value in range(5)]
+        transport = PipeTransport()
+        transport.write(struct.pack("BB10s100s", 8, 4, b"hh", keys))
+        transport.write(b"".join(frames[:2]) + b"\x01" + b"".join(frames[2:]))
+        transport.end()
+
+        stream = BtSlaveInputStream("mac", transport)
+        stream.frame_check = lambda frame: frame[0:2] == struct.pack("h", 0x7FFF)
+        metrics = stream.metrics = Metrics().mote("mac")
+        values = []
+        stream.on_message = lambda mac, message: values.append(message["value"])
+        try:
+            stream.loop_forever()
+        except ConnectionError:
+            pass
+        self.assertEqual(values, [0, 0, 1, 1, 2, 2, 3, 3, 4, 4])
+        self.assertEqual((metrics.resyncs, metrics.skipped_bytes), (1, 1))
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestBulkColumns(unittest.TestCase):
+    def test_columns(self):
+        frames = [master_frame((value, 0, 0, 0, 0, 0)) for value in range(64)]
+        transport = PipeTransport()
+        transport.write(b"".join(frames[:30]) + b"\xff\xff" + b"".join(frames[30:]))
+        transport.end()
+        stream = BtMasterInputStream("mac", transport, None)
+        stream.frame_check = check_master_frame
+        stream.message_format = MessageFormat.COLUMNS
+        columns = []
+        stream.on_batch = lambda mac, batch: columns.append(batch[0]["accel_x"])
+        stream.loop_forever()
+        self.assertEqual(np.concatenate(columns).tolist(), list(range(64)))
@@ -0,0 +1,76 @@
+import shimmer_listener
+from shimmer_listener import Metrics, MetricsExporter, PipeTransport, BtSlaveInputStream
+from helpers import data_frame, frameinfo, presentation_frame
+
+from urllib.request import urlopen
+import unittest
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def run_stream(self, data, dispatcher=None):
+        transport = PipeTransport()
+        transport.write(data)
+        transport.end()
+        stream = BtSlaveInputStream("mac", transport)
+        stream.metrics = self.metrics.mote("mac")
+        stream.dispatcher = dispatcher
+        stream.on_message = lambda mac, message: None
+        try:
+            stream.loop_forever()
+        except ConnectionError:
+            pass
+        return stream
+
+    def test_counters(self):
+        # Two 120 B frames of 15 chunks each, plus a partial frame that is never decoded
+        stream = self.run_stream(presentation_frame() + data_frame * 35)
+        stats = stream.stats()
+        self.assertEqual(stats["bytes"], 112 + 8 * 35)
+        self.assertGreaterEqual(stats["recv_calls"], 2)
+        self.assertEqual(stats["frames"], 2)
+        self.assertEqual(stats["chunks"], 30)
+        self.assertEqual(stats["decode_errors"], 0)
+        self.assertEqual(stats["callbacks"], 30)
+
+    def test_decode_error(self):
+        self.run_stream(presentation_frame(frameinfo._replace(framesize=121)))
+        self.assertEqual(self.metrics.stats()["mac"]["decode_errors"], 1)
+
+    def test_dispatcher(self):
+        dispatcher = shimmer_listener.Dispatcher()
+        self.metrics.add_source(dispatcher.stats)
+        self.run_stream(presentation_frame() + data_frame * 30, dispatcher)
+        dispatcher.close()
+        stats = self.metrics.stats()["mac"]
+        self.assertEqual(stats["callbacks"], 30)
+        self.assertEqual(stats["delivered"], 30)
+        self.assertEqual(stats["depth"], 0)
+
+    def test_disabled(self):
+        stream = BtSlaveInputStream("mac", PipeTransport())
+        self.assertEqual(stream.stats(), {})
+        self.assertIsInstance(stream._transport, PipeTransport)
+
+    def test_exporter(self):
+        self.run_stream(presentation_frame() + data_frame * 30)
+        exporter = MetricsExporter(self.metrics, 0)
+        try:
+            with urlopen(f"http://127.0.0.1:{exporter.port}/metrics") as response:
+                text = response.read().decode()
+        finally:
+            exporter.close()
+        self.assertIn('shimmer_frames_total{mac="mac"} 2', text)
+        self.assertIn('shimmer_callback_seconds_bucket{mac="mac",le="+Inf"} 30', text)
+        self.assertIn('shimmer_callback_seconds_count{mac="mac"} 30', text)
+
+
+class TestHistogram(unittest.TestCase):
+    def test_buckets(self):
+        histogram = shimmer_listener.Histogram([1, 2])
+        for value in (0.5, 1, 1.5, 3):
+            histogram.observe(value)
+        self.assertEqual(histogram.buckets(), [(1, 2), (2, 3), (float("inf"), 4)])
+        self.assertEqual(histogram.sum, 6)
@@ -0,0 +1,93 @@
+from shimmer_listener import BtSlaveInputStream, EventKind, MessageFormat, OverflowPolicy, PipeTransport, \
+    ProcessPool, record_type
+from helpers import data_dict, data_frame, presentation_frame
+
+import multiprocessing
+import pickle
+import unittest
+
+
+def on_connect(mac, info, output):
+    output.put((mac, "connect", tuple(info.keys)))
+
+
+def on_message(mac, message, output):
+    output.put((mac, "message", message.batt, multiprocessing.current_process().pid))
+
+
+def on_disconnect(mac, lost, output):
+    output.put((mac, "disconnect", lost))
+
+
+class Bound:
+    # Picklable handler carrying the queue the results are written to
+    def __init__(self, handler, output):
+        self.handler = handler
+        self.output = output
+
+    def __call__(self, *args):
+        self.handler(*args, self.output)
+
+
+class TestProcessPool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.manager = multiprocessing.get_context("spawn").Manager()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.manager.shutdown()
+
+    def setUp(self):
+        self.output = self.manager.Queue()
+        self.pool = ProcessPool(2, start_method="spawn")
+
+    def tearDown(self):
+        self.assertTrue(self.pool.close(30))
+
+    def test_stream(self):
+        transport = PipeTransport()
+        stream = BtSlaveInputStream("mac", transport)
+        stream.message_format = MessageFormat.RECORD
+        stream.on_connect = self.pool.remote(Bound(on_connect, self.output), EventKind.EVENT)
+        stream.on_message = self.pool.remote(Bound(on_message, self.output))
+        stream.on_disconnect = self.pool.remote(Bound(on_disconnect, self.output), EventKind.EVENT)
+        transport.write(presentation_frame() + data_frame * 30)
+        transport.end()
+        try:
+            stream.loop_forever()
+        except ConnectionError:
+            pass
+        received = [self.output.get(timeout=30) for _ in range(32)]
+        self.assertEqual(received[0], ("mac", "connect", tuple(data_dict)))
+        self.assertEqual(received[-1], ("mac", "disconnect", True))
+        self.assertEqual({event[2] for event in received[1:-1]}, {2003})
+        # A single worker served the mote
+        self.assertEqual(len({event[3] for event in received[1:-1]}), 1)
+        self.assertEqual(self.pool.stats()["mac"]["delivered"], 30)
+
+    def test_sharding(self):
+        handler = self.pool.remote(Bound(on_disconnect, self.output), EventKind.EVENT)
+        macs = [f"00:00:00:00:00:{idx:02X}" for idx in range(8)]
+        for seq in range(5):
+            for mac in macs:
+                handler(mac, seq)
+        received = [self.output.get(timeout=30) for _ in range(40)]
+        for mac in macs:
+            self.assertEqual([event[2] for event in received if event[0] == mac], list(range(5)))
+
+    def test_unpicklable(self):
+        with self.assertRaises(Exception):
+            self.pool.remote(lambda mac, message: None)
+
+    def test_coalesce(self):
+        with self.assertRaises(ValueError):
+            ProcessPool(1, overflow=OverflowPolicy.COALESCE)
+
+
+class TestPickle(unittest.TestCase):
+    def test_record(self):
+        record = tuple.__new__(record_type(["a", "b"]), (1, 2))
+        copy = pickle.loads(pickle.dumps(record))
+        self.assertIs(type(copy), type(record))
+        self.assertEqual(copy.b, 2)
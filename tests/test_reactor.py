@@ -0,0 +1,68 @@
+import shimmer_listener
+
+import socket
+import time
+import unittest
+
+
+def master_frame(value: int) -> bytes:
+    return shimmer_listener.master_frame(range(value, value + 6))
+
+
+class TestReactor(unittest.TestCase):
+    def setUp(self):
+        self.reactor = shimmer_listener.Reactor()
+        self.motes = []
+        self.received = {}
+        self.disconnected = {}
+
+    def tearDown(self):
+        self.reactor.close(5)
+        for mote in self.motes:
+            mote.close()
+
+    def add_stream(self, mac):
+        mote, local = socket.socketpair()
+        self.motes.append(mote)
+        self.received[mac] = []
+        stream = shimmer_listener.BtMasterInputStream(mac, local, "uuid")
+        stream.on_message = lambda m, message: self.received[m].append(message)
+        stream.on_disconnect = lambda m, lost: self.disconnected.__setitem__(m, lost)
+        self.reactor.add(stream)
+        return mote, stream
+
+    def wait(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_multiple_streams(self):
+        motes = [self.add_stream(f"mac{idx}")[0] for idx in range(5)]
+        payload = b"".join(master_frame(idx) for idx in range(10))
+        for mote in motes:
+            # Split at a non frame boundary to exercise the reassembly
+            mote.sendall(payload[:30])
+            mote.sendall(payload[30:])
+        self.wait(lambda: all(len(messages) == 10 for messages in self.received.values()))
+        for mac, messages in self.received.items():
+            self.assertEqual([message["accel_x"] for message in messages], list(range(10)))
+            self.assertEqual(messages[0]["mac"], mac)
+
+    def test_lost(self):
+        mote, _ = self.add_stream("mac")
+        mote.close()
+        self.wait(lambda: "mac" in self.disconnected)
+        self.assertEqual(self.disconnected["mac"], True)
+
+    def test_stop(self):
+        _, stream = self.add_stream("mac")
+        self.wait(lambda: stream.open)
+        stream.stop()
+        self.wait(lambda: "mac" in self.disconnected)
+        self.assertEqual(self.disconnected["mac"], False)
+
+    def test_close(self):
+        self.add_stream("mac")
+        self.wait(lambda: len(self.reactor.streams) == 1)
+        self.assertTrue(self.reactor.close(5))
+        self.assertEqual(self.disconnected["mac"], False)
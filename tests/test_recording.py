@@ -0,0 +1,82 @@
+import shimmer_listener
+from shimmer_listener import RecordKind
+from helpers import data_dict, data_frame, presentation_frame
+
+import tempfile
+import time
+import unittest
+import os
+
+
+class TestRecording(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "session.log")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def record(self, gap=0.0):
+        # Records a slave stream receiving the presentation frame and two bursts of 15 frames each
+        recorder = shimmer_listener.Recorder(self.path)
+        transport = shimmer_listener.PipeTransport()
+        stream = shimmer_listener.BtSlaveInputStream("mac", transport)
+        stream.recorder = recorder
+        stream.start()
+        transport.write(presentation_frame() + data_frame * 15)
+        time.sleep(gap + 0.05)
+        transport.write(data_frame * 15)
+        transport.end()
+        while stream.open:
+            time.sleep(0.01)
+        recorder.close()
+
+    def replay(self, speed):
+        received = {"connect": [], "messages": [], "disconnect": []}
+        replayer = shimmer_listener.Replayer(
+            self.path, speed,
+            connect_handle=lambda mac, info: received["connect"].append(info.keys),
+            message_handle=lambda mac, message: received["messages"].append(message),
+            disconnect_handle=lambda mac, lost: received["disconnect"].append(lost))
+        start = time.monotonic()
+        replayer.run()
+        return received, time.monotonic() - start
+
+    def test_log(self):
+        self.record()
+        records = list(shimmer_listener.read_log(self.path))
+        self.assertEqual(records[0].kind, RecordKind.OPEN)
+        self.assertEqual(records[0].data, b"slave")
+        self.assertEqual(records[-1].kind, RecordKind.CLOSE)
+        data = b"".join(record.data for record in records if record.kind is RecordKind.DATA)
+        self.assertEqual(data, presentation_frame() + data_frame * 30)
+        self.assertTrue(all(record.mac == "mac" for record in records))
+        timestamps = [record.timestamp for record in records]
+        self.assertEqual(timestamps, sorted(timestamps))
+
+    def test_replay(self):
+        self.record()
+        received, _ = self.replay(None)
+        self.assertEqual(received["connect"], [list(data_dict)])
+        self.assertEqual(len(received["messages"]), 30)
+        self.assertDictEqual(received["messages"][0], data_dict)
+        self.assertEqual(received["disconnect"], [True])
+
+    def test_replay_speed(self):
+        self.record(gap=0.5)
+        _, elapsed = self.replay(1)
+        self.assertGreaterEqual(elapsed, 0.5)
+        _, elapsed = self.replay(50)
+        self.assertLess(elapsed, 0.5)
+
+    def test_truncated_log(self):
+        self.record()
+        with open(self.path, "ab") as f:
+            f.write(b"\x01\x00\x00")
+        received, _ = self.replay(None)
+        self.assertEqual(len(received["messages"]), 30)
+
+    def test_not_a_log(self):
+        with open(self.path, "wb") as f:
+            f.write(b"something else")
+        self.assertRaises(ValueError, shimmer_listener.Recorder, self.path)
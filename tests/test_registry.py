@@ -0,0 +1,49 @@
+from shimmer_listener._registry import DeviceRegistry
+from shimmer_listener import Frameinfo
+
+import tempfile
+import unittest
+import os
+
+
+def is_shimmer_name(name):
+    return name.startswith("RN42")
+
+
+class TestDeviceRegistry(unittest.TestCase):
+    def setUp(self):
+        self.lookups = []
+
+    def lookup_name(self, mac):
+        self.lookups.append(mac)
+        return {"mac1": "RN42-1234", "mac2": "phone"}.get(mac)
+
+    def test_lookup_cached(self):
+        registry = DeviceRegistry()
+        for _ in range(3):
+            self.assertTrue(registry.is_shimmer("mac1", self.lookup_name, is_shimmer_name))
+            self.assertFalse(registry.is_shimmer("mac2", self.lookup_name, is_shimmer_name))
+        self.assertEqual(self.lookups, ["mac1", "mac2"])
+        self.assertEqual(registry.shimmer_devices(), ["mac1"])
+
+    def test_failed_lookup_not_cached(self):
+        registry = DeviceRegistry()
+        registry.is_shimmer("mac3", self.lookup_name, is_shimmer_name)
+        registry.is_shimmer("mac3", self.lookup_name, is_shimmer_name)
+        self.assertEqual(self.lookups, ["mac3", "mac3"])
+        self.assertIsNone(registry.get("mac3"))
+
+    def test_persistence(self):
+        info = Frameinfo(120, 8, "hhhh", ["accel_x", "accel_y", "accel_z", "batt"])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "registry.json")
+            registry = DeviceRegistry(path)
+            registry.is_shimmer("mac1", self.lookup_name, is_shimmer_name)
+            registry.update_info("mac1", info)
+
+            loaded = DeviceRegistry(path)
+            self.assertEqual(loaded.shimmer_devices(), ["mac1"])
+            self.assertEqual(loaded.get("mac1")["name"], "RN42-1234")
+            self.assertEqual(loaded.get("mac1")["info"], info)
+            self.assertTrue(loaded.is_shimmer("mac1", self.lookup_name, is_shimmer_name))
+            self.assertEqual(self.lookups, ["mac1"])
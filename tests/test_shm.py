@@ -0,0 +1,122 @@
+from shimmer_listener import BtSlaveInputStream, Frameinfo, MessageFormat, PipeTransport, SharedRing, \
+    SharedRingReader, ring_name
+from shimmer_listener._shm import _writer
+from helpers import data_frame, presentation_frame
+
+import multiprocessing
+import subprocess
+import struct
+import sys
+import unittest
+import os
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+
+info = Frameinfo(16, 8, "hhhh", ["accel_x", "accel_y", "accel_z", "batt"])
+
+
+def read_child(name, queue):
+    reader = SharedRingReader(name, oldest=True)
+    queue.put(reader.read_messages())
+    reader.close()
+
+
+@unittest.skipIf(shared_memory is None, "shared_memory requires Python 3.8")
+class TestSharedRing(unittest.TestCase):
+    def setUp(self):
+        self.name = f"shimmer_test_{os.getpid()}"
+        self.ring = SharedRing(self.name, slots=4, slot_size=32)
+
+    def tearDown(self):
+        self.ring.close()
+
+    def test_read(self):
+        reader = SharedRingReader(self.name)
+        self.assertIsNone(reader.read())
+        self.ring.set_frameinfo(info)
+        self.assertEqual(self.ring.write(data_frame * 2), 0)
+        self.assertEqual(reader.read(), (0, data_frame * 2))
+        self.assertIsNone(reader.read())
+        self.assertEqual(reader.frameinfo, info)
+        reader.close()
+
+    def test_overrun(self):
+        reader = SharedRingReader(self.name)
+        for seq in range(10):
+            self.ring.write(struct.pack("<I", seq))
+        seq, data = reader.read()
+        self.assertEqual(seq, 6)
+        self.assertEqual(struct.unpack("<I", data)[0], 6)
+        self.assertEqual(reader.lost, 6)
+        self.assertEqual([reader.read()[0] for _ in range(3)], [7, 8, 9])
+        reader.close()
+
+    def test_split(self):
+        # 5 frames of 16 B don't fit in a single 32 B slot
+        reader = SharedRingReader(self.name)
+        self.ring.write_frames(memoryview(data_frame * 10), info)
+        self.assertEqual([len(reader.read()[1]) for _ in range(3)], [32, 32, 16])
+        self.assertEqual(reader.frameinfo, info)
+        reader.close()
+
+    def test_live_writer(self):
+        # The ring of a running writer is never replaced by accident
+        reader = SharedRingReader(self.name)
+        self.assertRaises(FileExistsError, SharedRing, self.name, slots=4, slot_size=32)
+        self.ring.write(b"data")
+        self.assertEqual(reader.read(), (0, b"data"))
+        reader.close()
+
+    def test_stale_writer(self):
+        # The ring of a writer that is gone is replaced
+        exited = subprocess.Popen([sys.executable, "-c", "pass"])
+        exited.wait()
+        _writer.pack_into(self.ring._shm.buf, 32, exited.pid)
+        self.ring.close(unlink=False)
+        self.ring = SharedRing(self.name, slots=4, slot_size=32)
+        self.assertEqual(self.ring.head, 0)
+
+    def test_replace(self):
+        replaced = self.ring
+        self.ring = SharedRing(self.name, slots=4, slot_size=32, replace=True)
+        replaced.close(unlink=False)
+        reader = SharedRingReader(self.name)
+        self.ring.write(b"data")
+        self.assertEqual(reader.read(), (0, b"data"))
+        reader.close()
+
+    def test_process(self):
+        self.ring.write_frames(memoryview(data_frame * 2), info)
+        queue = multiprocessing.get_context("spawn").Queue()
+        child = multiprocessing.get_context("spawn").Process(target=read_child, args=(self.name, queue))
+        child.start()
+        seq, messages = queue.get(timeout=30)
+        child.join()
+        self.assertEqual(seq, 0)
+        self.assertEqual(messages, [{"accel_x": 2000, "accel_y": 2001, "accel_z": 2002, "batt": 2003}] * 2)
+
+
+@unittest.skipIf(shared_memory is None, "shared_memory requires Python 3.8")
+class TestStreamRing(unittest.TestCase):
+    def test_stream(self):
+        ring = SharedRing(ring_name("00:11", f"shimmer_test_{os.getpid()}"))
+        reader = SharedRingReader(ring.name)
+        transport = PipeTransport()
+        stream = BtSlaveInputStream("00:11", transport)
+        stream.ring = ring
+        transport.write(presentation_frame(info) + data_frame * 7)
+        transport.end()
+        try:
+            stream.loop_forever()
+        except ConnectionError:
+            pass
+        seq, messages = reader.read_messages(MessageFormat.RECORD)
+        self.assertEqual(len(messages), 6)
+        self.assertEqual(messages[0].batt, 2003)
+        self.assertIsNone(reader.read())
+        reader.close()
+        ring.close()
@@ -0,0 +1,94 @@
+import shimmer_listener
+from shimmer_listener import _master
+from helpers import presentation_frame, wait_for
+
+import threading
+import time
+import unittest
+
+
+class TestShutdown(unittest.TestCase):
+    def setUp(self):
+        self.disconnected = []
+        self.pipes = []
+        # Other tests may leave the interface initialized
+        shimmer_listener._running = False
+        shimmer_listener._op_mode = None
+
+    def tearDown(self):
+        for pipe in self.pipes:
+            pipe.end()
+        _master._open_conn.clear()
+        shimmer_listener._running = False
+        shimmer_listener._op_mode = None
+
+    def silent_stream(self, mac="mac", presentation=True):
+        # A stream whose mote connected, then stopped sending data
+        pipe = shimmer_listener.PipeTransport()
+        self.pipes.append(pipe)
+        if presentation:
+            pipe.write(presentation_frame())
+            stream = shimmer_listener.BtSlaveInputStream(mac, pipe)
+        else:
+            stream = shimmer_listener.BtMasterInputStream(mac, pipe, "uuid")
+        stream.on_disconnect = lambda m, lost: self.disconnected.append((m, lost))
+        return stream
+
+    def test_stop_interrupts_recv(self):
+        for presentation in (True, False):
+            with self.subTest(presentation=presentation):
+                self.disconnected.clear()
+                stream = self.silent_stream(presentation=presentation)
+                stream.start()
+                self.assertTrue(wait_for(lambda: stream.open))
+                time.sleep(0.05)
+                self.assertFalse(stream.join(0))
+
+                stream.stop()
+                self.assertTrue(stream.join(2))
+                self.assertEqual(self.disconnected, [("mac", False)])
+
+    def test_stop_before_presentation(self):
+        pipe = shimmer_listener.PipeTransport()
+        self.pipes.append(pipe)
+        stream = shimmer_listener.BtSlaveInputStream("mac", pipe)
+        stream.on_disconnect = lambda m, lost: self.disconnected.append((m, lost))
+        stream.start()
+        self.assertTrue(wait_for(lambda: stream.open))
+        stream.stop()
+        self.assertTrue(stream.join(2))
+        self.assertEqual(self.disconnected, [("mac", False)])
+
+    def test_join_not_started(self):
+        self.assertTrue(self.silent_stream().join(0))
+
+    def test_bt_close(self):
+        shimmer_listener.bt_init(shimmer_listener.BtMode.MASTER)
+        streams = [self.silent_stream(f"mac{idx}") for idx in range(3)]
+        for stream in streams:
+            _master._open_conn[stream._mac] = stream
+            stream.start()
+        self.assertTrue(wait_for(lambda: all(stream.open for stream in streams)))
+
+        start = time.monotonic()
+        self.assertEqual(shimmer_listener.bt_close(timeout=2), [])
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual(sorted(self.disconnected), [(f"mac{idx}", False) for idx in range(3)])
+
+    def test_bt_close_timeout(self):
+        # A disconnect handler that doesn't return keeps its stream running
+        release = threading.Event()
+        shimmer_listener.bt_init(shimmer_listener.BtMode.MASTER)
+        stream = self.silent_stream()
+        stream.on_disconnect = lambda m, lost: release.wait(5)
+        _master._open_conn[stream._mac] = stream
+        stream.start()
+        self.assertTrue(wait_for(lambda: stream.open))
+
+        self.assertEqual(shimmer_listener.bt_close(timeout=0.2), ["mac"])
+        release.set()
+        self.assertTrue(stream.join(2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+import shimmer_listener
+from shimmer_listener import _slave
+from helpers import data_dict, data_frame as data_chunk, presentation_frame, wait_for
+
+import queue
+import socket
+import threading
+import time
+import unittest
+
+
+# The presentation frame announces frames of 15 chunks
+data_frame = data_chunk * 15
+
+
+class FakeServer:
+    # Server socket handing out the ends of socketpairs, as if the motes connected to it; as a real socket
+    # on Linux, it only wakes up a blocked accept when it is shut down, not when it is closed
+    def __init__(self):
+        self._pending = queue.Queue()
+        self.accepted = 0
+
+    def connect(self, mac):
+        mote, listener = socket.socketpair()
+        self._pending.put((listener, (mac, 1)))
+        return mote
+
+    def accept(self):
+        client = self._pending.get()
+        if client is None:
+            raise OSError("server socket closed")
+        self.accepted += 1
+        return client
+
+    def shutdown(self, how):
+        self._pending.put(None)
+
+    def close(self):
+        pass
+
+
+class TestSlaveServer(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeServer()
+        _slave._bt_sock = self.server
+        _slave._accepting = True
+        self.messages = []
+        self.disconnected = []
+        self.mutex = threading.Lock()
+        self.motes = []
+
+    def tearDown(self):
+        if _slave._accepting:
+            _slave._slave_close()
+        for mote in self.motes:
+            mote.close()
+
+    def on_message(self, mac, message):
+        with self.mutex:
+            self.messages.append((mac, message))
+
+    def on_disconnect(self, mac, lost):
+        with self.mutex:
+            self.disconnected.append((mac, lost))
+
+    def listen(self, **kwargs):
+        thread = threading.Thread(target=_slave._slave_listen,
+                                  kwargs=dict(message_handle=self.on_message, disconnect_handle=self.on_disconnect,
+                                              **kwargs), daemon=True)
+        thread.start()
+        return thread
+
+    def connect(self, mac):
+        mote = self.server.connect(mac)
+        self.motes.append(mote)
+        return mote
+
+    def test_presentation(self):
+        thread = self.listen(presentation=True)
+        motes = [self.connect(f"mote{idx}") for idx in range(4)]
+        for mote in motes:
+            mote.sendall(presentation_frame() + data_frame * 2)
+        self.assertTrue(wait_for(lambda: len(self.messages) == 120))
+        self.assertDictEqual(self.messages[0][1], data_dict)
+        self.assertEqual(set(_slave._slave_streams()), {f"mote{idx}" for idx in range(4)})
+
+        # Closing the server stops the streams still running
+        _slave._slave_close()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(wait_for(lambda: len(self.disconnected) == 4))
+        self.assertTrue(wait_for(lambda: not _slave._slave_streams()))
+
+    def test_busy_stream(self):
+        # A mote that never sends its presentation frame doesn't delay the others
+        self.listen(presentation=True)
+        self.connect("silent")
+        mote = self.connect("mote")
+        mote.sendall(presentation_frame() + data_frame)
+        self.assertTrue(wait_for(lambda: len(self.messages) == 15))
+        self.assertEqual(self.messages[0][0], "mote")
+
+    def test_master_frames(self):
+        self.listen()
+        mote = self.connect("mote")
+        mote.sendall(shimmer_listener.master_frame([1, 2, 3, 4, 5, 6]) * 3)
+        self.assertTrue(wait_for(lambda: len(self.messages) == 3))
+        self.assertEqual(self.messages[0][1]["gyro_z"], 6)
+
+    def test_disconnect(self):
+        self.listen(presentation=True)
+        mote = self.connect("mote")
+        mote.sendall(presentation_frame())
+        self.assertTrue(wait_for(lambda: "mote" in _slave._slave_streams()))
+        mote.close()
+        self.assertTrue(wait_for(lambda: self.disconnected == [("mote", True)]))
+        self.assertTrue(wait_for(lambda: not _slave._slave_streams()))
+
+    def test_reconnect(self):
+        self.listen(presentation=True)
+        first = self.connect("mote")
+        first.sendall(presentation_frame())
+        self.assertTrue(wait_for(lambda: "mote" in _slave._slave_streams()))
+        stale = _slave._slave_streams()["mote"]
+
+        second = self.connect("mote")
+        second.sendall(presentation_frame() + data_frame)
+        self.assertTrue(wait_for(lambda: len(self.messages) == 15))
+        self.assertTrue(wait_for(lambda: len(self.disconnected) == 1))
+        self.assertIsNot(_slave._slave_streams()["mote"], stale)
+
+    def test_close_wakes_accept(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(("127.0.0.1", 0))
+        server.listen(1)
+        _slave._bt_sock = server
+        thread = self.listen()
+        self.assertTrue(wait_for(lambda: thread.is_alive()))
+        time.sleep(0.05)
+        _slave._slave_close(timeout=1)
+        thread.join(2)
+        self.assertFalse(thread.is_alive())
+
+    def test_max_connections(self):
+        self.listen(presentation=True, max_connections=2)
+        for idx in range(2):
+            self.connect(f"mote{idx}").sendall(presentation_frame())
+        self.assertTrue(wait_for(lambda: len(_slave._slave_streams()) == 2))
+
+        refused = self.connect("refused")
+        self.assertTrue(wait_for(lambda: self.server.accepted == 3))
+        refused.settimeout(5)
+        self.assertEqual(refused.recv(1), b"")
+        self.assertEqual(set(_slave._slave_streams()), {"mote0", "mote1"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+from shimmer_listener import BtSlaveInputStream, ColumnFile, ColumnStore, Frameinfo, MessageFormat, PipeTransport
+from shimmer_listener._storage import _MoteFile
+from helpers import data_frame, presentation_frame
+
+from unittest import mock
+import tempfile
+import time
+import unittest
+import os
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+info = Frameinfo(120, 8, "hhhh", ["accel_x", "accel_y", "accel_z", "batt"])
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestColumnStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = self.tmp_dir.name
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_store(self):
+        store = ColumnStore(self.directory, block_rows=10)
+        store.on_connect("00:11", info)
+        for idx in range(25):
+            store.on_message("00:11", {"accel_x": idx, "accel_y": 1, "accel_z": 2, "batt": 3, "timestamp": 10 ** 12})
+        store.on_disconnect("00:11", False)
+        store.close()
+
+        self.assertEqual(len(store.files), 1)
+        self.assertEqual(store.stats()["rows"], 25)
+        column_file = ColumnFile(store.files[0])
+        self.assertTrue(column_file.complete)
+        self.assertEqual(column_file.mac, "00:11")
+        self.assertEqual(column_file.frameinfo, info)
+        self.assertEqual(column_file.rows, 25)
+        self.assertEqual(len(column_file.blocks), 3)
+        self.assertEqual(column_file.dtypes["accel_x"], np.dtype("<i2"))
+        self.assertEqual(column_file.dtypes["timestamp"], np.dtype("<i8"))
+        self.assertEqual(column_file.column("accel_x").tolist(), list(range(25)))
+        self.assertIsInstance(column_file.block(0)["batt"], np.memmap)
+
+    def test_roll(self):
+        store = ColumnStore(self.directory, max_bytes=100, block_rows=4)
+        store.on_connect("mac", info)
+        for idx in range(20):
+            store.on_batch("mac", [{"accel_x": idx, "accel_y": 1, "accel_z": 2, "batt": 3}])
+        store.close()
+        self.assertEqual(len(store.files), 5)
+        values = [value for path in store.files for value in ColumnFile(path).column("accel_x").tolist()]
+        self.assertEqual(values, list(range(20)))
+
+    def test_write_error(self):
+        # A failing write drops the rows of its block, without stopping the writer thread
+        write_block = _MoteFile.write_block
+
+        def failing_write(column_file, columns, rows):
+            if "bad" in column_file.path:
+                raise OSError("no space left on device")
+            write_block(column_file, columns, rows)
+
+        store = ColumnStore(self.directory, block_rows=5)
+        with mock.patch.object(_MoteFile, "write_block", failing_write), self.assertLogs(level="ERROR"):
+            for mac in ("bad", "good"):
+                store.on_connect(mac, info)
+                for idx in range(12):
+                    store.on_message(mac, {"accel_x": idx, "accel_y": 1, "accel_z": 2, "batt": 3})
+            store.close()
+
+        stats = store.stats()
+        self.assertEqual(stats["rows"], 12)
+        self.assertEqual(stats["dropped"], 12)
+        column_files = {ColumnFile(path).mac: ColumnFile(path) for path in store.files}
+        self.assertEqual(column_files["good"].column("accel_x").tolist(), list(range(12)))
+        # The file of every mote is closed, even if its last rows couldn't be written
+        self.assertTrue(all(column_file.complete for column_file in column_files.values()))
+
+    def test_unclosed(self):
+        # The blocks written so far can be read while the file is still open
+        store = ColumnStore(self.directory, block_rows=5, flush_interval=60)
+        store.on_connect("mac", info)
+        for idx in range(12):
+            store.on_message("mac", {"accel_x": idx, "accel_y": 1, "accel_z": 2, "batt": 3})
+        deadline = time.monotonic() + 5
+        while store.stats()["rows"] < 10 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        column_file = ColumnFile(store.files[0])
+        self.assertFalse(column_file.complete)
+        self.assertEqual(column_file.column("accel_x").tolist(), list(range(10)))
+        store.close()
+
+    def test_stream(self):
+        store = ColumnStore(self.directory)
+        transport = PipeTransport()
+        stream = BtSlaveInputStream("mac", transport)
+        stream.message_format = MessageFormat.COLUMNS
+        stream.on_connect = store.on_connect
+        stream.on_message = store.on_message
+        stream.on_disconnect = store.on_disconnect
+        transport.write(presentation_frame(info) + data_frame * 45)
+        transport.end()
+        try:
+            stream.loop_forever()
+        except ConnectionError:
+            pass
+        store.close()
+        columns = ColumnFile(store.files[0]).columns()
+        self.assertEqual(os.path.dirname(store.files[0]), self.directory)
+        self.assertEqual(columns["accel_x"].tolist(), [2000] * 45)
+        self.assertEqual(columns["batt"].tolist(), [2003] * 45)
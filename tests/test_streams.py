@@ -154,3 +154,42 @@ class TestBtSlaveStream(unittest.TestCase):
         time.sleep(1)
         self.assertEqual(self.read["mac"], self.mac, "expected passed mac, got another one")
         self.assertDictEqual(self.read["message"], data_dict, "expected passed msg")
+
+    def test_incoming_batch(self):
+        batches = []
+
+        def on_batch(mac, batch):
+            self.read["mac"] = mac
+            batches.append(batch)
+
+        self.stream.on_batch = on_batch
+        self.stream.start()
+        time.sleep(1)
+        self.stream.stop()
+        self.assertEqual(self.read["mac"], self.mac, "expected passed mac, got another one")
+        self.assertEqual(len(batches[0]), 15, "expected a batch with every chunk of the frame")
+        self.assertDictEqual(batches[0][0], data_dict, "expected passed msg")
+
+    def test_incoming_batch_size(self):
+        batches = []
+
+        self.stream.on_batch = lambda _, batch: batches.append(batch)
+        self.stream.batch_size = 4
+        self.stream.start()
+        time.sleep(1)
+        self.stream.stop()
+        self.assertTrue(batches, "expected at least a batch")
+        self.assertEqual(len(batches[0]), 4, "expected a batch of batch_size messages")
+
+    def test_incoming_record(self):
+        def on_message(mac, message):
+            self.read["mac"] = mac
+            self.read["message"] = message
+
+        self.stream.on_message = on_message
+        self.stream.message_format = shimmer_listener.MessageFormat.RECORD
+        self.stream.start()
+        time.sleep(1)
+        self.assertEqual(self.read["mac"], self.mac, "expected passed mac, got another one")
+        self.assertEqual(self.read["message"].accel_y, 2001, "expected a record with the passed msg")
+        self.assertDictEqual(self.read["message"]._asdict(), data_dict, "expected passed msg")
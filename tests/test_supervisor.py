@@ -0,0 +1,89 @@
+from shimmer_listener import Supervisor, BtMasterInputStream
+import shimmer_listener
+
+import socket
+import time
+import unittest
+
+
+def master_frame(value: int) -> bytes:
+    return shimmer_listener.master_frame(range(value, value + 6))
+
+
+def wait(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+class TestBackoff(unittest.TestCase):
+    def test_backoff(self):
+        supervisor = Supervisor(backoff_base=1, backoff_factor=2, backoff_max=10, jitter=0)
+        self.assertEqual([supervisor.backoff(attempt) for attempt in range(7)], [0, 1, 2, 4, 8, 10, 10])
+        supervisor.close()
+
+    def test_jitter(self):
+        supervisor = Supervisor(backoff_base=4, jitter=0.5)
+        for _ in range(100):
+            self.assertTrue(2 <= supervisor.backoff(1) <= 6)
+        supervisor.close()
+
+
+class TestSupervisor(unittest.TestCase):
+    def setUp(self):
+        self.reconnected = []
+        self.supervisor = Supervisor(reconnect=self.reconnected.append, backoff_base=0.05, jitter=0,
+                                     check_interval=0.05, min_stall_timeout=0.2, connect_stall_timeout=0.2)
+
+    def tearDown(self):
+        self.supervisor.close(5)
+
+    def test_reconnect(self):
+        self.supervisor.lost("mac")
+        wait(lambda: self.reconnected)
+        self.assertEqual(self.reconnected, ["mac"])
+
+        # The following attempts are delayed, until the mote is connected again
+        self.supervisor.lost("mac", failed=True)
+        self.assertTrue(self.supervisor.pending("mac"))
+        wait(lambda: len(self.reconnected) == 2)
+        self.assertFalse(self.supervisor.pending("mac"))
+        self.supervisor.connected("mac")
+
+        stats = self.supervisor.stats()["mac"]
+        self.assertEqual(stats["reconnects"], 1)
+        self.assertEqual(stats["failures"], 1)
+        self.assertEqual(stats["attempt"], 0)
+        self.assertGreaterEqual(stats["last_gap"], 0.05)
+        self.assertEqual(stats["max_gap"], stats["total_gap"])
+
+    def test_no_duplicate_attempts(self):
+        self.supervisor.lost("mac")
+        wait(lambda: self.reconnected)
+        self.supervisor.lost("mac", failed=True)
+        self.supervisor.lost("mac", failed=True)
+        time.sleep(0.3)
+        self.assertEqual(self.reconnected, ["mac", "mac"])
+
+    def test_stall(self):
+        mote, local = socket.socketpair()
+        disconnected = []
+        stream = BtMasterInputStream("mac", local, "uuid")
+        stream.on_disconnect = lambda mac, lost: disconnected.append(lost)
+        self.supervisor.watch(stream)
+        stream.start()
+        mote.sendall(master_frame(0))
+
+        # The mote stops sending data but keeps the connection open
+        wait(lambda: disconnected)
+        mote.close()
+        self.assertEqual(disconnected, [True])
+        self.assertEqual(self.supervisor.stats()["mac"]["stalls"], 1)
+
+    def test_close(self):
+        self.supervisor.lost("mac")
+        wait(lambda: self.reconnected)
+        self.supervisor.lost("mac", failed=True)
+        self.supervisor.close(5)
+        time.sleep(0.1)
+        self.assertEqual(self.reconnected, ["mac"])
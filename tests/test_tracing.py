@@ -0,0 +1,103 @@
+import shimmer_listener
+from shimmer_listener import BtSlaveInputStream, LatencyTracer, MessageFormat, PipeTransport, Tracer
+from shimmer_listener._tracing import _Timestamper
+from helpers import data_frame, presentation_frame
+
+import time
+import unittest
+
+
+class EventTracer(Tracer):
+    def __init__(self):
+        self.events = []
+
+    def on_recv(self, mac, size, recv_ns):
+        self.events.append("recv")
+
+    def on_decode(self, mac, messages, recv_ns, now_ns):
+        self.events.append(("decode", messages))
+
+    def on_dispatch(self, mac, kind, recv_ns, now_ns):
+        self.events.append("dispatch")
+
+    def on_return(self, mac, kind, recv_ns, now_ns):
+        self.events.append("return" if recv_ns <= now_ns else "backwards")
+
+
+class TestTimestamper(unittest.TestCase):
+    def test_interpolation(self):
+        timestamper = _Timestamper()
+        self.assertEqual(timestamper.stamp(1000, 10), (1000.0, 0.0))
+        first, step = timestamper.stamp(2000, 10)
+        self.assertEqual(step, 100.0)
+        self.assertEqual(first + 9 * step, 2000)
+        self.assertGreater(first, 1000)
+
+    def test_monotonic(self):
+        # A burst arriving right after the previous read can't be stamped before it
+        timestamper = _Timestamper()
+        timestamper.stamp(0, 1)
+        timestamper.stamp(1000, 1)
+        first, step = timestamper.stamp(1010, 10)
+        self.assertGreater(first, 1000)
+        self.assertAlmostEqual(first + 9 * step, 1010)
+
+
+class TestTracing(unittest.TestCase):
+    def run_stream(self, message_format=MessageFormat.DICT, tracer=None):
+        received = []
+        transport = PipeTransport()
+        stream = BtSlaveInputStream("mac", transport)
+        stream.timestamps = True
+        stream.tracer = tracer
+        stream.message_format = message_format
+        stream.on_message = lambda mac, message: received.append(message)
+        stream.start()
+        transport.write(presentation_frame() + data_frame * 15)
+        time.sleep(0.05)
+        transport.write(data_frame * 15)
+        transport.end()
+        while stream.open:
+            time.sleep(0.01)
+        return received
+
+    def test_dict(self):
+        received = self.run_stream()
+        self.assertEqual(len(received), 30)
+        stamps = [message["timestamp"] for message in received]
+        self.assertEqual(stamps, sorted(stamps))
+        self.assertLessEqual(stamps[-1], shimmer_listener.monotonic_ns())
+        self.assertEqual(received[0]["accel_x"], 2000)
+
+    def test_record(self):
+        received = self.run_stream(MessageFormat.RECORD)
+        self.assertEqual(received[0]._fields, ("accel_x", "accel_y", "accel_z", "batt", "timestamp"))
+        stamps = [message.timestamp for message in received]
+        self.assertEqual(stamps, sorted(stamps))
+
+    def test_running(self):
+        transport = PipeTransport()
+        stream = BtSlaveInputStream("mac", transport)
+        stream.start()
+        while not stream.open:
+            time.sleep(0.01)
+        with self.assertRaises(ValueError):
+            stream.timestamps = True
+        transport.end()
+
+    def test_events(self):
+        tracer = EventTracer()
+        self.run_stream(tracer=tracer)
+        self.assertIn("recv", tracer.events)
+        self.assertEqual(sum(1 for event in tracer.events if event == ("decode", 15)), 2)
+        self.assertEqual(tracer.events.count("dispatch"), 30)
+        self.assertEqual(tracer.events.count("return"), 30)
+
+    def test_latency_tracer(self):
+        tracer = LatencyTracer()
+        self.run_stream(tracer=tracer)
+        stats = tracer.stats()["mac"]
+        self.assertEqual(stats["deliveries"], 30)
+        self.assertGreaterEqual(stats["latency_max"], stats["latency_mean"])
+        self.assertGreaterEqual(stats["jitter"], 0)
+        self.assertEqual(tracer.histograms()["mac"].count, 30)
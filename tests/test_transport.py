@@ -0,0 +1,158 @@
+import shimmer_listener
+from helpers import data_dict, data_frame, presentation_frame
+
+import socket
+import errno
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import os
+
+
+class TestTransports(unittest.TestCase):
+    def setUp(self):
+        self.messages = []
+        self.disconnected = []
+        self.info = None
+
+    def run_stream(self, transport):
+        stream = shimmer_listener.BtSlaveInputStream("mac", transport)
+        stream.on_connect = lambda mac, info: setattr(self, "info", info)
+        stream.on_message = lambda mac, message: self.messages.append(message)
+        stream.on_disconnect = lambda mac, lost: self.disconnected.append(lost)
+        stream.loop_forever()
+
+    def serve(self, server):
+        # Accepts a single connection and sends the presentation frame and 30 messages over it
+        def run():
+            conn, _ = server.accept()
+            conn.sendall(presentation_frame() + data_frame * 30)
+            conn.close()
+            server.close()
+        threading.Thread(target=run).start()
+
+    def check_received(self):
+        self.assertEqual(self.info.keys, list(data_dict))
+        self.assertEqual(len(self.messages), 30)
+        self.assertDictEqual(self.messages[0], data_dict)
+        self.assertEqual(self.disconnected, [True])
+
+    def test_pipe(self):
+        transport = shimmer_listener.PipeTransport()
+        transport.write(presentation_frame() + data_frame * 30)
+        transport.end()
+        self.run_stream(transport)
+        self.check_received()
+
+    def test_tcp(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(("127.0.0.1", 0))
+        server.listen(1)
+        self.serve(server)
+        self.run_stream(shimmer_listener.TcpTransport(server.getsockname()))
+        self.check_received()
+
+    @unittest.skipUnless(hasattr(socket, "AF_UNIX"), "Unix-domain sockets not available")
+    def test_unix(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "mote.sock")
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.bind(path)
+            server.listen(1)
+            self.serve(server)
+            self.run_stream(shimmer_listener.UnixTransport(path))
+        self.check_received()
+
+    def test_connect_error(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            transport = shimmer_listener.UnixTransport(os.path.join(tmp_dir, "missing.sock"))
+            stream = shimmer_listener.BtSlaveInputStream("mac", transport)
+            self.assertRaises(shimmer_listener.TransportError, stream.loop_forever)
+
+    def test_master_stream_over_pipe(self):
+        transport = shimmer_listener.PipeTransport()
+        stream = shimmer_listener.BtMasterInputStream("mac", transport, "uuid")
+        stream.on_message = lambda mac, message: self.messages.append(message)
+        stream.on_disconnect = lambda mac, lost: self.disconnected.append(lost)
+        stream.start()
+        transport.write(shimmer_listener.master_frame(range(6)))
+        transport.end()
+        deadline = time.monotonic() + 5
+        while not self.disconnected and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.messages[0]["gyro_z"], 5)
+        self.assertEqual(self.disconnected, [True])
+
+    def test_batch_latency_silent_mote(self):
+        # A partial batch is delivered on its deadline, even if no more data follows it
+        for reactor in (None, shimmer_listener.Reactor()):
+            with self.subTest(reactor=reactor is not None):
+                batches = []
+                transport = shimmer_listener.PipeTransport()
+                stream = shimmer_listener.BtSlaveInputStream("mac", transport)
+                stream.on_batch = lambda mac, batch: batches.append(batch)
+                stream.batch_size = 100
+                stream.batch_latency = 0.1
+                transport.write(presentation_frame() + data_frame * 15)
+                if reactor is None:
+                    stream.start()
+                else:
+                    reactor.add(stream)
+                deadline = time.monotonic() + 5
+                while not batches and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                self.assertEqual([len(batch) for batch in batches], [15])
+                self.assertTrue(stream.open)
+                stream.stop()
+                self.assertTrue(stream.join(5))
+                transport.end()
+                if reactor is not None:
+                    reactor.close(5)
+
+    def test_error_mapping(self):
+        class FailingSocket:
+            def recv(self, size):
+                raise OSError("device unreachable")
+
+        transport = shimmer_listener.SocketTransport(FailingSocket())
+        self.assertRaises(shimmer_listener.TransportError, transport.recv_into, bytearray(10))
+
+    def test_bluetooth_error_mapping(self):
+        # pybluez raises every error as a BluetoothError, which Python doesn't map to a subclass by errno
+        class BluetoothError(OSError):
+            pass
+
+        class BluetoothSocket:
+            error = None
+
+            def recv(self, size):
+                raise self.error
+
+        sock = BluetoothSocket()
+        transport = shimmer_listener.SocketTransport(sock)
+        for error, expected in ((BluetoothError(errno.EAGAIN, "Resource temporarily unavailable"), BlockingIOError),
+                                (BluetoothError("timed out"), socket.timeout),
+                                (BluetoothError(errno.EBADF, "Bad file descriptor"), shimmer_listener.TransportError)):
+            with self.subTest(error=error):
+                sock.error = error
+                self.assertRaises(expected, transport.recv_into, bytearray(10))
+
+    def test_without_bluetooth(self):
+        # The library is usable without pybluez, which is only needed by the bluetooth connections
+        script = (
+            "import sys; sys.modules['bluetooth'] = None\n"
+            "import shimmer_listener\n"
+            "transport = shimmer_listener.PipeTransport()\n"
+            "assert shimmer_listener.BtSlaveInputStream('mac', transport).transport is transport\n"
+            "try:\n"
+            "    shimmer_listener.bt_init(shimmer_listener.BtMode.SLAVE)\n"
+            "except ImportError as err:\n"
+            "    assert 'pybluez' in str(err)\n"
+            "else:\n"
+            "    raise AssertionError('bt_init succeeded without pybluez')\n"
+        )
+        subprocess.run([sys.executable, "-c", script], check=True,
+                       cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))